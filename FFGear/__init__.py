@@ -3,6 +3,7 @@ from . import preferences
 from . import properties
 from . import stm_utils
 from . import mtrl_handler
+from . import mtrl_index
 from . import operators
 from . import ui
 from . import auto_updating
@@ -18,6 +19,8 @@ def register():
 
     properties.register()
     stm_utils.register()
+    mtrl_handler.register()
+    mtrl_index.register()
     operators.register()
     auto_updating.register()
     ui.register()
@@ -28,6 +31,8 @@ def unregister():
     ui.unregister()
     auto_updating.unregister()
     operators.unregister()
+    mtrl_index.unregister()
+    mtrl_handler.unregister()
     stm_utils.unregister()
     properties.unregister()
     preferences.unregister()
@@ -1,6 +1,4 @@
 import string
-import requests
-import addon_utils
 import os
 import logging
 from typing import Tuple
@@ -104,6 +102,7 @@ def _get_latest_addon_version() -> dict:
     Returns:
         json-formatted data from the repo request url
     """
+    import requests # Imported here so the rest of this module works outside Blender (benchmarks etc.)
     response = requests.get(repo_release_url)
     if response.status_code != 200:
         raise Exception(f"Failed to get latest version: {response.status_code}")
@@ -130,6 +129,7 @@ def get_addon_version_and_latest() -> Tuple[str, str]:
     except Exception as e:
         logger.warning(f"Failed to get latest version: {e}")
     try:     
+        import addon_utils
         version_set = False 
         for module in addon_utils.modules():
             if module.bl_info.get("name") == "FFGear":
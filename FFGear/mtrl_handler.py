@@ -1,10 +1,21 @@
+import os
+import mmap
+import time
 import struct
 import math
+import json
+import hashlib
+import zipfile
+import zlib
+import threading
 import logging
+import numpy as np
 from . import helpers
-from io import BytesIO
 from enum import Flag, Enum
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+from typing import List, Optional, Dict, Any, Tuple, Iterable
 
 # Level is a threshold, errors have to be WARNING or higher to be pushed through. I think it goes DEBUG < INFO < WARNING < ERROR < CRITICAL
 logging.basicConfig()
@@ -68,6 +79,11 @@ DYE_FLAGS = {
     'dye_sphere_map_opacity': (1, 3)
 }
 
+# The same flags as bits of a single little-endian short (byte 1 is the low byte), which is how the dye flags are stored after parsing
+DYE_FLAG_BITS = {flag_name: 1 << (byte_idx * 8 + bit_idx) for flag_name, (byte_idx, bit_idx) in DYE_FLAGS.items()}
+# Bytes 3 & 4 as a little-endian short are the template ID, except for bits 11-12 which are the dye channel
+DYE_TEMPLATE_MASK = 0b1110011111111111
+
 
 class ColorsetType(Enum):
     """How big is each possible version of colorset data"""
@@ -75,13 +91,21 @@ class ColorsetType(Enum):
     DAWNTRAIL = 2048 # bytes (32 rows)
 
 
-def extract_dye_flags(byte1: int, byte2: int) -> Dict[str, bool]:
-    """Extracts boolean dye flags from two bytes of data into a dictionary for easier lookup."""
-    flags = {}
-    bytes_array = [byte1, byte2]
-    for flag_name, (byte_idx, bit_idx) in DYE_FLAGS.items():
-        flags[flag_name] = bool(bytes_array[byte_idx] & (1 << bit_idx))
-    return flags
+# Precompiled binary layouts, so reading a file doesn't re-parse format strings for every field
+MTRL_SIGNATURE = 16973824
+MTRL_HEADER_STRUCT = struct.Struct('<IHHHHBBBB') # signature, file_size, color_set_data_size, string_block_size, shader_name_offset, texture_count, map_count, colorset_count, additional_data_size
+TEXTURE_INFO_STRUCT = struct.Struct('<HH')       # string offset, flags
+MATERIAL_FLAGS_STRUCT = struct.Struct('<I')
+COLORSET_ROW_HALVES = 32                          # Every row is 32 half-floats...
+COLORSET_ROW_BYTES = COLORSET_ROW_HALVES * 2      # ...which is 64 bytes
+
+# Bump this whenever the parsed output changes, it throws away everything in the disk cache
+MTRL_PARSER_VERSION = 1
+
+
+def extract_dye_flags(flags: int) -> Dict[str, bool]:
+    """Expands a dye flag bitmask into a dictionary of booleans, mostly useful for debugging."""
+    return {flag_name: bool(flags & bit) for flag_name, bit in DYE_FLAG_BITS.items()}
 
 
 # Math yoinked from Penumbra. Handles the tile material transformation values. I hate this.
@@ -89,66 +113,505 @@ def decompose_tile_matrix(uu: float, uv: float, vu: float, vv: float) -> Dict[st
     """
     Decomposes a 2x2 tile transformation matrix into scale, rotation, and shear.
     Assumes matrix elements uu, uv, vu, vv correspond to [a, b], [c, d].
+    Single matrix version of decompose_tile_matrices().
 
     Returns:
         Dict[str, float]: Contains 'scale_x', 'scale_y', 'rotation_deg', 'shear_deg'.
     """
-    a, b, c, d = uu, uv, vu, vv # Standard matrix notation
+    decomposed = decompose_tile_matrices(np.array([[uu, uv, vu, vv]], dtype=np.float64))
+    return {key: float(values[0]) for key, values in decomposed.items()}
+
+
+IDENTITY_TILE_MATRIX = np.array([1.0, 0.0, 0.0, 1.0])
+
+def decompose_tile_matrices(matrices: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Decomposes many 2x2 tile transformation matrices into scale, rotation, and shear at once.
+    Every row is [uu, uv, vu, vv], corresponding to [a, b], [c, d].
+
+    If every matrix is the identity the result is returned straight away.
+
+    Args:
+        matrices (np.ndarray): Array of shape (N, 4).
+
+    Returns:
+        Dict[str, np.ndarray]: Contains 'scale_x', 'scale_y', 'rotation_deg', 'shear_deg', each a float64 array of length N.
+    """
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4)
+    count = len(matrices)
+
+    # Untouched tiling is very common, and it decomposes to exactly this
+    if (matrices == IDENTITY_TILE_MATRIX).all():
+        return {'scale_x': np.ones(count), 'scale_y': np.ones(count), 'rotation_deg': np.zeros(count), 'shear_deg': np.zeros(count)}
+
+    a, b, c, d = matrices.T # Standard matrix notation
 
     # Prevent precision errors, if it's *close* to zero it's probably zero
-    if abs(a) < 1e-9 and abs(c) < 1e-9:
-        logger.warning("Matrix decomposition ran into a near-zero first column. Results could be inaccurate.")
-        rotation_rad = 0.0
-    else:
-        rotation_rad = math.atan2(c, a)
+    near_zero_column = (np.abs(a) < 1e-9) & (np.abs(c) < 1e-9)
+    rotation_rad = np.where(near_zero_column, 0.0, np.arctan2(c, a))
 
-    cos_rot = math.cos(rotation_rad)
-    sin_rot = math.sin(rotation_rad)
+    cos_rot = np.cos(rotation_rad)
+    sin_rot = np.sin(rotation_rad)
 
     # Apply inverse rotation: M' = R^T * M
     m_prime_00 = cos_rot * a + sin_rot * c
     m_prime_01 = cos_rot * b + sin_rot * d
     m_prime_11 = -sin_rot * b + cos_rot * d
 
-    # Extract Scale
-    scale_x = m_prime_00
-    scale_y = m_prime_11
+    # Extract Shear, only where scale_y is big enough to divide by
+    has_shear = np.abs(m_prime_01) > 1e-6
+    valid_shear = has_shear & (np.abs(m_prime_11) > 1e-6)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shear_rad = np.where(valid_shear, np.arctan(m_prime_01 / m_prime_11), 0.0)
+    skipped_shear = has_shear & ~valid_shear
 
-    # Extract Shear
-    shear_rad = 0.0
-    if abs(scale_y) > 1e-6 and abs(m_prime_01) > 1e-6:
-        try:
-            tan_shear = m_prime_01 / scale_y
-            shear_rad = math.atan(tan_shear)
-        except ValueError:
-             logger.warning(f"ValueError during shear calculation (atan). Inputs: m_prime_01={m_prime_01}, scale_y={scale_y}")
-             shear_rad = 0.0
-    elif abs(m_prime_01) > 1e-6:
-         logger.warning(f"Near-zero scale_y ({scale_y:.4f}) with non-zero shear component ({m_prime_01:.4f}). Shear calculation skipped.")
+    result = {
+        'scale_x': m_prime_00,
+        'scale_y': m_prime_11,
+        'rotation_deg': np.degrees(rotation_rad),
+        'shear_deg': -np.degrees(shear_rad) # Invert it to stay in line with Penumbra, less confusing
+    }
 
-    # Convert angles to degrees
-    rotation_deg = math.degrees(rotation_rad)
-    shear_deg = math.degrees(shear_rad)
+    # Same warnings as always, just summed up instead of one per matrix
+    if near_zero_column.any():
+        logger.warning(f"Matrix decomposition ran into a near-zero first column in {np.count_nonzero(near_zero_column)} matrices. Results could be inaccurate.")
+    if skipped_shear.any():
+        logger.warning(f"Near-zero scale_y with non-zero shear component in {np.count_nonzero(skipped_shear)} matrices. Shear calculation skipped for those.")
 
-    # Invert it to stay in line with Penumbra, less confusing
-    shear_deg = -shear_deg
+    return result
 
-    return {
-        'scale_x': scale_x,
-        'scale_y': scale_y,
-        'rotation_deg': rotation_deg,
-        'shear_deg': shear_deg
-    }
 
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# COLORSET TABLE
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# The 32 half-floats of a colorset row, in the order they're stored in the file
+COLORSET_FIELDS = (
+    'diffuse_r', 'diffuse_g', 'diffuse_b', 'diffuse_unknown',                       # 0-3, diffuse_unknown is Gloss Strength (Legacy)
+    'specular_r', 'specular_g', 'specular_b', 'specular_unknown',                   # 4-7, specular_unknown is Specular Strength/Power (Legacy)
+    'emissive_r', 'emissive_g', 'emissive_b', 'emissive_unknown',                   # 8-11
+    'sheen_rate', 'sheen_tint_rate', 'sheen_aperture', 'sheen_unknown',             # 12-15, sheen_aperture could also be Sheen Aptitude but whatever
+    'roughness', 'pbr_unknown', 'metalness', 'anisotropy_blending',                 # 16-19
+    'effect_unknown_r', 'sphere_map_opacity', 'effect_unknown_b', 'effect_unknown_a',   # 20-23, WEIRD SHIT
+    'shader_template_id', 'tile_map_id_raw', 'tile_map_opacity', 'sphere_map_id',   # 24-27, IDs AND STUFF
+    'tile_matrix_uu', 'tile_matrix_uv', 'tile_matrix_vu', 'tile_matrix_vv',         # 28-31, RAW TILE TRANSFORM DATA
+)
+# Values calculated from the ones above, stored as extra columns after them
+COLORSET_DERIVED_FIELDS = ('tile_map_id', 'tile_scale_x', 'tile_scale_y', 'tile_rotation_deg', 'tile_shear_deg')
+# Column index of every field in ColorsetTable.values
+COLORSET_COLUMNS = {name: index for index, name in enumerate(COLORSET_FIELDS + COLORSET_DERIVED_FIELDS)}
+
+# How the keys of the old per-row dicts map to table columns. A tuple of columns is returned as a list.
+COLORSET_ROW_KEYS = {
+    'diffuse': ('diffuse_r', 'diffuse_g', 'diffuse_b'),
+    'diffuse_unknown': 'diffuse_unknown',
+    'specular': ('specular_r', 'specular_g', 'specular_b'),
+    'specular_unknown': 'specular_unknown',
+    'emissive': ('emissive_r', 'emissive_g', 'emissive_b'),
+    'emissive_unknown': 'emissive_unknown',
+    'sheen_rate': 'sheen_rate',
+    'sheen_tint_rate': 'sheen_tint_rate',
+    'sheen_aperture': 'sheen_aperture',
+    'sheen_unknown': 'sheen_unknown',
+    'roughness': 'roughness',
+    'pbr_unknown': 'pbr_unknown',
+    'metalness': 'metalness',
+    'anisotropy_blending': 'anisotropy_blending',
+    'effect_unknown_r': 'effect_unknown_r',
+    'sphere_map_opacity': 'sphere_map_opacity',
+    'effect_unknown_b': 'effect_unknown_b',
+    'effect_unknown_a': 'effect_unknown_a',
+    'shader_template_id': 'shader_template_id',
+    'tile_map_id': 'tile_map_id',
+    'tile_map_opacity': 'tile_map_opacity',
+    'sphere_map_id': 'sphere_map_id',
+    'tile_scale_x': 'tile_scale_x',
+    'tile_scale_y': 'tile_scale_y',
+    'tile_rotation_deg': 'tile_rotation_deg',
+    'tile_shear_deg': 'tile_shear_deg',
+}
+# Row keys that aren't single/multiple columns, handled separately in ColorsetRow
+_COLORSET_SPECIAL_ROW_KEYS = ('row_number', 'group', 'tile_matrix_raw')
+
+
+def _update_tile_transforms(values: np.ndarray) -> None:
+    """Fills the tile scale/rotation/shear columns of a colorset values array from its raw tile matrix columns"""
+    tile_transforms = decompose_tile_matrices(values[:, COLORSET_COLUMNS['tile_matrix_uu']:COLORSET_COLUMNS['tile_matrix_vv'] + 1])
+    for key, column in tile_transforms.items():
+        values[:, COLORSET_COLUMNS['tile_' + key]] = column
+
+
+class ColorsetTable:
+    """
+    Array-backed colorset data. One float32 row per colorset row, one column per field (see COLORSET_COLUMNS),
+    plus the raw dye bytes of every row. NaN means a value is unknown, which happens with data constructed from Meddle.
+
+    Indexing or iterating gives ColorsetRow views that behave like the dicts read_mtrl_file used to return.
+
+    A table made with from_raw_halves() only holds the raw half-float bytes until the values are first needed,
+    so parsing a file just to look at its shader and textures (peek_mtrl) doesn't pay for decoding the colorset.
+    """
+    __slots__ = ('_values', 'dye_bytes', 'has_dye', 'dye_flags', 'dye_channels', 'dye_templates', '_raw_halves', '_row_count')
+
+    def __init__(self, values: Optional[np.ndarray], dye_bytes: Optional[np.ndarray] = None, has_dye: Optional[np.ndarray] = None, row_count: Optional[int] = None):
+        """
+        Args:
+            values (np.ndarray): float32 array of shape (rows, len(COLORSET_COLUMNS)). Can be None if row_count is given and the values are set later.
+            dye_bytes (np.ndarray, optional): uint8 array of shape (rows, 4), the dye info of every row. None if there is none.
+            has_dye (np.ndarray, optional): bool array of shape (rows,), which rows actually got dye info. Defaults to all of them if dye_bytes is given.
+            row_count (int, optional): Number of rows, only needed if values is None.
+        """
+        self._values = values
+        self._raw_halves = None
+        self._row_count = row_count if row_count is not None else len(values)
+        self._set_dye(dye_bytes, has_dye)
+
+    def _set_dye(self, dye_bytes: Optional[np.ndarray], has_dye: Optional[np.ndarray]) -> None:
+        """Stores the raw dye bytes and decodes all of them at once into flag bitmasks, channels and template IDs"""
+        self.dye_bytes = dye_bytes
+        if dye_bytes is None:
+            self.has_dye = None
+            self.dye_flags = self.dye_channels = self.dye_templates = None
+            return
+        self.has_dye = has_dye if has_dye is not None else np.ones(self._row_count, dtype=bool)
+        # Every row is two little-endian shorts: the flag bits (bytes 1-2), then the template ID with the channel mixed into it (bytes 3-4)
+        dye_words = np.ascontiguousarray(dye_bytes, dtype=np.uint8).view('<u2').reshape(self._row_count, 2)
+        self.dye_flags = dye_words[:, 0].astype(np.uint16) # See DYE_FLAG_BITS
+        self.dye_channels = ((dye_words[:, 1] >> 11) & 0b11).astype(np.uint8) + 1
+        self.dye_templates = (dye_words[:, 1] & DYE_TEMPLATE_MASK).astype(np.uint16)
+
+    @classmethod
+    def empty(cls, row_count: int) -> 'ColorsetTable':
+        """A table where every value is unknown (NaN)"""
+        return cls(np.full((row_count, len(COLORSET_COLUMNS)), np.nan, dtype=np.float32))
+
+    @classmethod
+    def from_halves(cls, halves: np.ndarray, dye_bytes: Optional[np.ndarray] = None, has_dye: Optional[np.ndarray] = None) -> 'ColorsetTable':
+        """
+        Builds a table from the raw (rows, 32) half-float block of a MTRL file, calculating the derived columns.
+        """
+        return cls(cls._decode_halves(halves), dye_bytes, has_dye)
+
+    @classmethod
+    def from_raw_halves(cls, raw_halves: bytes, row_count: int, dye_bytes: Optional[np.ndarray] = None, has_dye: Optional[np.ndarray] = None) -> 'ColorsetTable':
+        """
+        Like from_halves(), but takes the raw little-endian bytes of the colorset rows and doesn't decode them until the values are used.
+        """
+        table = cls(None, dye_bytes, has_dye, row_count)
+        table._raw_halves = raw_halves
+        return table
+
+    @staticmethod
+    def _decode_halves(halves: np.ndarray) -> np.ndarray:
+        values = np.full((len(halves), len(COLORSET_COLUMNS)), np.nan, dtype=np.float32)
+        values[:, :COLORSET_ROW_HALVES] = halves
+        values[:, COLORSET_COLUMNS['tile_map_id']] = np.trunc(values[:, COLORSET_COLUMNS['tile_map_id_raw']] * 64) # Turn it from a 0-1 value into a valid tile ID
+        _update_tile_transforms(values)
+        return values
+
+    @property
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            halves = np.frombuffer(self._raw_halves, dtype='<f2').reshape(self._row_count, COLORSET_ROW_HALVES)
+            self._values = self._decode_halves(halves)
+            self._raw_halves = None
+        return self._values
+
+    @property
+    def is_decoded(self) -> bool:
+        """False if the colorset is still waiting to be decoded from its raw bytes"""
+        return self._values is not None
+
+    def update_tile_transforms(self) -> None:
+        """(Re)calculates the tile scale/rotation/shear columns from the raw tile matrix columns"""
+        _update_tile_transforms(self.values)
+
+    def column(self, name: str) -> np.ndarray:
+        """Gets a single column of the table (a view, not a copy) by field name"""
+        return self.values[:, COLORSET_COLUMNS[name]]
+
+    def overlay(self, other: 'ColorsetTable') -> 'ColorsetTable':
+        """
+        Returns a new table where every known (non-NaN) value in other replaces the value in this one.
+        The result has no dye info, since it can't be trusted to match the new values.
+        """
+        if len(other) != len(self):
+            raise ValueError(f"Can't overlay colorset tables with different row counts ({len(self)} vs {len(other)})")
+        return ColorsetTable(np.where(np.isnan(other.values), self.values, other.values))
+
+    def row(self, index: int) -> 'ColorsetRow':
+        return ColorsetRow(self, index)
+
+    @property
+    def row_count(self) -> int:
+        return self._row_count
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the table's arrays"""
+        total = self._values.nbytes if self._values is not None else len(self._raw_halves)
+        if self.dye_bytes is not None:
+            total += self.dye_bytes.nbytes + self.has_dye.nbytes
+        return total
+
+    def __len__(self):
+        return self._row_count
+
+    def __getitem__(self, index: int) -> 'ColorsetRow':
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Colorset row index {index} out of range")
+        return ColorsetRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ColorsetRow(self, index)
+
+    def __repr__(self):
+        return f"ColorsetTable(rows={len(self)}, dye={'yes' if self.dye_bytes is not None else 'no'})"
+
+
+class ColorsetRow(Mapping):
+    """
+    Read-only dict-like view of one row of a ColorsetTable, with the same keys the old per-row dicts had.
+    Unknown (NaN) values read as None.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: ColorsetTable, index: int):
+        self._table = table
+        self._index = index
+
+    def _value(self, column_name: str) -> Optional[float]:
+        value = float(self._table.values[self._index, COLORSET_COLUMNS[column_name]])
+        return None if math.isnan(value) else value
+
+    def _has_dye(self) -> bool:
+        return self._table.dye_bytes is not None and bool(self._table.has_dye[self._index])
+
+    def __getitem__(self, key: str) -> Any:
+        index = self._index
+        if key == 'row_number':
+            return index + 1
+        if key == 'group':
+            return 'A' if index % 2 == 0 else 'B'
+        if key == 'tile_matrix_raw':
+            return {'uu': self._value('tile_matrix_uu'), 'uv': self._value('tile_matrix_uv'), 'vu': self._value('tile_matrix_vu'), 'vv': self._value('tile_matrix_vv')}
+        if key == 'dye':
+            if not self._has_dye():
+                raise KeyError(key)
+            table = self._table
+            return {
+                'channel': int(table.dye_channels[index]),
+                'template': int(table.dye_templates[index]),
+                'flags': int(table.dye_flags[index]), # Bitmask, check it against DYE_FLAG_BITS (or use extract_dye_flags to get a dict)
+                'raw_bytes': {'hex': table.dye_bytes[index].tobytes().hex(' ')} # Simplified raw bytes that I don't really know what they're for
+            }
+        columns = COLORSET_ROW_KEYS[key] # Raises KeyError for unknown keys, like a dict would
+        if isinstance(columns, tuple):
+            return [self._value(column) for column in columns]
+        value = self._value(columns)
+        if key == 'tile_map_id' and value is not None:
+            return int(value)
+        return value
+
+    def __iter__(self):
+        yield from _COLORSET_SPECIAL_ROW_KEYS[:2]
+        yield from COLORSET_ROW_KEYS
+        yield _COLORSET_SPECIAL_ROW_KEYS[2]
+        if self._has_dye():
+            yield 'dye'
+
+    def __len__(self):
+        return len(COLORSET_ROW_KEYS) + len(_COLORSET_SPECIAL_ROW_KEYS) + (1 if self._has_dye() else 0)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def _read_c_string(buffer, start: int) -> str:
+    """
+    Reads a null terminated string starting at an absolute offset in the buffer.
+    Runs to the end of the buffer if there is no terminator, like the old byte-by-byte reading did.
+    """
+    if isinstance(buffer, memoryview): # No find() or decode() on these
+        if start >= len(buffer):
+            return ''
+        terminators = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8, offset=start) == 0)
+        end = start + int(terminators[0]) if len(terminators) else len(buffer)
+        return bytes(buffer[start:end]).decode('utf-8', errors='replace')
+    end = buffer.find(b'\0', start)
+    if end == -1:
+        end = len(buffer)
+    return buffer[start:end].decode('utf-8', errors='replace')
+
+
+def _parse_mtrl_buffer(buffer, filepath: str, lazy_colorset: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Parses mtrl data straight out of a buffer, using absolute offsets and struct.unpack_from so nothing gets copied on the way.
+    Only the strings and the decoded colorset table end up as new objects, so the buffer can be closed once this returns.
+
+    Args:
+        buffer: bytes, bytearray, mmap or a flat byte memoryview containing the whole file.
+        filepath (str): Only used for log messages.
+        lazy_colorset (bool): Keep the raw colorset bytes and only decode them when the colorset values are first used.
+
+    Returns:
+        mtrl_data (dict): A dictionary containing the parsed data, or None if an error occurs.
+    """
+    try:
+        buffer_size = len(buffer)
+
+        # HEADER
+        # Signature (uint), then ushorts and bytes, all read in one go
+        if buffer_size < MTRL_HEADER_STRUCT.size:
+            raise EOFError("File is too small to contain a MTRL header.")
+        (signature, file_size, color_set_data_size, string_block_size, shader_name_offset,
+         texture_count, map_count, colorset_count, additional_data_size) = MTRL_HEADER_STRUCT.unpack_from(buffer, 0)
+        if signature != MTRL_SIGNATURE:
+            logger.error(f"Invalid MTRL signature: expected {MTRL_SIGNATURE}, got {signature}")
+            return None
+
+
+        # TEXTURE INFO
+        texture_info_start = MTRL_HEADER_STRUCT.size
+        texture_info_end = texture_info_start + TEXTURE_INFO_STRUCT.size * texture_count
+        if texture_info_end > buffer_size:
+            raise EOFError("Unexpected EOF reading texture info.")
+        texture_info = [TEXTURE_INFO_STRUCT.unpack_from(buffer, texture_info_start + i * TEXTURE_INFO_STRUCT.size) for i in range(texture_count)]
+
+        # Skip map and colorset info block (4 bytes per entry)
+        string_block_start = texture_info_end + (map_count + colorset_count) * 4
+
+        # Strings with Texture Paths and the Shader Name
+        textures = []
+        for i, (texture_offset, texture_flags) in enumerate(texture_info):
+            abs_seek_pos = string_block_start + texture_offset
+            if abs_seek_pos >= buffer_size:
+                 logger.warning(f"Texture {i} offset {texture_offset} points outside file bounds ({abs_seek_pos}). Skipping.")
+                 continue
+
+            textures.append({
+                'path': _read_c_string(buffer, abs_seek_pos),
+                'flags': texture_flags
+            })
 
-def read_mtrl_file(filepath: str) -> Optional[Dict[str, Any]]:
+        shader_name = _read_c_string(buffer, string_block_start + shader_name_offset)
+
+
+        # COLORSET DATA
+        color_data_start = string_block_start + string_block_size + additional_data_size
+        colorset_data = ColorsetTable.empty(0)
+        colorset_type = None
+        row_count = 0
+
+        if color_set_data_size > 0:
+            # Determine format based on size
+            if color_set_data_size >= 2048:
+                colorset_type = ColorsetType.DAWNTRAIL; row_count = 32
+            elif color_set_data_size >= 512:
+                colorset_type = ColorsetType.ENDWALKER; row_count = 16
+            else:
+                logger.warning(f"Unexpected color_set_data_size: {color_set_data_size}. Cannot determine colorset type.")
+                return None
+
+            # View the whole block of half-floats directly in the buffer. from_halves() makes its own arrays from it.
+            colorset_byte_count = row_count * COLORSET_ROW_BYTES
+            if color_data_start + colorset_byte_count > buffer_size:
+                raise EOFError(f"Unexpected EOF reading colorset rows. Expected {colorset_byte_count} bytes, got {max(buffer_size - color_data_start, 0)}.")
+            colorset_halves = np.frombuffer(buffer, dtype='<f2', count=row_count * COLORSET_ROW_HALVES, offset=color_data_start).reshape(row_count, COLORSET_ROW_HALVES)
+
+            # DYE DATA (If it exists)
+            dye_bytes = None
+            has_dye = None
+            dye_data_start = color_data_start + colorset_byte_count
+            remaining_data_after_rows = color_set_data_size - colorset_byte_count
+            expected_dye_bytes = row_count * 4
+
+            if remaining_data_after_rows >= expected_dye_bytes:
+                num_dye_rows = min(expected_dye_bytes, max(buffer_size - dye_data_start, 0)) // 4
+                if num_dye_rows < row_count:
+                    logger.warning(f"Incomplete dye data, only found it for {num_dye_rows} of {row_count} rows.")
+                # 4 bytes per row. Rows the data didn't reach are marked as having no dye.
+                dye_bytes = np.zeros((row_count, 4), dtype=np.uint8)
+                dye_bytes[:num_dye_rows] = np.frombuffer(buffer, dtype=np.uint8, count=num_dye_rows * 4, offset=dye_data_start).reshape(num_dye_rows, 4)
+                has_dye = np.arange(row_count) < num_dye_rows
+            elif remaining_data_after_rows > 0:
+                logger.warning(f"Remaining data size ({remaining_data_after_rows}) after colorset rows doesn't match expected dye size ({expected_dye_bytes}). Skipping dye read.")
+
+            if lazy_colorset:
+                colorset_data = ColorsetTable.from_raw_halves(bytes(buffer[color_data_start:dye_data_start]), row_count, dye_bytes, has_dye) # Has to be a copy, the buffer might get closed
+            else:
+                colorset_data = ColorsetTable.from_halves(colorset_halves, dye_bytes, has_dye)
+            del colorset_halves # Let go of the view so an mmap behind it can be closed
+
+        # MATERIAL FLAGS
+        # Relative to start of colorset block + declared size, skipping 6 bytes (shader constants?)
+        flags_read_offset = color_data_start + color_set_data_size + 6
+        material_flags_value = MATERIAL_FLAGS_STRUCT.unpack_from(buffer, flags_read_offset)[0]
+        material_flags = MaterialFlags(material_flags_value)
+
+        # Return dict
+        return {
+            'colorset_data': colorset_data,
+            'material_flags': material_flags,
+            'shader_name': shader_name,
+            'textures': textures,
+            'colorset_type': colorset_type
+        }
+
+    except EOFError as e:
+        logger.error(f"Error reading MTRL file {filepath}: Reached end of file unexpectedly. {e}")
+        return None
+    except struct.error as e:
+        logger.error(f"Error reading MTRL file {filepath}: Struct unpack error. {e}")
+        return None
+    except ValueError as e:
+         logger.error(f"Error reading MTRL file {filepath}: Value error (likely invalid data). {e}")
+         return None
+    except Exception as e:
+        logger.exception(f"Unexpected error reading MTRL file {filepath}: {e}")
+        return None
+
+
+def parse_mtrl(buffer, name: str = "<buffer>", lazy_colorset: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Parses a mtrl file that's already in memory, for when it didn't come from a plain file on disk (zip archives, downloads, etc.).
+    Nothing from the buffer is kept after this returns, so it can be freed, closed or reused right after.
+
+    Args:
+        buffer: The whole file, as bytes, bytearray, memoryview, mmap or anything else supporting the buffer protocol.
+        name (str): What to call the file in log messages.
+        lazy_colorset (bool): Don't decode the colorset until it's actually used. See peek_mtrl().
+
+    Returns:
+        mtrl_data (dict): Same as read_mtrl_file(), or None if an error occurs.
+    """
+    if not isinstance(buffer, (bytes, bytearray, mmap.mmap)):
+        try:
+            buffer = memoryview(buffer)
+            if buffer.ndim != 1 or buffer.itemsize != 1:
+                buffer = buffer.cast('B')
+        except (TypeError, ValueError) as e:
+            logger.error(f"Can't read MTRL data {name} from a {type(buffer).__name__}: {e}")
+            return None
+    return _parse_mtrl_buffer(buffer, name, lazy_colorset)
+
+
+def read_mtrl_file(filepath: str, use_mmap: bool = True, lazy_colorset: bool = False) -> Optional[Dict[str, Any]]:
     """
     Reads a mtrl file, extracts material properties, textures,
     and colorset data (now with proper tile transformations).
     Assumes little-endian byte order.
 
+    By default the file is memory-mapped and parsed in place, so only the pages that actually get touched are read
+    (which matters a lot when the Meddle cache is on a network drive). If mapping fails it falls back to a normal read.
+
     Args:
         filepath (str): Path to the .mtrl file.
+        use_mmap (bool): Memory-map the file instead of reading all of it into memory first.
+        lazy_colorset (bool): Don't decode the colorset until it's actually used. See peek_mtrl().
 
     Returns:
         mtrl_data (dict): A dictionary containing the parsed data, or None if an error occurs.
@@ -156,6 +619,13 @@ def read_mtrl_file(filepath: str) -> Optional[Dict[str, Any]]:
     try:
         filepath = helpers.safe_filepath(filepath)
         with open(filepath, 'rb') as f:
+            if use_mmap:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                        return parse_mtrl(mapped_file, filepath, lazy_colorset)
+                except (ValueError, OSError) as e: # Empty files can't be mapped, and some file systems don't support it
+                    logger.debug(f"Could not memory-map {filepath}, reading it normally instead: {e}")
+                    f.seek(0)
             data = f.read()
     except FileNotFoundError:
         logger.error(f"MTRL file not found at: {filepath}")
@@ -164,239 +634,597 @@ def read_mtrl_file(filepath: str) -> Optional[Dict[str, Any]]:
         logger.error(f"IOError reading MTRL file {filepath}: {e}")
         return None
 
-    with BytesIO(data) as br:
-        try:
-            # HEADER
-            # Signature (4 bytes, uint)
-            signature = struct.unpack('<I', br.read(4))[0]
-            if signature != 16973824:
-                logger.error(f"Invalid MTRL signature: expected 16973824, got {signature}")
-                return None
+    return parse_mtrl(data, filepath, lazy_colorset)
 
-            # Header fields (ushorts and bytes)
-            file_size = struct.unpack('<H', br.read(2))[0]
-            color_set_data_size = struct.unpack('<H', br.read(2))[0]
-            string_block_size = struct.unpack('<H', br.read(2))[0]
-            shader_name_offset = struct.unpack('<H', br.read(2))[0]
-            texture_count = struct.unpack('<B', br.read(1))[0]
-            map_count = struct.unpack('<B', br.read(1))[0]
-            colorset_count = struct.unpack('<B', br.read(1))[0]
-            additional_data_size = struct.unpack('<B', br.read(1))[0]
-
-
-            # TEXTURE INFO
-            texture_offsets = []
-            texture_flags_from_header = []
-
-            for _ in range(texture_count):
-                offset = struct.unpack('<H', br.read(2))[0]
-                flags = struct.unpack('<H', br.read(2))[0]
-                texture_offsets.append(offset)
-                texture_flags_from_header.append(flags)
-
-            # Skip map and colorset info block (4 bytes per entry)
-            br.seek((map_count + colorset_count) * 4, 1)
-            string_block_start = br.tell()
-
-            # Strings with Texture Paths and the Shader Name
-            textures = []
-            for i in range(texture_count):
-                abs_seek_pos = string_block_start + texture_offsets[i]
-                if abs_seek_pos >= br.getbuffer().nbytes:
-                     logger.warning(f"Texture {i} offset {texture_offsets[i]} points outside file bounds ({abs_seek_pos}). Skipping.")
-                     continue
-
-                br.seek(abs_seek_pos)
-                path_bytes = []
-                while (char := br.read(1)) != b'\0' and char:
-                    path_bytes.append(char)
-
-                textures.append({
-                    'path': b''.join(path_bytes).decode('utf-8', errors='replace'),
-                    'flags': texture_flags_from_header[i]
-                })
-
-            br.seek(string_block_start + shader_name_offset)
-            shader_bytes = []
-            while (char := br.read(1)) != b'\0' and char:
-                shader_bytes.append(char)
-            shader_name = b''.join(shader_bytes).decode('utf-8', errors='replace')
-
-
-            # COLORSET DATA
-            br.seek(string_block_start + string_block_size + additional_data_size)
-            color_data_start = br.tell()
-            colorset_data:List[Dict[str,Any]] = []
-            colorset_type = None
-            row_count = 0
-
-            if color_set_data_size > 0:
-                # Determine format based on size
-                if color_set_data_size >= 2048:
-                    colorset_type = ColorsetType.DAWNTRAIL; row_count = 32
-                elif color_set_data_size >= 512:
-                    colorset_type = ColorsetType.ENDWALKER; row_count = 16
-                else:
-                    logger.warning(f"Unexpected color_set_data_size: {color_set_data_size}. Cannot determine colorset type.")
-                    return None
-
-                def read_le_half_float(field_name_debug=""):
-                    """Reads 2 bytes, unpacks as little-endian half-float."""
-                    raw_bytes = br.read(2)
-                    if len(raw_bytes) < 2:
-                        raise EOFError(f"Unexpected EOF reading half-float for {field_name_debug}.")
-                    value = struct.unpack('<e', raw_bytes)[0]
-                    return value
-
-                # Read colorset rows
-                for i in range(row_count):
-                    # DIFFUSE
-                    diffuse_r = read_le_half_float()            # 0
-                    diffuse_g = read_le_half_float()            # 1
-                    diffuse_b = read_le_half_float()            # 2
-                    diffuse_unknown = read_le_half_float()      # 3, Gloss Strength (Legacy)
-
-                    # SPECULAR
-                    specular_r = read_le_half_float()           # 4
-                    specular_g = read_le_half_float()           # 5
-                    specular_b = read_le_half_float()           # 6
-                    specular_unknown = read_le_half_float()     # 7, Specular Strength/Power (Legacy)
-
-                    # EMISSIVE
-                    emissive_r = read_le_half_float()           # 8
-                    emissive_g = read_le_half_float()           # 9
-                    emissive_b = read_le_half_float()           # 10
-                    emissive_unknown = read_le_half_float()     # 11
-
-                    # SHEEN
-                    sheen_rate = read_le_half_float()           # 12
-                    sheen_tint_rate = read_le_half_float()      # 13
-                    sheen_aperture = read_le_half_float()       # 14, Could also be Sheen Aptitude but whatever
-                    sheen_unknown = read_le_half_float()        # 15
-
-                    # PBR
-                    roughness = read_le_half_float()            # 16
-                    pbr_unknown = read_le_half_float()          # 17
-                    metalness = read_le_half_float()            # 18
-                    anisotropy_blending = read_le_half_float()  # 19
-
-                    # WEIRD SHIT
-                    effect_unknown_r = read_le_half_float()     # 20
-                    sphere_map_opacity = read_le_half_float()   # 21
-                    effect_unknown_b = read_le_half_float()     # 22
-                    effect_unknown_a = read_le_half_float()     # 23
-
-                    # IDs AND STUFF
-                    shader_template_id = read_le_half_float()   # 24
-                    tile_map_id_raw = read_le_half_float()      # 25
-                    tile_map_opacity = read_le_half_float()     # 26
-                    sphere_map_id = read_le_half_float()        # 27
-
-                    # RAW TILE TRANSFORM DATA
-                    tile_matrix_uu = read_le_half_float()       # 28
-                    tile_matrix_uv = read_le_half_float()       # 29
-                    tile_matrix_vu = read_le_half_float()       # 30
-                    tile_matrix_vv = read_le_half_float()       # 31
-
-                    # Decompose the tile matrix
-                    tile_transform = decompose_tile_matrix(
-                        tile_matrix_uu, tile_matrix_uv, tile_matrix_vu, tile_matrix_vv
-                    )
-
-                    row_data = {
-                        'row_number': i + 1,
-                        'group': 'A' if i % 2 == 0 else 'B',
-                        'diffuse': [diffuse_r, diffuse_g, diffuse_b],
-                        'diffuse_unknown': diffuse_unknown,
-                        'specular': [specular_r, specular_g, specular_b],
-                        'specular_unknown': specular_unknown,
-                        'emissive': [emissive_r, emissive_g, emissive_b],
-                        'emissive_unknown': emissive_unknown,
-                        'sheen_rate': sheen_rate,
-                        'sheen_tint_rate': sheen_tint_rate,
-                        'sheen_aperture': sheen_aperture,
-                        'sheen_unknown': sheen_unknown,
-                        'roughness': roughness,
-                        'pbr_unknown': pbr_unknown,
-                        'metalness': metalness,
-                        'anisotropy_blending': anisotropy_blending,
-                        'effect_unknown_r': effect_unknown_r,
-                        'sphere_map_opacity': sphere_map_opacity,
-                        'effect_unknown_b': effect_unknown_b,
-                        'effect_unknown_a': effect_unknown_a,
-                        'shader_template_id': shader_template_id,
-                        'tile_map_id': int(tile_map_id_raw * 64), # Turn it from a 0-1 value into a valid tile ID
-                        'tile_map_opacity': tile_map_opacity,
-                        'sphere_map_id': sphere_map_id,
-                        'tile_scale_x': tile_transform['scale_x'],
-                        'tile_scale_y': tile_transform['scale_y'],
-                        'tile_rotation_deg': tile_transform['rotation_deg'],
-                        'tile_shear_deg': tile_transform['shear_deg'],
-                        'tile_matrix_raw': {'uu': tile_matrix_uu, 'uv': tile_matrix_uv, 'vu': tile_matrix_vu, 'vv': tile_matrix_vv}
-                    }
-                    colorset_data.append(row_data)
-
-                # DYE DATA (If it exists)
-                colorset_bytes_read = br.tell() - color_data_start
-                remaining_data_after_rows = color_set_data_size - colorset_bytes_read
-                expected_dye_bytes = row_count * 4
-
-                if remaining_data_after_rows >= expected_dye_bytes:
-                    dye_data = br.read(expected_dye_bytes)
-                    num_dye_rows = len(dye_data) // 4
-                    for i in range(num_dye_rows):
-                        offset = i * 4
-                        chunk = dye_data[offset:offset+4]
-                        if len(chunk) == 4:
-                            # Assume dye data is also little-endian. Surely.
-                            b1, b2, b3, b4 = struct.unpack('<BBBB', chunk)
-                            # Template uses little-endian short within bytes 3 & 4
-                            template_val = struct.unpack('<H', bytes([b3, b4 & 0b11100111]))[0]
-                            dye_info = {
-                                'channel': ((b4 >> 3) & 0b11) + 1,
-                                'template': template_val,
-                                'flags': extract_dye_flags(b1, b2), # dye_diffuse, dye_specular, etc
-                                'raw_bytes': {'hex': f'{b1:02x} {b2:02x} {b3:02x} {b4:02x}'} # Simplified raw bytes that I don't really know what they're for
-                            }
-                            if i < len(colorset_data):
-                                colorset_data[i]['dye'] = dye_info
-                        else:
-                            logger.warning(f"Incomplete dye data chunk for row index {i}.")
-                elif remaining_data_after_rows > 0:
-                    logger.warning(f"Remaining data size ({remaining_data_after_rows}) after colorset rows doesn't match expected dye size ({expected_dye_bytes}). Skipping dye read.")
-
-            # MATERIAL FLAGS
-            # Seek relative to start of colorset block + declared size
-            flags_offset = color_data_start + color_set_data_size
-            br.seek(flags_offset)
-            # Skip 6 bytes (shader constants?)
-            br.seek(6, 1)
-            flags_read_offset = br.tell()
-            # Read 4 bytes for flags
-            material_flags_value = struct.unpack('<I', br.read(4))[0]
-            material_flags = MaterialFlags(material_flags_value)
-
-            # Return dict
-            return {
-                'colorset_data': colorset_data,
-                'material_flags': material_flags,
-                'shader_name': shader_name,
-                'textures': textures,
-                'colorset_type': colorset_type
-            }
 
-        except EOFError as e:
-            logger.error(f"Error reading MTRL file {filepath}: Reached end of file unexpectedly. {e}")
-            return None
-        except struct.error as e:
-            logger.error(f"Error reading MTRL file {filepath}: Struct unpack error. {e}")
+def peek_mtrl(filepath: str) -> Optional[Dict[str, Any]]:
+    """
+    Cheap version of read_mtrl_file() for when only the shader name, textures, colorset type or material flags are needed.
+    The returned dict looks exactly the same, but the colorset (tile matrices, etc.) is only decoded if something actually reads from it.
+
+    Args:
+        filepath (str): Path to the .mtrl file.
+
+    Returns:
+        mtrl_data (dict): A dictionary containing the parsed data, or None if an error occurs.
+    """
+    return read_mtrl_file(filepath, lazy_colorset=True)
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# ARCHIVES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Meddle exports/caches are often kept zipped. These read mtrl files straight out of the zip without extracting it,
+# only the central directory and the requested files are ever read (and decompressed).
+
+def _zip_member_name(member_name: str) -> str:
+    """Zip paths always use forward slashes and never start with one"""
+    return member_name.replace('\\', '/').lstrip('/')
+
+
+def list_zip_mtrl_files(archive_path: str) -> List[str]:
+    """
+    Lists every .mtrl file in a zip archive.
+
+    Returns:
+        list of str: Member names (forward slashes, relative to the archive root), or an empty list if the archive can't be read.
+    """
+    try:
+        with zipfile.ZipFile(helpers.safe_filepath(archive_path)) as archive:
+            return [info.filename for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith('.mtrl')]
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.error(f"Could not read zip archive {archive_path}: {e}")
+        return []
+
+
+def read_mtrl_from_zip(archive_path: str, member_name: str, lazy_colorset: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Reads a single mtrl file out of a zip archive without extracting anything.
+
+    Args:
+        archive_path (str): Path to the .zip file.
+        member_name (str): Path of the .mtrl file inside the archive, like "cache/chara/equipment/e0100/material/v0001/mt_c0101e0100_top_a.mtrl".
+        lazy_colorset (bool): Don't decode the colorset until it's actually used. See peek_mtrl().
+
+    Returns:
+        mtrl_data (dict): Same as read_mtrl_file(), or None if an error occurs.
+    """
+    return read_mtrl_files_from_zip(archive_path, [member_name], lazy_colorset).get(member_name)
+
+
+def read_mtrl_files_from_zip(archive_path: str, member_names: Optional[Iterable[str]] = None, lazy_colorset: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Reads many mtrl files out of a zip archive, opening it only once.
+
+    Args:
+        archive_path (str): Path to the .zip file.
+        member_names (Iterable[str], optional): Paths of the .mtrl files inside the archive. Defaults to every .mtrl file in it.
+        lazy_colorset (bool): Don't decode the colorsets until they're actually used. See peek_mtrl().
+
+    Returns:
+        dict: The key is the member name as given, the value is the mtrl data or None if that file couldn't be read.
+    """
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    member_names = list(member_names) if member_names is not None else None
+    try:
+        with zipfile.ZipFile(helpers.safe_filepath(archive_path)) as archive:
+            if member_names is None:
+                member_names = [info.filename for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith('.mtrl')]
+            lowercase_names = None # Only made if some name doesn't match exactly, the paths usually come from Windows so case can differ
+            for member_name in member_names:
+                zip_name = _zip_member_name(member_name)
+                try:
+                    info = archive.getinfo(zip_name)
+                except KeyError:
+                    if lowercase_names is None:
+                        lowercase_names = {zip_info.filename.lower(): zip_info for zip_info in archive.infolist()}
+                    info = lowercase_names.get(zip_name.lower())
+                if info is None:
+                    logger.error(f"MTRL file {member_name} not found in {archive_path}")
+                    results[member_name] = None
+                    continue
+                name = f"{archive_path}:{info.filename}"
+                try:
+                    data = archive.read(info)
+                except (OSError, zipfile.BadZipFile, RuntimeError, zlib.error, EOFError, NotImplementedError) as e: # RuntimeError is what encrypted files give, the others corrupt or unsupported compression
+                    logger.error(f"Could not read {name}: {e}")
+                    results[member_name] = None
+                    continue
+                results[member_name] = parse_mtrl(data, name, lazy_colorset)
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.error(f"Could not read zip archive {archive_path}: {e}")
+        for member_name in member_names or ():
+            results.setdefault(member_name, None)
+    return results
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# PARSE CACHE
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Parsed mtrl files, so dyeing the same outfit over and over doesn't re-read the same file from disk every time.
+# Key is the normalized path, value is a _MtrlCacheEntry. Ordered from least to most recently used.
+_mtrl_cache: 'OrderedDict[str, _MtrlCacheEntry]' = OrderedDict()
+_mtrl_cache_lock = threading.RLock()
+_mtrl_cache_bytes = 0
+_mtrl_cache_stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'evictions': 0, 'invalidations': 0}
+
+# Budgets, change them with configure_mtrl_cache()
+_mtrl_cache_max_entries = 512
+_mtrl_cache_max_bytes = 64 * 1024 * 1024
+# How long a cached file is trusted before its mtime and size are checked again. Keeps dye scrolling from stat-ing the file on every change.
+_mtrl_cache_revalidate_seconds = 2.0
+
+
+class _MtrlCacheEntry:
+    __slots__ = ('data', 'mtime_ns', 'size', 'nbytes', 'validated_at')
+
+    def __init__(self, data: Dict[str, Any], mtime_ns: int, size: int, validated_at: float):
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.validated_at = validated_at
+        # Rough size, the colorset arrays are by far the biggest part
+        colorset_data = data.get('colorset_data')
+        self.nbytes = 512 + sum(len(texture['path']) for texture in data.get('textures', ())) + (colorset_data.nbytes if colorset_data is not None else 0)
+        # The table is shared by everyone who gets this file from the cache, so make sure nobody edits it in place by accident
+        if colorset_data is not None:
+            colorset_data.values.flags.writeable = False
+
+
+def _normalize_mtrl_path(filepath: str) -> str:
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+def _evict_mtrl_cache_entries() -> None:
+    """Drops least recently used entries until the cache is within its budgets. Caller holds the lock."""
+    global _mtrl_cache_bytes
+    while _mtrl_cache and (len(_mtrl_cache) > _mtrl_cache_max_entries or _mtrl_cache_bytes > _mtrl_cache_max_bytes):
+        _, entry = _mtrl_cache.popitem(last=False)
+        _mtrl_cache_bytes -= entry.nbytes
+        _mtrl_cache_stats['evictions'] += 1
+
+
+def _remove_mtrl_cache_entry(key: str) -> None:
+    """Caller holds the lock"""
+    global _mtrl_cache_bytes
+    entry = _mtrl_cache.pop(key, None)
+    if entry is not None:
+        _mtrl_cache_bytes -= entry.nbytes
+        _mtrl_cache_stats['invalidations'] += 1
+
+
+def _get_cached_mtrl(key: str, now: float) -> Tuple[Optional[Dict[str, Any]], Optional[os.stat_result]]:
+    """
+    Looks a file up in the memory cache.
+
+    Returns:
+        tuple: (a copy of the cached data or None, the file's stat result if it had to be checked and isn't cached).
+               Both are None if the file couldn't be stat-ed at all.
+    """
+    with _mtrl_cache_lock:
+        entry = _mtrl_cache.get(key)
+        if entry is not None and now - entry.validated_at < _mtrl_cache_revalidate_seconds:
+            _mtrl_cache.move_to_end(key)
+            _mtrl_cache_stats['hits'] += 1
+            return dict(entry.data), None
+
+    try:
+        stat = os.stat(helpers.safe_filepath(key))
+    except OSError:
+        with _mtrl_cache_lock:
+            _remove_mtrl_cache_entry(key)
+        return None, None
+
+    with _mtrl_cache_lock:
+        entry = _mtrl_cache.get(key)
+        if entry is not None:
+            if entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                entry.validated_at = now
+                _mtrl_cache.move_to_end(key)
+                _mtrl_cache_stats['hits'] += 1
+                return dict(entry.data), None
+            _remove_mtrl_cache_entry(key) # The file changed
+        _mtrl_cache_stats['misses'] += 1
+    return None, stat
+
+
+def _cache_mtrl(key: str, stat: os.stat_result, data: Dict[str, Any], now: float) -> None:
+    global _mtrl_cache_bytes
+    entry = _MtrlCacheEntry(data, stat.st_mtime_ns, stat.st_size, now)
+    with _mtrl_cache_lock:
+        _remove_mtrl_cache_entry(key) # In case another thread got there first
+        _mtrl_cache[key] = entry
+        _mtrl_cache_bytes += entry.nbytes
+        _evict_mtrl_cache_entries()
+
+
+def _load_mtrl_from_disk_cache(key: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+    data = _load_mtrl_disk_entry(key, stat.st_mtime_ns, stat.st_size)
+    if data is not None:
+        with _mtrl_cache_lock:
+            _mtrl_cache_stats['disk_hits'] += 1
+    return data
+
+
+def get_mtrl_data(filepath: str) -> Optional[Dict[str, Any]]:
+    """
+    Cached version of read_mtrl_file(). The file is only parsed again if its modification time or size changed.
+    Use this for anything that might read the same file many times, like updating dyes.
+    If the disk cache is turned on, files parsed in an earlier session are loaded from there instead of being parsed again.
+
+    The returned dict is a shallow copy, so replacing its values is fine, but the ColorsetTable in it is shared
+    with the cache and must not be modified in place (overlay() returns a new table, use that).
+
+    Args:
+        filepath (str): Path to the .mtrl file.
+
+    Returns:
+        mtrl_data (dict): A dictionary containing the parsed data, or None if an error occurs.
+    """
+    key = _normalize_mtrl_path(filepath)
+    now = time.monotonic()
+
+    data, stat = _get_cached_mtrl(key, now)
+    if data is not None:
+        return data
+    if stat is None:
+        return read_mtrl_file(filepath) # Let it log the error like normal
+
+    # Parse outside of the lock so other threads aren't held up by the disk
+    data = _load_mtrl_from_disk_cache(key, stat)
+    if data is None:
+        data = read_mtrl_file(key)
+        if data is None:
             return None
-        except ValueError as e:
-             logger.error(f"Error reading MTRL file {filepath}: Value error (likely invalid data). {e}")
-             return None
+        _store_mtrl_disk_entry(key, stat.st_mtime_ns, stat.st_size, data)
+
+    _cache_mtrl(key, stat, data, now)
+    return dict(data)
+
+
+def read_mtrl_files(filepaths: Iterable[str], workers: Optional[int] = None) -> Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Reads many mtrl files in parallel and puts them all in the parse cache, so later get_mtrl_data() calls for them are instant.
+    Meant to be called before a big batch of materials gets created, like the Meddle auto-setup does.
+
+    Done on a thread pool, since it's mostly waiting on the disk.
+
+    Args:
+        filepaths (Iterable[str]): Paths to .mtrl files. Duplicates are only read once.
+        workers (int, optional): Number of threads. Defaults to a few more than there are cores, since they mostly wait.
+
+    Returns:
+        dict: The key is the path as given, the value is a tuple (mtrl_data or None, error message or None). Never raises for a single bad file.
+    """
+    filepaths = list(dict.fromkeys(filepaths))
+    results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]] = {}
+    if not filepaths:
+        return results
+    cpu_count = os.cpu_count() or 1
+
+    def read_one(filepath: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        try:
+            data = get_mtrl_data(filepath)
         except Exception as e:
-            logger.exception(f"Unexpected error reading MTRL file {filepath}: {e}")
-            return None
+            return None, f"{type(e).__name__}: {e}"
+        return (data, None) if data is not None else (None, "Failed to read MTRL file, see the log for details")
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, cpu_count + 4), thread_name_prefix="FFGearMtrl") as executor:
+        for filepath, result in zip(filepaths, executor.map(read_one, filepaths)):
+            results[filepath] = result
+    return results
+
+
+def invalidate_mtrl_cache(filepath: Optional[str] = None) -> None:
+    """
+    Drops a single file from the parse cache, or everything if no path is given.
+
+    Args:
+        filepath (str, optional): Path to the .mtrl file to forget.
+    """
+    global _mtrl_cache_bytes
+    with _mtrl_cache_lock:
+        if filepath is None:
+            _mtrl_cache_stats['invalidations'] += len(_mtrl_cache)
+            _mtrl_cache.clear()
+            _mtrl_cache_bytes = 0
+        else:
+            _remove_mtrl_cache_entry(_normalize_mtrl_path(filepath))
+
+
+def configure_mtrl_cache(max_entries: Optional[int] = None, max_bytes: Optional[int] = None, revalidate_seconds: Optional[float] = None) -> None:
+    """
+    Changes the parse cache budgets. Anything left as None keeps its current value.
+
+    Args:
+        max_entries (int, optional): Maximum number of cached files. 0 turns the cache off.
+        max_bytes (int, optional): Rough maximum memory used by the cached data.
+        revalidate_seconds (float, optional): How long a cached file is trusted before checking its mtime and size again. 0 checks every time.
+    """
+    global _mtrl_cache_max_entries, _mtrl_cache_max_bytes, _mtrl_cache_revalidate_seconds
+    with _mtrl_cache_lock:
+        if max_entries is not None:
+            _mtrl_cache_max_entries = max(0, int(max_entries))
+        if max_bytes is not None:
+            _mtrl_cache_max_bytes = max(0, int(max_bytes))
+        if revalidate_seconds is not None:
+            _mtrl_cache_revalidate_seconds = max(0.0, float(revalidate_seconds))
+        _evict_mtrl_cache_entries()
+
+
+def get_mtrl_cache_stats() -> Dict[str, int]:
+    """Hit/miss/eviction counters and current size of the parse cache, for debugging"""
+    with _mtrl_cache_lock:
+        return dict(_mtrl_cache_stats, entries=len(_mtrl_cache), bytes=_mtrl_cache_bytes)
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DISK CACHE
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Optional second level behind the in-memory cache, so parsed files survive restarting Blender.
+# Every entry is its own small binary file named after a hash of the path, mtime and size of the mtrl file it came from.
+# Off until configure_mtrl_disk_cache() is given a directory (the preferences do that).
+# The directory is only walked once, on a worker thread when it's configured. After that the cache keeps its own list of entries
+# (least recently used first) and a running total of their size, and only goes to the filesystem to delete the ones over budget.
+#
+# Entry layout (little-endian):
+#   MTRL_DISK_CACHE_HEADER_STRUCT: magic, format version, MTRL_PARSER_VERSION, column count, source mtime_ns, source size,
+#                                  row count, colorset type, has dye, source path length, metadata length
+#   source path (utf-8), metadata (json: shader name, textures, material flags)
+#   colorset values (float32, rows * columns), then dye bytes (uint8, rows * 4) and has_dye (bool, rows) if it has dye
+
+MTRL_DISK_CACHE_MAGIC = b'FFGM'
+MTRL_DISK_CACHE_FORMAT_VERSION = 1
+MTRL_DISK_CACHE_HEADER_STRUCT = struct.Struct('<4sHHHqqHBBII')
+MTRL_DISK_CACHE_EXTENSION = '.ffgmtrl'
+_COLORSET_TYPE_CODES = {None: 0, ColorsetType.ENDWALKER: 1, ColorsetType.DAWNTRAIL: 2}
+_COLORSET_TYPES_BY_CODE = {code: colorset_type for colorset_type, code in _COLORSET_TYPE_CODES.items()}
+
+_mtrl_disk_cache_dir: Optional[str] = None
+_mtrl_disk_cache_max_bytes = 128 * 1024 * 1024
+_mtrl_disk_cache_entries: 'OrderedDict[str, int]' = OrderedDict() # Entry path -> size in bytes, least recently used first
+_mtrl_disk_cache_bytes = 0 # Sum of _mtrl_disk_cache_entries
+_mtrl_disk_cache_generation = 0 # Bumped whenever the directory changes, so a scan of the old one doesn't get merged in
+_mtrl_disk_cache_lock = threading.RLock() # Separate from the memory cache lock so deleting entries doesn't hold that up
+
+
+def _mtrl_disk_cache_path(key: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha1(f"{key}|{mtime_ns}|{size}".encode('utf-8', errors='surrogatepass')).hexdigest()
+    return os.path.join(_mtrl_disk_cache_dir, digest[:2], digest + MTRL_DISK_CACHE_EXTENSION)
+
+
+def _encode_mtrl_disk_entry(key: str, mtime_ns: int, size: int, data: Dict[str, Any]) -> bytes:
+    colorset_data: ColorsetTable = data['colorset_data']
+    has_dye = colorset_data.dye_bytes is not None
+    source_path = key.encode('utf-8', errors='surrogatepass')
+    metadata = json.dumps({
+        'shader_name': data['shader_name'],
+        'textures': data['textures'],
+        'material_flags': data['material_flags'].value,
+    }).encode('utf-8')
+
+    parts = [
+        MTRL_DISK_CACHE_HEADER_STRUCT.pack(
+            MTRL_DISK_CACHE_MAGIC, MTRL_DISK_CACHE_FORMAT_VERSION, MTRL_PARSER_VERSION, len(COLORSET_COLUMNS),
+            mtime_ns, size, len(colorset_data), _COLORSET_TYPE_CODES[data['colorset_type']], has_dye,
+            len(source_path), len(metadata)),
+        source_path,
+        metadata,
+        np.ascontiguousarray(colorset_data.values, dtype='<f4').tobytes(),
+    ]
+    if has_dye:
+        parts.append(np.ascontiguousarray(colorset_data.dye_bytes, dtype=np.uint8).tobytes())
+        parts.append(np.ascontiguousarray(colorset_data.has_dye, dtype=np.bool_).tobytes())
+    return b''.join(parts)
+
+
+def _decode_mtrl_disk_entry(buffer: bytes, key: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    """Returns None if the entry is from another parser version or doesn't belong to this exact file"""
+    if len(buffer) < MTRL_DISK_CACHE_HEADER_STRUCT.size:
+        return None
+    (magic, format_version, parser_version, column_count, entry_mtime_ns, entry_size,
+     row_count, colorset_type_code, has_dye, path_length, metadata_length) = MTRL_DISK_CACHE_HEADER_STRUCT.unpack_from(buffer, 0)
+    if (magic != MTRL_DISK_CACHE_MAGIC or format_version != MTRL_DISK_CACHE_FORMAT_VERSION or parser_version != MTRL_PARSER_VERSION
+            or column_count != len(COLORSET_COLUMNS) or entry_mtime_ns != mtime_ns or entry_size != size):
+        return None
+
+    offset = MTRL_DISK_CACHE_HEADER_STRUCT.size
+    if buffer[offset:offset + path_length].decode('utf-8', errors='surrogatepass') != key:
+        return None # Hash collision, as unlikely as that is
+    offset += path_length
+    metadata = json.loads(buffer[offset:offset + metadata_length].decode('utf-8'))
+    offset += metadata_length
+
+    value_count = row_count * column_count
+    values = np.frombuffer(buffer, dtype='<f4', count=value_count, offset=offset).reshape(row_count, column_count).astype(np.float32)
+    offset += value_count * 4
+    dye_bytes = None
+    dye_rows = None
+    if has_dye:
+        dye_bytes = np.frombuffer(buffer, dtype=np.uint8, count=row_count * 4, offset=offset).reshape(row_count, 4).copy()
+        offset += row_count * 4
+        dye_rows = np.frombuffer(buffer, dtype=np.bool_, count=row_count, offset=offset).copy()
+
+    return {
+        'colorset_data': ColorsetTable(values, dye_bytes, dye_rows),
+        'material_flags': MaterialFlags(metadata['material_flags']),
+        'shader_name': metadata['shader_name'],
+        'textures': metadata['textures'],
+        'colorset_type': _COLORSET_TYPES_BY_CODE[colorset_type_code]
+    }
+
+
+def _load_mtrl_disk_entry(key: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    if _mtrl_disk_cache_dir is None:
+        return None
+    entry_path = _mtrl_disk_cache_path(key, mtime_ns, size)
+    try:
+        with open(entry_path, 'rb') as f:
+            buffer = f.read()
+        data = _decode_mtrl_disk_entry(buffer, key, mtime_ns, size)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable MTRL disk cache entry {entry_path}: {e}")
+        data = None
+    if data is None:
+        with _mtrl_disk_cache_lock:
+            _forget_mtrl_disk_entry(entry_path)
+        try:
+            os.remove(entry_path) # Stale or broken, it'll be written again
+        except OSError:
+            pass
+        return None
+    try:
+        os.utime(entry_path) # So the next scan (after restarting Blender) still knows it was used recently
+    except OSError:
+        pass
+    with _mtrl_disk_cache_lock:
+        _remember_mtrl_disk_entry(entry_path, len(buffer))
+    return data
+
+
+def _store_mtrl_disk_entry(key: str, mtime_ns: int, size: int, data: Dict[str, Any]) -> None:
+    global _mtrl_disk_cache_bytes
+    if _mtrl_disk_cache_dir is None:
+        return
+    entry_path = _mtrl_disk_cache_path(key, mtime_ns, size)
+    temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        encoded = _encode_mtrl_disk_entry(key, mtime_ns, size, data)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_path, entry_path) # Atomic, so another Blender instance never sees half an entry
+    except Exception as e:
+        logger.debug(f"Could not write MTRL disk cache entry {entry_path}: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return
+
+    with _mtrl_disk_cache_lock:
+        _remember_mtrl_disk_entry(entry_path, len(encoded))
+        _evict_mtrl_disk_cache()
+
+
+def _remember_mtrl_disk_entry(entry_path: str, entry_size: int) -> None:
+    """Marks an entry as the most recently used one. Caller holds the lock."""
+    global _mtrl_disk_cache_bytes
+    _forget_mtrl_disk_entry(entry_path)
+    _mtrl_disk_cache_entries[entry_path] = entry_size
+    _mtrl_disk_cache_bytes += entry_size
+
+
+def _forget_mtrl_disk_entry(entry_path: str) -> None:
+    """Takes an entry out of the list without deleting it. Caller holds the lock."""
+    global _mtrl_disk_cache_bytes
+    _mtrl_disk_cache_bytes -= _mtrl_disk_cache_entries.pop(entry_path, 0)
+
+
+def _scan_mtrl_disk_cache(directory: Optional[str]) -> List[tuple]:
+    """Returns (mtime, size, path) of every entry in a disk cache directory"""
+    entries = []
+    if directory is None or not os.path.isdir(directory):
+        return entries
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(MTRL_DISK_CACHE_EXTENSION):
+                entry_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+    return entries
+
+
+def _scan_mtrl_disk_cache_worker(directory: str, generation: int) -> None:
+    """Finds what's already in a newly configured cache directory, then evicts if that's over budget"""
+    global _mtrl_disk_cache_dir, _mtrl_disk_cache_bytes
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logger.error(f"Could not create MTRL disk cache directory {directory}, it will stay off: {e}")
+        with _mtrl_disk_cache_lock:
+            if generation == _mtrl_disk_cache_generation:
+                _mtrl_disk_cache_dir = None
+        return
+    entries = _scan_mtrl_disk_cache(directory)
+
+    with _mtrl_disk_cache_lock:
+        if generation != _mtrl_disk_cache_generation:
+            return # The directory changed while this one was being scanned
+        used_during_scan = list(_mtrl_disk_cache_entries.items()) # Those are the most recently used ones, so they go last
+        _mtrl_disk_cache_entries.clear()
+        for _, entry_size, entry_path in sorted(entries):
+            _mtrl_disk_cache_entries[entry_path] = entry_size
+        for entry_path, entry_size in used_during_scan:
+            _mtrl_disk_cache_entries.pop(entry_path, None)
+            _mtrl_disk_cache_entries[entry_path] = entry_size
+        _mtrl_disk_cache_bytes = sum(_mtrl_disk_cache_entries.values())
+        _evict_mtrl_disk_cache()
+    logger.debug(f"MTRL disk cache scan found {len(entries)} entries in {directory}")
+
+
+def _evict_mtrl_disk_cache() -> None:
+    """Deletes the least recently used entries until the disk cache is down to 80% of its budget, if it's over it. Caller holds the lock."""
+    global _mtrl_disk_cache_bytes
+    if _mtrl_disk_cache_bytes <= _mtrl_disk_cache_max_bytes:
+        return
+    target = _mtrl_disk_cache_max_bytes * 0.8 # Some headroom so it doesn't have to run again right away
+    while _mtrl_disk_cache_entries and _mtrl_disk_cache_bytes > target:
+        entry_path, entry_size = _mtrl_disk_cache_entries.popitem(last=False)
+        _mtrl_disk_cache_bytes -= entry_size
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass # Already gone (another Blender instance got to it first), or in use. Not counted either way
+
+
+def configure_mtrl_disk_cache(directory: Optional[str], max_bytes: Optional[int] = None) -> None:
+    """
+    Turns the on-disk MTRL cache on or off. Doesn't touch the filesystem itself unless only the budget changed and that's now exceeded,
+    a new directory is created and scanned on a worker thread.
+
+    Args:
+        directory (str, optional): Where to keep the cache entries. None turns the disk cache off (existing entries are left alone).
+        max_bytes (int, optional): Size budget for the cache directory. Least recently used entries are deleted beyond it.
+    """
+    global _mtrl_disk_cache_dir, _mtrl_disk_cache_max_bytes, _mtrl_disk_cache_bytes, _mtrl_disk_cache_generation
+    with _mtrl_disk_cache_lock:
+        if max_bytes is not None:
+            _mtrl_disk_cache_max_bytes = max(0, int(max_bytes))
+        directory = directory or None
+        if directory == _mtrl_disk_cache_dir:
+            _evict_mtrl_disk_cache()
+            return
+
+        _mtrl_disk_cache_generation += 1
+        _mtrl_disk_cache_dir = directory
+        _mtrl_disk_cache_entries.clear()
+        _mtrl_disk_cache_bytes = 0
+        if directory is not None:
+            threading.Thread(target=_scan_mtrl_disk_cache_worker, args=(directory, _mtrl_disk_cache_generation),
+                             name="FFGear MTRL disk cache scan", daemon=True).start()
+
+
+def clear_mtrl_disk_cache() -> None:
+    """Deletes every entry in the disk cache, including ones the scan hasn't found yet"""
+    global _mtrl_disk_cache_bytes, _mtrl_disk_cache_generation
+    with _mtrl_disk_cache_lock:
+        _mtrl_disk_cache_generation += 1 # A running scan would only find what's deleted here
+        for _, _, entry_path in _scan_mtrl_disk_cache(_mtrl_disk_cache_dir):
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        _mtrl_disk_cache_entries.clear()
+        _mtrl_disk_cache_bytes = 0
 
 
 # Not used for anything anymore I think but good for debugging sometimes
@@ -405,8 +1233,8 @@ def get_values_by_group(data: List[dict], value_key: str, group: str) -> List:
     values = []
     if not data: return values # Handle empty data case
     for row in data:
-        # Check if row is a dictionary and has the group key
-        if isinstance(row, dict) and row.get('group') == group:
+        # Check if row is a dictionary (or a ColorsetRow) and has the group key
+        if isinstance(row, Mapping) and row.get('group') == group:
             value = row.get(value_key)
             if value is not None:
                  if isinstance(value, (list, tuple)):
@@ -414,3 +1242,10 @@ def get_values_by_group(data: List[dict], value_key: str, group: str) -> List:
                  else:
                      values.append(value)
     return values
+
+
+def register():
+    invalidate_mtrl_cache()
+
+def unregister():
+    invalidate_mtrl_cache()
@@ -0,0 +1,308 @@
+import os
+import logging
+import threading
+from . import mtrl_handler
+from .mtrl_handler import ColorsetType, MaterialFlags
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple, Iterator
+
+logging.basicConfig()
+logger = logging.getLogger('FFGear.mtrl_index')
+logger.setLevel(logging.INFO)
+
+##### WHAT THIS IS #####
+# An index over a whole Meddle cache directory, so questions like "which mtrl files use characterlegacy.shpk?",
+# "which materials use this _id.tex?" or "where is the png for this texture?" don't need a full rglob or a full parse every time.
+# It walks the directory once and keeps a few dicts for lookups. File and texture name lookups only need that walk.
+# The .mtrl files themselves are only peeked at (header and strings only, in parallel) the first time something asks about shaders or textures they use.
+# Refreshing it walks the directory again but only re-reads the .mtrl files that actually changed.
+########################
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DEFINITIONS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Same as what find_texture_file in the operators accepts
+TEXTURE_FILE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.exr', '.tiff', '.tif')
+
+
+def texture_key(path: str) -> str:
+    """
+    The name used to match textures between the game paths inside mtrl files and the exported files on disk.
+    Strips the folders and all texture extensions, so "chara/.../v01_c0101e0100_top_id.tex" and "v01_c0101e0100_top_id.tex.png" both become "v01_c0101e0100_top_id".
+    """
+    name = os.path.basename(path.replace('\\', '/')).lower()
+    while True:
+        stem, extension = os.path.splitext(name)
+        if extension not in TEXTURE_FILE_EXTENSIONS and extension != '.tex':
+            return name
+        name = stem
+
+
+@dataclass
+class MtrlIndexEntry:
+    path: str
+    name: str
+    shader_name: str
+    textures: Tuple[str, ...]
+    colorset_type: Optional[ColorsetType]
+    material_flags: MaterialFlags
+    mtime_ns: int
+    size: int
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# INDEX
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+class MtrlIndex:
+    """
+    Lookup tables over every .mtrl file (and every exported texture file) in a directory.
+    Everything that returns several results returns them in the order the files were found while walking the directory, which is the same order rglob would give.
+    entries, by_shader, by_texture and failed need the .mtrl files to be read, which happens the first time one of them is used.
+    """
+
+    def __init__(self, root: str, workers: Optional[int] = None):
+        self.root = os.path.abspath(root)
+        self.by_file_name: Dict[str, List[str]] = {}               # "mt_c0101e0100_top_a.mtrl" -> full paths
+        self.texture_files: Dict[str, List[str]] = {}              # File stem -> full paths of texture files on disk (png etc)
+        self._entries: Dict[str, MtrlIndexEntry] = {}              # Full path -> entry
+        self._by_shader: Dict[str, List[MtrlIndexEntry]] = {}      # "characterlegacy.shpk" -> entries
+        self._by_texture: Dict[str, List[MtrlIndexEntry]] = {}     # texture_key() of every texture an mtrl uses -> entries
+        self._failed: List[str] = []                               # .mtrl files that couldn't be read
+        self._mtrl_files: List[Tuple[str, int, int]] = []          # (path, mtime_ns, size) in walk order
+        self._reusable: Dict[str, MtrlIndexEntry] = {}             # Entries of an older index, used for files that haven't changed
+        self._workers = workers
+        self._peeked = False
+        self._peek_lock = threading.Lock()
+
+    @property
+    def entries(self) -> Dict[str, MtrlIndexEntry]:
+        self.peek_mtrl_files()
+        return self._entries
+
+    @property
+    def by_shader(self) -> Dict[str, List[MtrlIndexEntry]]:
+        self.peek_mtrl_files()
+        return self._by_shader
+
+    @property
+    def by_texture(self) -> Dict[str, List[MtrlIndexEntry]]:
+        self.peek_mtrl_files()
+        return self._by_texture
+
+    @property
+    def failed(self) -> List[str]:
+        self.peek_mtrl_files()
+        return self._failed
+
+    def _add(self, entry: MtrlIndexEntry) -> None:
+        self._entries[entry.path] = entry
+        self._by_shader.setdefault(entry.shader_name, []).append(entry)
+        for texture_path in dict.fromkeys(texture_key(path) for path in entry.textures): # Each material only once per texture
+            self._by_texture.setdefault(texture_path, []).append(entry)
+
+    def peek_mtrl_files(self) -> None:
+        """Reads every .mtrl file found by the walk (in parallel), unless that's already been done. Unchanged files are taken from the older index."""
+        if self._peeked:
+            return
+        with self._peek_lock:
+            if self._peeked:
+                return
+            results: Dict[str, Optional[MtrlIndexEntry]] = {}
+            to_read = []
+            for path, mtime_ns, size in self._mtrl_files:
+                old_entry = self._reusable.get(path)
+                if old_entry is not None and old_entry.mtime_ns == mtime_ns and old_entry.size == size:
+                    results[path] = old_entry
+                else:
+                    to_read.append((path, mtime_ns, size))
+
+            if to_read:
+                with ThreadPoolExecutor(max_workers=self._workers or min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="FFGearMtrlIndex") as executor:
+                    for (path, _, _), entry in zip(to_read, executor.map(lambda args: _peek_index_entry(*args), to_read)):
+                        results[path] = entry
+
+            for path, _, _ in self._mtrl_files:
+                entry = results[path]
+                if entry is None:
+                    self._failed.append(path)
+                else:
+                    self._add(entry)
+
+            self._reusable = {}
+            self._peeked = True
+            logger.debug(f"Read the mtrl files of {self.root}: {len(self._entries)} indexed ({len(to_read)} read, {len(self._mtrl_files) - len(to_read)} unchanged, {len(self._failed)} failed)")
+
+    def files_using_shader(self, shader_name: str) -> List[MtrlIndexEntry]:
+        """All the mtrl files using a shader. Works with or without the ".shpk" ending."""
+        if not shader_name.endswith('.shpk'):
+            shader_name += '.shpk'
+        return list(self.by_shader.get(shader_name, ()))
+
+    def materials_using_texture(self, texture_path: str) -> List[MtrlIndexEntry]:
+        """All the mtrl files referencing a texture. Takes a game path, an exported file path or just the name."""
+        return list(self.by_texture.get(texture_key(texture_path), ()))
+
+    def find_mtrl_files(self, file_name: str) -> List[str]:
+        """Full paths of every mtrl file with this exact file name"""
+        return list(self.by_file_name.get(file_name, ()))
+
+    def find_texture_file(self, base_name: str, search_dir: Optional[str] = None) -> Optional[str]:
+        """
+        Same result as searching a directory recursively for a texture file with this stem (see find_texture_file in the operators),
+        without touching the disk.
+
+        Args:
+            base_name (str): File name without extension, case sensitive.
+            search_dir (str, optional): Only return files inside this folder, which has to be inside the index root. Defaults to the whole index.
+
+        Returns:
+            str or None: Path to the first matching file, or None if there isn't one.
+        """
+        paths = self.texture_files.get(base_name)
+        if not paths:
+            return None
+        if search_dir is None:
+            return paths[0]
+        search_dir = os.path.join(os.path.abspath(search_dir), '')
+        for path in paths:
+            if path.startswith(search_dir):
+                return path
+        return None
+
+    def covers(self, directory: str) -> bool:
+        """Whether a directory is inside (or is) the root of this index"""
+        directory = os.path.abspath(directory)
+        return directory == self.root or directory.startswith(os.path.join(self.root, ''))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        if not self._peeked:
+            return f"MtrlIndex(root={self.root!r}, mtrl_files={len(self._mtrl_files)}, not read yet, texture_files={len(self.texture_files)})"
+        return f"MtrlIndex(root={self.root!r}, mtrl_files={len(self._entries)}, shaders={len(self._by_shader)}, texture_files={len(self.texture_files)})"
+
+
+def _walk_files(root: str) -> Iterator[os.DirEntry]:
+    """Yields every file below root, files of a folder first and then its subfolders, depth first. Same order as Path.rglob("*")."""
+    try:
+        with os.scandir(root) as iterator:
+            dir_entries = list(iterator)
+    except OSError as e:
+        logger.debug(f"Could not list {root}: {e}")
+        return
+    subdirs = []
+    for dir_entry in dir_entries:
+        try:
+            if dir_entry.is_dir(follow_symlinks=False):
+                subdirs.append(dir_entry.path)
+            elif dir_entry.is_file():
+                yield dir_entry
+        except OSError:
+            continue
+    for subdir in subdirs:
+        yield from _walk_files(subdir)
+
+
+def _peek_index_entry(path: str, mtime_ns: int, size: int) -> Optional[MtrlIndexEntry]:
+    mtrl_data = mtrl_handler.peek_mtrl(path)
+    if not mtrl_data:
+        return None
+    return MtrlIndexEntry(
+        path=path,
+        name=os.path.basename(path),
+        shader_name=mtrl_data['shader_name'],
+        textures=tuple(texture['path'] for texture in mtrl_data['textures']),
+        colorset_type=mtrl_data['colorset_type'],
+        material_flags=mtrl_data['material_flags'],
+        mtime_ns=mtime_ns,
+        size=size
+    )
+
+
+def build_mtrl_index(root: str, workers: Optional[int] = None, previous: Optional[MtrlIndex] = None, peek: bool = False) -> MtrlIndex:
+    """
+    Walks a directory and indexes every .mtrl and texture file in it.
+    The .mtrl files aren't opened here, see MtrlIndex.peek_mtrl_files.
+
+    Args:
+        root (str): The directory to index, usually a Meddle cache folder.
+        workers (int, optional): Number of reading threads.
+        previous (MtrlIndex, optional): An older index of the same directory. Files that haven't changed since are taken from it instead of being read again.
+        peek (bool): Read the .mtrl files right away instead of on the first shader or texture query.
+
+    Returns:
+        MtrlIndex: The new index. Unreadable files are listed in its .failed list.
+    """
+    index = MtrlIndex(root, workers)
+
+    for dir_entry in _walk_files(index.root):
+        name = dir_entry.name
+        stem, extension = os.path.splitext(name)
+        extension = extension.lower()
+        if extension == '.mtrl':
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            index._mtrl_files.append((dir_entry.path, stat.st_mtime_ns, stat.st_size))
+            index.by_file_name.setdefault(name, []).append(dir_entry.path)
+        elif extension in TEXTURE_FILE_EXTENSIONS:
+            index.texture_files.setdefault(stem, []).append(dir_entry.path)
+
+    # An older index that never read its files can still pass on what the one before it read
+    if previous is not None:
+        index._reusable = previous._entries if previous._peeked else previous._reusable
+
+    logger.debug(f"Indexed {index.root}: {len(index._mtrl_files)} mtrl files, {len(index.texture_files)} texture names")
+    if peek:
+        index.peek_mtrl_files()
+    return index
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# SHARED INDEXES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+_index_cache: Dict[str, MtrlIndex] = {}
+_index_cache_lock = threading.Lock()
+
+
+def get_mtrl_index(root: str, refresh: bool = False) -> MtrlIndex:
+    """
+    Gets the index of a directory, building it the first time.
+
+    Args:
+        root (str): The directory.
+        refresh (bool): Walk the directory again to pick up added, removed or changed files. Unchanged .mtrl files aren't read again.
+            Either way the .mtrl files are only read once something asks about their shaders or textures.
+
+    Returns:
+        MtrlIndex: The index.
+    """
+    key = os.path.normcase(os.path.abspath(root))
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+    if index is not None and not refresh:
+        return index
+    index = build_mtrl_index(root, previous=index)
+    with _index_cache_lock:
+        _index_cache[key] = index
+    return index
+
+
+def clear_mtrl_indexes() -> None:
+    """Forgets every index"""
+    with _index_cache_lock:
+        _index_cache.clear()
+
+
+def register():
+    clear_mtrl_indexes()
+
+def unregister():
+    clear_mtrl_indexes()
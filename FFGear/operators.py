@@ -6,9 +6,12 @@ import logging
 import collections
 
 from bpy.types import Context, Operator
+from bpy.app.handlers import persistent
 from pathlib import Path
 from . import stm_utils
 from . import mtrl_handler
+from . import mtrl_index
+from . import tex_reader
 from . import helpers
 from . import properties
 from .mtrl_handler import MaterialFlags
@@ -272,7 +275,7 @@ def find_texture_file(directory: Path, base_name, recursive=False):
     return None
 
 
-def find_textures_from_mtrl(mtrl_data: dict, search_dir: Path, recursive=False):
+def find_textures_from_mtrl(mtrl_data: dict, search_dir: Path, recursive=False, index: Optional[mtrl_index.MtrlIndex] = None):
     """
     Find texture files based on MTRL data.
     
@@ -280,6 +283,7 @@ def find_textures_from_mtrl(mtrl_data: dict, search_dir: Path, recursive=False):
         mtrl_data: Dictionary containing MTRL file data
         search_dir: Path object for directory to search
         recursive: Whether to search recursively through subdirectories
+        index: Optional MtrlIndex covering search_dir. Recursive searches are looked up in it instead of walking the directory every time.
         
     Returns:
         tuple: (diffuse_tex, mask_tex, norm_tex, id_tex) paths as strings. None if not found
@@ -334,7 +338,10 @@ def find_textures_from_mtrl(mtrl_data: dict, search_dir: Path, recursive=False):
                 
             search_name = f"{tex_name}_{suffix}"
             logger.debug(f"Searching for: {search_name}, in: {search_dir}")
-            found_path = find_texture_file(search_dir, search_name, recursive)
+            if recursive and index is not None and index.covers(str(search_dir)):
+                found_path = index.find_texture_file(search_name, str(search_dir))
+            else:
+                found_path = find_texture_file(search_dir, search_name, recursive)
 
         # Store result in appropriate variable
         if found_path != None:
@@ -353,9 +360,39 @@ def find_textures_from_mtrl(mtrl_data: dict, search_dir: Path, recursive=False):
     return diffuse_tex, mask_tex, norm_tex, id_tex
 
 
+def get_addon_preferences():
+    """The add-on's preferences, or None if they can't be reached (like while the add-on is being unregistered)"""
+    try:
+        return bpy.context.preferences.addons[__package__].preferences
+    except (KeyError, AttributeError):
+        return None
+
+
+def get_meddle_texture_path(png_path: str, prefer_tex: bool = False) -> str:
+    """
+    Picks between a PNG from the Meddle cache and the game's own .tex file, if that was cached next to it.
+    The .tex is used when it's preferred, or when the PNG isn't there.
+
+    Args:
+        png_path (str): Path to the PNG, like ".../v01_c0201e0737_top_n.tex.png" (or ".../v01_c0201e0737_top_n.png")
+        prefer_tex (bool): Use the .tex even if the PNG exists.
+
+    Returns:
+        str: The path to use. The PNG path if there's no .tex.
+    """
+    stem, extension = os.path.splitext(png_path)
+    if extension.lower() != '.png':
+        return png_path
+    tex_path = stem if stem.lower().endswith('.tex') else stem + '.tex'
+    if (prefer_tex or not os.path.exists(helpers.safe_filepath(png_path))) and os.path.exists(helpers.safe_filepath(tex_path)):
+        return tex_path
+    return png_path
+
+
 def get_textures_from_meddle_data(cache_dir, material):
     """
     Just grabs and returns the texture paths from the Meddle custom properties of the material.
+    Uses the .tex files next to the PNGs instead if the preferences say so (or if a PNG is missing).
     
     Args:
         cache_dir (str): the cache directory path
@@ -364,29 +401,52 @@ def get_textures_from_meddle_data(cache_dir, material):
     Returns:
         tuple: (diffuse_tex_path, id_tex_path, mask_tex_path, norm_tex_path) as strings or None
     """
+    prefs = get_addon_preferences()
+    prefer_tex = bool(prefs and prefs.prefer_tex_files)
+
     try:
-        diffuse_tex_path = os.path.join(cache_dir, material["g_SamplerDiffuse_PngCachePath"])
+        diffuse_tex_path = get_meddle_texture_path(os.path.join(cache_dir, material["g_SamplerDiffuse_PngCachePath"]), prefer_tex)
     except:
         diffuse_tex_path = None
     
     try:
-        mask_tex_path = os.path.join(cache_dir, material["g_SamplerMask_PngCachePath"])
+        mask_tex_path = get_meddle_texture_path(os.path.join(cache_dir, material["g_SamplerMask_PngCachePath"]), prefer_tex)
     except:
         mask_tex_path = None
     
     try:
-        norm_tex_path = os.path.join(cache_dir, material["g_SamplerNormal_PngCachePath"])
+        norm_tex_path = get_meddle_texture_path(os.path.join(cache_dir, material["g_SamplerNormal_PngCachePath"]), prefer_tex)
     except:
         norm_tex_path = None
 
     try:
-        id_tex_path = os.path.join(cache_dir, material["g_SamplerIndex_PngCachePath"])
+        id_tex_path = get_meddle_texture_path(os.path.join(cache_dir, material["g_SamplerIndex_PngCachePath"]), prefer_tex)
     except:
         id_tex_path = None
     
     return diffuse_tex_path, mask_tex_path, norm_tex_path, id_tex_path
 
 
+# Which ColorsetTable columns the values of a Meddle ColorTable row end up in. A tuple means the Meddle value is a dict of several values.
+MEDDLE_COLORTABLE_COLUMNS = {
+    "Diffuse": ('diffuse_r', 'diffuse_g', 'diffuse_b'),
+    "Specular": ('specular_r', 'specular_g', 'specular_b'),
+    "Emissive": ('emissive_r', 'emissive_g', 'emissive_b'),
+    "SheenRate": 'sheen_rate',
+    "SheenTint": 'sheen_tint_rate',
+    "SheenAptitude": 'sheen_aperture', # May not be the correct mapping from Meddle but I think it is
+    "Roughness": 'roughness',
+    "Metalness": 'metalness',
+    "Anisotropy": 'anisotropy_blending',
+    "SphereMask": 'sphere_map_opacity', # May not be the correct mapping from Meddle but I think it is
+    "ShaderId": 'shader_template_id',
+    "TileIndex": 'tile_map_id',
+    "TileAlpha": 'tile_map_opacity',
+    "SphereIndex": 'sphere_map_id',
+    "TileMatrix": ('tile_matrix_uu', 'tile_matrix_uv', 'tile_matrix_vu', 'tile_matrix_vv'),
+}
+
+
 def construct_false_meddle_mtrl_data(material: bpy.types.Material) -> Optional[Dict[str, Any]]:
     """
     Creates some mtrl data to use for material creation based on the ColorTable attribute in the Meddle data
@@ -407,8 +467,6 @@ def construct_false_meddle_mtrl_data(material: bpy.types.Material) -> Optional[D
         logger.error(f"Could not get ColorTable property from material: {material.name}")
         return None
 
-    colorset_data = []
-
     rows = meddle_color_table["ColorTable"]["Rows"]
 
     num_rows = len(rows)
@@ -421,49 +479,23 @@ def construct_false_meddle_mtrl_data(material: bpy.types.Material) -> Optional[D
         logger.error(f"Got an unexpected row count from ColorTable when constructing fake mtrl data: {num_rows}")
         return None
 
-    row_num = 0
-    for row in rows:
-        
-        tile_matrix_uu, tile_matrix_uv, tile_matrix_vu, tile_matrix_vv = row["TileMatrix"].values()
-        # Decompose the tile matrix
-        tile_transform = mtrl_handler.decompose_tile_matrix(
-            tile_matrix_uu, tile_matrix_uv, tile_matrix_vu, tile_matrix_vv
-        )
-
-        row_data = {
-            'row_number': row_num+1,
-            'group': 'A' if row_num % 2 == 0 else 'B',
-            'diffuse': [x for x in row["Diffuse"].values()],
-            'diffuse_unknown': 0.5, # (Gloss) on legacy shaders, FFGear uses it as Roughness, Meddle does not provide it
-            'specular': [x for x in row["Specular"].values()],
-            'specular_unknown': 0.5, # (Specular Power) on legacy shaders, FFGear uses it as Sheen Rate, Meddle does not provide it
-            'emissive': [x for x in row["Emissive"].values()],
-            'emissive_unknown': None,
-            'sheen_rate': row["SheenRate"],
-            'sheen_tint_rate': row["SheenTint"],
-            'sheen_aperture': row["SheenAptitude"], # May not be the correct mapping from Meddle but I think it is
-            'sheen_unknown': None,
-            'roughness': row["Roughness"],
-            'pbr_unknown': None,
-            'metalness': row["Metalness"],
-            'anisotropy_blending': row["Anisotropy"],
-            'effect_unknown_r': None,
-            'sphere_map_opacity': row["SphereMask"], # May not be the correct mapping from Meddle but I think it is
-            'effect_unknown_b': None,
-            'effect_unknown_a': None,
-            'shader_template_id': row["ShaderId"],
-            'tile_map_id': row["TileIndex"],
-            'tile_map_opacity': row["TileAlpha"],
-            'sphere_map_id': row["SphereIndex"],
-            'tile_scale_x': tile_transform['scale_x'],
-            'tile_scale_y': tile_transform['scale_y'],
-            'tile_rotation_deg': tile_transform['rotation_deg'],
-            'tile_shear_deg': tile_transform['shear_deg'],
-            'tile_matrix_raw': {'uu': tile_matrix_uu, 'uv': tile_matrix_uv, 'vu': tile_matrix_vu, 'vv': tile_matrix_vv}
-        }
+    # Anything Meddle doesn't provide stays NaN (unknown) in the table
+    colorset_data = mtrl_handler.ColorsetTable.empty(num_rows)
+    values = colorset_data.values
+    columns = mtrl_handler.COLORSET_COLUMNS
+    values[:, columns['diffuse_unknown']] = 0.5  # (Gloss) on legacy shaders, FFGear uses it as Roughness, Meddle does not provide it
+    values[:, columns['specular_unknown']] = 0.5 # (Specular Power) on legacy shaders, FFGear uses it as Sheen Rate, Meddle does not provide it
+
+    for row_num, row in enumerate(rows):
+        for meddle_key, column_names in MEDDLE_COLORTABLE_COLUMNS.items():
+            if isinstance(column_names, tuple):
+                for column_name, value in zip(column_names, row[meddle_key].values()):
+                    values[row_num, columns[column_name]] = value
+            else:
+                values[row_num, columns[column_names]] = row[meddle_key]
 
-        colorset_data.append(row_data)
-        row_num += 1
+    # Decompose the tile matrices
+    colorset_data.update_tile_transforms()
 
 
     #¤¤¤¤¤¤¤¤¤¤¤#
@@ -970,15 +1002,33 @@ MTRL_PROPERTIES = {
 }
 
 
+def _parse_mtrl_key(key: str) -> Tuple[str, Optional[int]]:
+    """Splits a key like "diffuse[0]" into ("diffuse", 0). Keys without an index give ("metalness", None)"""
+    if '[' in key:
+        base_key, index_str = key.split('[', 1)
+        return base_key, int(index_str.rstrip(']'))
+    return key, None
+
+
 # Naming it with an underscore signifies that it's just a helper function, the more you know
 def _get_value_from_row(row_data: dict, key: str, default: float) -> float:
     """Helper to get a value from a specific MTRL key within row_data."""
     if not key:
         return default
     try:
-        if '[' in key:
-            base_key, index_str = key.split('[', 1)
-            index = int(index_str.rstrip(']'))
+        base_key, index = _parse_mtrl_key(key)
+    except ValueError as e:
+        logger.warning(f"Error accessing key '{key}' in row_data: {e}. Returning default {default}.")
+        return default
+    return _get_parsed_value_from_row(row_data, key, base_key, index, default)
+
+
+def _get_parsed_value_from_row(row_data: dict, key: str, base_key: str, index: Optional[int], default: float) -> float:
+    """Same as _get_value_from_row, with the key already split up by _parse_mtrl_key (key is only for the warnings)"""
+    if not key:
+        return default
+    try:
+        if index is not None:
             container = row_data.get(base_key)
 
             # Check if container exists, is list/tuple, and index is valid
@@ -989,7 +1039,7 @@ def _get_value_from_row(row_data: dict, key: str, default: float) -> float:
                  logger.warning(f"Invalid key '{key}': Base key '{base_key}' not found, not list/tuple, or index {index} out of bounds in row_data. Returning default {default}.")
                  return default
         else:
-            value = row_data.get(key)
+            value = row_data.get(base_key)
             if value is not None:
                 return float(value)
             else:
@@ -999,124 +1049,177 @@ def _get_value_from_row(row_data: dict, key: str, default: float) -> float:
         return default
 
 
-def get_mtrl_value(
-    row_data: dict,
-    channel: ColorChannel,
-    dye_info: Optional[dict] = None,
-    template_type: Optional[StainingTemplate] = None,
-    dye_channels: Optional[Dict[int, str]] = None
-) -> float:
-    """Get a single channel value from MTRL data, handling dyes if applicable"""
-    
-    # logger.debug(f"CALL: get_mtrl_value")
+##### CHANNEL PLANS #####
+# Getting a channel's value means splitting its key, checking the template rules and so on, none of which depends on the row.
+# That's the innermost loop of a ramp update (every channel of every element of every ramp), so it's worked out once per channel
+# and template type into a plan, leaving only the row lookup and the math for every element.
 
-    effective_mtrl_key = channel.mtrl_key
-    value: Optional[float] = None
+@dataclass(frozen=True)
+class ChannelPlan:
+    """A ColorChannel with its template rules already applied for one template type, see compile_channel_plan"""
+    key: str                            # Key to read, after change_key/force_value. Only kept for the warnings
+    base_key: str                       # key split up by _parse_mtrl_key
+    index: Optional[int]
+    default: float
+    forced_value: Optional[float]       # Numeric force_value, the rest of the plan is skipped if this is set
+    dye_property: Optional[str]         # Property to take from the row's resolved dyes, None if the channel can't be dyed
+    transforms: Tuple[Any, ...] = ()    # Functions applied to the value in order (add, subtract, expression, scale_factor, min_value, max_value)
 
-    # Cache base_property and index calculations
-    base_property = effective_mtrl_key.split('[')[0] if '[' in effective_mtrl_key else effective_mtrl_key
-    index = None
-    if '[' in effective_mtrl_key:
-        index = int(effective_mtrl_key.split('[')[1].rstrip(']'))
 
-    # Unsure about what's happening here? Valid for what
-    valid = True if template_type and channel.template_rules and template_type in channel.template_rules else False
+@dataclass(frozen=True)
+class PropertyPlan:
+    """Channel plans of an MtrlProperty for one template type"""
+    channels: Tuple[ChannelPlan, ChannelPlan, ChannelPlan, ChannelPlan] # r, g, b, a
+    is_color: bool
+    dye_check_properties: Tuple[str, ...] # Properties whose dyes can change this ramp, for skipping elements that don't need updating
 
-    # Check template rules first
-    if valid:
-        rules = channel.template_rules[template_type]
-        
-        if "change_key" in rules:
-            effective_mtrl_key = rules["change_key"]
-            # After changing key, update base_property and index
-            base_property = effective_mtrl_key.split('[')[0] if '[' in effective_mtrl_key else effective_mtrl_key
-            index = None
-            if '[' in effective_mtrl_key:
-                index = int(effective_mtrl_key.split('[')[1].rstrip(']'))
-
-        # Check for forced value (can be number or another key)
-        if "force_value" in rules:
-            forced = rules["force_value"]
-            if isinstance(forced, (int, float)):
-                return float(forced) # Return with forced numeric value
-            elif isinstance(forced, str):
-                # Force value is another key, look that one up instead
-                # Use the original channel's default if the forced key isn't found
-                return _get_value_from_row(row_data, forced, channel.default)
-            else:
-                 logger.warning(f"Template rule 'force_value' has unexpected type: {type(forced)}. Ignoring.")
-
-    # Since we didn't override the value, get base value from MTRL data
-    # logger.debug(f"Material Key: {effective_mtrl_key}")
-    value = _get_value_from_row(row_data, effective_mtrl_key, channel.default)
-
-    # Apply dye modifications if needed (uses mtrl_key)
-    if channel.can_be_dyed and dye_info and dye_channels:
-        for channel_num, dye_id in dye_channels.items():
-            if dye_id != '0': # 0 meaning "No Dye"
-                if stm_utils.should_apply_dye(dye_info, base_property, channel_num):
-                    modified = stm_utils.get_modified_value(dye_info, base_property, dye_id)
-                    if modified is not None:
-                        # If we got back a list, extract the appropriate component
-                        if isinstance(modified, (list, tuple)):
-                            # Use cached index if available
-                            if index is not None:
-                                value = modified[index]
-                            else:
-                                value = modified[0]  # Default to first component if no index
-                        else:
-                            value = modified
 
-    # Apply template modifiers if any
-    if valid:
-        rules = channel.template_rules[template_type]
-        
-        if "add" in rules:
-            value += rules["add"]
+def _make_expression_transform(expression, key: str):
+    def transform(value: float) -> float:
+        try:
+            # Pass the current value as the argument 'x'
+            return float(expression(value))
+        except Exception as e:
+            logger.error(f"Error executing lambda expression for key '{key}' with x={value}: {e}", exc_info=True)
+            return value # Keep value before error
+    return transform
 
-        if "subtract" in rules:
-            value -= rules["subtract"]
 
-        if "expression" in rules:
-            expression_func = rules["expression"]
-            # Check if it's a callable function (like a lambda)
-            if callable(expression_func):
-                try:
-                    # Pass the current value as the argument 'x'
-                    value = float(expression_func(value))
-                except Exception as e:
-                    logger.error(f"Error executing lambda expression for key '{effective_mtrl_key}' with x={value}: {e}", exc_info=True)
-                    # Keep value before error
-            else:
-                logger.warning(f"Rule 'expression' for key '{effective_mtrl_key}' is not callable (expected lambda/function), ignoring.")
+def compile_channel_plan(channel: ColorChannel, template_type: Optional[StainingTemplate]) -> ChannelPlan:
+    """
+    Works out everything about getting a channel's value that doesn't depend on the row, see evaluate_channel_plan.
 
-        if "scale_factor" in rules:
-            value *= rules["scale_factor"]
-            
-        if "min_value" in rules:
-            value = max(value, rules["min_value"])
-            
-        if "max_value" in rules:
-            value = min(value, rules["max_value"])
+    Args:
+        channel (ColorChannel): The channel to compile.
+        template_type (StainingTemplate, optional): Which template's rules to apply. None applies none of them.
 
+    Returns:
+        ChannelPlan: The compiled channel.
+    """
+    rules = channel.template_rules.get(template_type, {}) if template_type and channel.template_rules else {}
+    key = rules.get("change_key", channel.mtrl_key)
+
+    forced = rules.get("force_value")
+    if forced is not None:
+        if isinstance(forced, (int, float)):
+            return ChannelPlan(key, *_parse_mtrl_key(key), channel.default, float(forced), None)
+        elif isinstance(forced, str):
+            # Force value is another key, it's read as is (no dye or modifiers)
+            base_key, index = _parse_mtrl_key(forced)
+            return ChannelPlan(forced, base_key, index, channel.default, None, None)
+        else:
+            logger.warning(f"Template rule 'force_value' has unexpected type: {type(forced)}. Ignoring.")
+
+    base_key, index = _parse_mtrl_key(key)
+
+    transforms = []
+    if "add" in rules:
+        transforms.append(lambda value, amount=rules["add"]: value + amount)
+    if "subtract" in rules:
+        transforms.append(lambda value, amount=rules["subtract"]: value - amount)
+    if "expression" in rules:
+        if callable(rules["expression"]):
+            transforms.append(_make_expression_transform(rules["expression"], key))
+        else:
+            logger.warning(f"Rule 'expression' for key '{key}' is not callable (expected lambda/function), ignoring.")
+    if "scale_factor" in rules:
+        transforms.append(lambda value, factor=rules["scale_factor"]: value * factor)
+    if "min_value" in rules:
+        transforms.append(lambda value, minimum=rules["min_value"]: max(value, minimum))
+    if "max_value" in rules:
+        transforms.append(lambda value, maximum=rules["max_value"]: min(value, maximum))
+
+    return ChannelPlan(key, base_key, index, channel.default, None, base_key if channel.can_be_dyed else None, tuple(transforms))
+
+
+def evaluate_channel_plan(plan: ChannelPlan, row_data: dict, row_dyes: Optional[Dict[str, object]] = None) -> float:
+    """
+    Gets a channel's value for one row: the MTRL value (or forced value), replaced by the dye if one applies, then the template rule modifiers.
+
+    Args:
+        plan (ChannelPlan): The compiled channel.
+        row_data (dict): The colorset row.
+        row_dyes (dict, optional): The row's dyed properties from stm_utils.resolve_dyes (see ResolvedDyes.get_row), if it has any.
+    """
+    if plan.forced_value is not None:
+        return plan.forced_value
+    value = _get_parsed_value_from_row(row_data, plan.key, plan.base_key, plan.index, plan.default)
+
+    if plan.dye_property is not None and row_dyes:
+        modified = row_dyes.get(plan.dye_property)
+        if modified is not None:
+            if isinstance(modified, (list, tuple)):
+                value = modified[plan.index] if plan.index is not None else modified[0]
+            else:
+                value = modified
+
+    for transform in plan.transforms:
+        value = transform(value)
     return value
 
 
+def compile_property_plan(property_def: MtrlProperty, template_type: Optional[StainingTemplate]) -> PropertyPlan:
+    """Compiles every channel of an MtrlProperty, see compile_channel_plan"""
+    channels = property_def.channels
+    dye_check_properties = []
+    for c_key in ('r', 'g', 'b', 'a'):
+        channel_def = channels.get(c_key)
+        if channel_def and channel_def.can_be_dyed:
+            # change_key is the only rule that changes which dye applies, a forced value is still updated along with its dye
+            rules = channel_def.template_rules.get(template_type, {}) if template_type and channel_def.template_rules else {}
+            base_property = _parse_mtrl_key(rules.get("change_key", channel_def.mtrl_key))[0]
+            if base_property not in dye_check_properties:
+                dye_check_properties.append(base_property)
+    return PropertyPlan(
+        channels=tuple(compile_channel_plan(channels[c_key], template_type) for c_key in ('r', 'g', 'b', 'a')),
+        is_color=any(channel.is_color for channel in channels.values()),
+        dye_check_properties=tuple(dye_check_properties)
+    )
+
+
+# Compiled MTRL_PROPERTIES by template type, {template type: {node label prefix: PropertyPlan}}. MTRL_PROPERTIES never changes, so these don't either
+_property_plans: Dict[Optional[StainingTemplate], Dict[str, PropertyPlan]] = {}
+
+def get_property_plans(template_type: Optional[StainingTemplate]) -> Dict[str, PropertyPlan]:
+    """Every property in MTRL_PROPERTIES compiled for a template type, by node label prefix ("Ramp 1", ...). Compiled the first time it's asked for"""
+    plans = _property_plans.get(template_type)
+    if plans is None:
+        plans = {prop.node_label: compile_property_plan(prop, template_type) for prop in MTRL_PROPERTIES.values()}
+        _property_plans[template_type] = plans
+    return plans
+
+
+##### UNCHANGED RAMP VALUES #####
+# Writing element.color dirties the node tree (and can make the shader recompile) even if the value didn't change,
+# which it often doesn't when switching between dyes, so update_color_ramps only writes elements whose current value is actually different.
+_ramp_update_stats = {'written': 0, 'unchanged': 0} # Of the last update_color_ramps call, see get_last_ramp_update_stats
+RAMP_VALUE_TOLERANCE = 1e-6 # Differences below this don't count as a change, the ramps store float32 anyway
+
+
+def _ramp_colors_match(current: Tuple[float, ...], color: Tuple[float, ...]) -> bool:
+    return all(abs(old - new) <= RAMP_VALUE_TOLERANCE for old, new in zip(current, color))
+
+
+def get_last_ramp_update_stats() -> Dict[str, int]:
+    """How many ramp elements the last update_color_ramps call wrote, and how many it left alone because their value didn't change"""
+    return dict(_ramp_update_stats)
+
+
 def update_color_ramp_values(
         element,
         row_data: dict,
-        property_def: MtrlProperty,
-        dye_info: Optional[dict] = None,
-        template_type: Optional[StainingTemplate] = None,
-        dye_channels: Optional[Dict[int, str]] = None) -> None:
-    """Update color ramp element with values from a single row"""
-    channels = property_def.channels
-    is_color = any([channel[1].is_color for channel in channels.items()])
-    # Use list comprehension to build the color array quickly
-    rec709_color = mathutils.Color([get_mtrl_value(row_data, channels[channel], dye_info, template_type, dye_channels)
-                                    for channel in ('r', 'g', 'b')])
+        property_plan: PropertyPlan,
+        row_dyes: Optional[Dict[str, object]] = None) -> bool:
+    """Update color ramp element with values from a single row.
+    If the element already has the new value (within RAMP_VALUE_TOLERANCE), nothing is written.
+    Returns True if the element was written, False if it was left alone."""
+    r_plan, g_plan, b_plan, a_plan = property_plan.channels
+    rec709_color = mathutils.Color((evaluate_channel_plan(r_plan, row_data, row_dyes),
+                                    evaluate_channel_plan(g_plan, row_data, row_dyes),
+                                    evaluate_channel_plan(b_plan, row_data, row_dyes)))
     # Alpha separately since mathutils.Color does not handle Alpha
-    alpha = get_mtrl_value(row_data, channels['a'], dye_info, template_type, dye_channels) 
+    alpha = evaluate_channel_plan(a_plan, row_data, row_dyes)
+    is_color = property_plan.is_color
     # Convert to scene linear, if the user isn't using rec.709
     # the from_rec709_linear_to_scene_linear() function should have existed for a while (like 3.2 or something, i see it in the 4.2 LTS documentation at least), I could check to make sure but I don't want to spend time doing that in this function
     # if hasattr(color, 'from_rec709_linear_to_scene_linear'):
@@ -1124,8 +1227,12 @@ def update_color_ramp_values(
         scene_linear_color = rec709_color.from_rec709_linear_to_scene_linear()
     else:
         scene_linear_color = rec709_color # It's data, don't do any conversions on it.
+    color = (*scene_linear_color, alpha)
+    if _ramp_colors_match(tuple(element.color), color):
+        return False
     # Assign the converted color
-    element.color = (*scene_linear_color, alpha)
+    element.color = color
+    return True
 
 
 # Could pass some data into the sub-functions for a little bit of extra speed
@@ -1183,23 +1290,43 @@ def update_color_ramps(material:bpy.types.Material, mtrl_data:dict, hard_reset=F
         # Used to skip steps later on
         is_created = material.ffgear.is_created
 
+        # Elements that would get the value they already have aren't written, these count how many were
+        written_count = 0
+        unchanged_count = 0
+
         # Personally mapped values that should be closer to the exact breaking points of the textures. Put just to the left of the breaking point of the Picto 100 Top's texture but they could vary a little so constant interpolation is probably still bad.
         custom_ramp_positions = [0, 0.0703, 0.1328, 0.2031, 0.2656, 0.3359, 0.3984, 0.4687, 0.5312, 0.5976, 0.6640, 0.7304, 0.7968, 0.8632, 0.9296, 1] # 16 values total
 
         # --- Pre-process colorset data ---
         # Group rows by the 'group' key for O(1) lookup later, instead of O(N) filtering per node.
-        # It's just each row put in a dict as a list under its group as the key. {"A": [row data], "B": [row data]}
+        # It's just each row (and its index in the colorset) put in a dict as a list under its group as the key. {"A": [(0, row data)], "B": [(1, row data)]}
         grouped_mtrl_data = collections.defaultdict(list)
-        for row in mtrl_data['colorset_data']:
+        for row_index, row in enumerate(mtrl_data['colorset_data']):
             group_key = row.get('group') # "A" or "B"
             if group_key is not None:
-                 grouped_mtrl_data[group_key].append(row)
+                 grouped_mtrl_data[group_key].append((row_index, row))
             else:
                  logger.warning(f"Row found without 'group' key in colorset_data: {row}")
 
+        # --- Look up the dyes of every row at once ---
+        # Rather than once per channel, per row, per ramp. None means no row gets dyed (no dye data, or the STM file couldn't be loaded)
+        all_row_dyes = None
+        row_dye_info = [row.get('dye') or {} for row in mtrl_data['colorset_data']]
+        if any(row_dye_info):
+            resolved_dyes = stm_utils.resolve_dyes(
+                [dye.get('template', 0) for dye in row_dye_info],
+                [dye.get('channel', 0) for dye in row_dye_info],
+                dye_channels,
+                template_type,
+                [dye.get('flags', 0) for dye in row_dye_info]
+            )
+            if resolved_dyes is not None:
+                all_row_dyes = [resolved_dyes.get_row(row_index) for row_index in range(len(row_dye_info))]
+
         # List comprehension should be faster than doing it in the for loop?
         nodes_to_process = [node for node in material.node_tree.nodes if node.type == 'VALTORGB'] # All color ramp nodes
         prop_map_by_prefix = {prop.node_label: prop for prop in MTRL_PROPERTIES.values()} # Prefix being "Ramp 1", "Ramp 2", etc.
+        plans_by_prefix = get_property_plans(template_type) # Same prefixes, MTRL_PROPERTIES already compiled for this template type
 
         ########## END INITIAL SETUP ##########
 
@@ -1220,6 +1347,7 @@ def update_color_ramps(material:bpy.types.Material, mtrl_data:dict, hard_reset=F
             if not prop_def:
                 logger.debug(f"No matching MTRL property found for node '{node_label}'")
                 continue
+            property_plan = plans_by_prefix[prop_def.node_label]
 
             # Get group (string, A or B)
             if '(Group ' not in node_label:
@@ -1258,8 +1386,7 @@ def update_color_ramps(material:bpy.types.Material, mtrl_data:dict, hard_reset=F
             
             ##### LOOP OVER ALL THE ROWS, UPDATE THE RAMPS #####
             # Each row is a mtrl row, row_data in the mtrl_handler
-            debug_counter = 0
-            for i, row in enumerate(group_rows):
+            for i, (row_index, row) in enumerate(group_rows):
 
                 ##### GET DYE INFO #####
                 dye_info = None
@@ -1277,29 +1404,15 @@ def update_color_ramps(material:bpy.types.Material, mtrl_data:dict, hard_reset=F
                 if is_created and not hard_reset and use_old_elements: # only if we're gonna be working with the pre-existing 16 elements
                     update_needed_due_to_dye = False
                     if dye_info and dye_channels:
-                        # Check if *any* channel ('r', 'g', 'b', 'a') needs updating due to *any* active dye
-                        for c_key in ('r', 'g', 'b', 'a'):
-                            channel_def = prop_def.channels.get(c_key)
-                            if channel_def and channel_def.can_be_dyed:
-
-                                # Figure out what property we're dealing with
-                                effective_mtrl_key = channel_def.mtrl_key # Start with original key
-                                # Check if template rules apply and potentially change the key
-                                valid_template = template_type and channel_def.template_rules and template_type in channel_def.template_rules
-                                if valid_template:
-                                    rules = channel_def.template_rules[template_type]
-                                    if "change_key" in rules:
-                                        effective_mtrl_key = rules["change_key"] # Update key if rule exists
-
-                                base_property = effective_mtrl_key.split('[')[0] if '[' in effective_mtrl_key else effective_mtrl_key
-
-                                # Check against active dye channels using the *correct* base_property
-                                for channel_num, dye_id in dye_channels.items():
-                                    if stm_utils.should_apply_dye(dye_info, base_property, channel_num):
-                                        update_needed_due_to_dye = True
-                                        break # Dye applies to this channel, stop checking dyes for it
-                                if update_needed_due_to_dye:
-                                    break # Dye applies to *some* channel, stop checking other channels
+                        # Check if *any* dyeable channel ('r', 'g', 'b', 'a') needs updating due to *any* active dye
+                        # (which properties those are, with change_key applied, is worked out in the property plan)
+                        for base_property in property_plan.dye_check_properties:
+                            for channel_num in dye_channels:
+                                if stm_utils.should_apply_dye(dye_info, base_property, channel_num):
+                                    update_needed_due_to_dye = True
+                                    break # Dye applies to this channel, stop checking dyes for it
+                            if update_needed_due_to_dye:
+                                break # Dye applies to *some* channel, stop checking other channels
                     
                     # If the material is created AND no dye updates are needed for this row, skip processing this element
                     if not update_needed_due_to_dye:
@@ -1325,16 +1438,19 @@ def update_color_ramps(material:bpy.types.Material, mtrl_data:dict, hard_reset=F
                 
 
                 ##### DO THE UPDATE #####
-                update_color_ramp_values(
+                if update_color_ramp_values(
                     element, # Knob on the color ramp node
                     row,
-                    prop_def,
-                    dye_info,
-                    template_type,
-                    dye_channels
-                )
-                debug_counter += 1  
-        
+                    property_plan,
+                    all_row_dyes[row_index] if all_row_dyes is not None else None
+                ):
+                    written_count += 1
+                else:
+                    unchanged_count += 1
+
+        _ramp_update_stats['written'] = written_count
+        _ramp_update_stats['unchanged'] = unchanged_count
+        logger.debug(f"Wrote {written_count} color ramp elements on \"{material.name}\", {unchanged_count} didn't change")
         return True
         
     except Exception as e:
@@ -1364,8 +1480,20 @@ def setup_image_node(nodes, filepath:str|bpy.types.Image, label:str, direct_img_
         if not direct_img_datablock:
             # Check if image is already loaded
             image_name = os.path.basename(filepath)
+            is_tex = filepath.lower().endswith('.tex')
+            if is_tex:
+                prefs = get_addon_preferences()
+                mip_level = prefs.tex_mip_level if prefs else 0
+                if mip_level:
+                    image_name = f"{image_name} (mip {mip_level})" # Don't reuse a full size image for a smaller one or the other way around
             img = bpy.data.images.get(image_name)
-            if not img:
+            if not img and is_tex:
+                # Game texture, decode it straight into a new image (packed when the file is saved)
+                img = tex_reader.load_tex_image(filepath, image_name, mip_level=mip_level)
+                if not img:
+                    logger.error(f"Error loading texture {filepath}")
+                    return node
+            elif not img:
                 filepath = helpers.safe_filepath(filepath) # This will help the image LOAD, but cycles will not like it. The image has to be packed.
                 try:
                     # Load new image
@@ -1388,6 +1516,14 @@ def setup_image_node(nodes, filepath:str|bpy.types.Image, label:str, direct_img_
     return node
 
 
+@persistent
+def pack_tex_images_before_save(*args):
+    """save_pre handler: images decoded from .tex files only exist in memory, so the ones still in use are packed into the .blend file"""
+    packed_count = tex_reader.pack_tex_images()
+    if packed_count:
+        logger.debug(f"Packed {packed_count} images made from .tex files")
+
+
 def cleanup_duplicate_node_groups(material, hard_reset):
     """
     Check material for numbered node groups and replace with original versions if they exist.
@@ -1637,7 +1773,7 @@ def create_ffgear_material(source_material:bpy.types.Material, local_template_ma
         # Update color ramps and Material Flags if MTRL file is specified
         if template_mat.ffgear.mtrl_filepath or false_mtrl_data:
             mtrl_filepath = bpy.path.abspath(template_mat.ffgear.mtrl_filepath)
-            mtrl_data = mtrl_handler.read_mtrl_file(mtrl_filepath)
+            mtrl_data = mtrl_handler.get_mtrl_data(mtrl_filepath)
             if not mtrl_data:
                 mtrl_data = false_mtrl_data # Use false data constructed from meddle properties on the material, not ideal
                 false_mtrl_data_is_used = True
@@ -1649,17 +1785,10 @@ def create_ffgear_material(source_material:bpy.types.Material, local_template_ma
                 false_colorset_data = false_mtrl_data.get('colorset_data')
                 if real_colorset_data and false_colorset_data:
                     if len(real_colorset_data) == len(false_colorset_data):
-                        combined_colorset_data:List[Dict[str,Any]] = []
-                        combined_colorset_data = real_colorset_data # By default, have the data be what we got from the MTRL file (there's more there)
-                        for i, false_row in enumerate(false_colorset_data):
-                            for false_key in false_row:
-                                false_value = false_row[false_key]
-                                if false_value != None:
-                                    combined_colorset_data[i][false_key] = false_value # As long as there exists a value in the false data, use it instead
-                            # Remove the dye info because it causes issues somewhere in update_color_ramps. I have not looked into exactly *why*
-                            if combined_colorset_data[i].get('dye'):
-                                del combined_colorset_data[i]['dye']
-                        mtrl_data['colorset_data'] = combined_colorset_data
+                        # Every known value in the false data replaces the real one (there's more in the real data, so it's the base)
+                        # The dye info is dropped because it causes issues somewhere in update_color_ramps. I have not looked into exactly *why*
+                        # overlay() returns a new table, the real one is left untouched.
+                        mtrl_data['colorset_data'] = real_colorset_data.overlay(false_colorset_data)
                     else:
                         logger.error(f"real and false colorset_data have different lengths ({len(real_colorset_data)} vs {len(false_colorset_data)}), and they won't be combined. Material: {template_mat.name}")
                 else:
@@ -2143,7 +2272,8 @@ class FFGearFetchMtrlTextures(Operator):
             diffuse_tex, mask_tex, norm_tex, id_tex = find_textures_from_mtrl(
                 self.search_data, 
                 Path(self.directory),
-                recursive=True
+                recursive=True,
+                index=mtrl_index.get_mtrl_index(self.directory, refresh=True) # One walk of the folder instead of one per texture name
             )
             
             # Count found textures
@@ -2172,8 +2302,8 @@ class FFGearFetchMtrlTextures(Operator):
             logger.debug(f'Tried auto-detecting a path to check for textures in but couldn\'t find one with "\\cache\\".')
         
         try:
-            # Read MTRL data
-            mtrl_data = mtrl_handler.read_mtrl_file(mtrl_filepath)
+            # Read MTRL data. Only the texture paths are needed, so the colorset is left undecoded
+            mtrl_data = mtrl_handler.peek_mtrl(mtrl_filepath)
             
             if not mtrl_data:
                 self.report({'ERROR'}, "Failed to read MTRL file")
@@ -2184,10 +2314,12 @@ class FFGearFetchMtrlTextures(Operator):
                 return {'FINISHED'}
             
             # Try local directory first, but starting at "cache" if that exists in the path
+            search_dir = Path(chache_dir) if chache_dir else mtrl_directory
             diffuse_tex, mask_tex, norm_tex, id_tex = find_textures_from_mtrl(
                 mtrl_data,
-                Path(chache_dir) if chache_dir else mtrl_directory,
-                recursive=True
+                search_dir,
+                recursive=True,
+                index=mtrl_index.get_mtrl_index(str(search_dir), refresh=True) # One walk of the folder instead of one per texture name
             )
 
             found_count = sum(1 for x in (diffuse_tex, mask_tex, norm_tex, id_tex) if x)
@@ -2387,6 +2519,7 @@ class FFGearMeddleSetup(Operator):
 
     # Dictionary to store found MTRL files
     mtrl_cache = {}
+    cache_index = None
     
     first_execution = True
 
@@ -2412,24 +2545,23 @@ class FFGearMeddleSetup(Operator):
             dictionary: A cache of all found relevant mtrl-files. The key is the name of the file while the value is the full filepath.
         """
         if not self.mtrl_cache:
-            equipment_dir = Path(cache_dir) / "chara" / "equipment"
-            accessory_dir = Path(cache_dir) / "chara" / "accessory"
-            weapon_dir = Path(cache_dir) / "chara" / "weapon" # Weapon shaders and materials have not been tested much
-            
-            # Search recursively for all .mtrl files in EQUIPMENT FOLDER
-            for mtrl_file in equipment_dir.rglob("*.mtrl"):
-                self.mtrl_cache[mtrl_file.name] = str(mtrl_file)
-
-            # Search recursively for all .mtrl files in ACCESSORY FOLDER
-            for mtrl_file in accessory_dir.rglob("*.mtrl"):
-                self.mtrl_cache[mtrl_file.name] = str(mtrl_file)
-
-            # Search recursively for all .mtrl files in WEAPON FOLDER
-            for mtrl_file in weapon_dir.rglob("*.mtrl"):
-                self.mtrl_cache[mtrl_file.name] = str(mtrl_file)
+            index = self.get_mtrl_index(cache_dir)
+            # Equipment, then accessories, then weapons (weapon shaders and materials have not been tested much). Later ones win if names collide.
+            for search_dir in (os.path.join(index.root, "chara", "equipment"), os.path.join(index.root, "chara", "accessory"), os.path.join(index.root, "chara", "weapon")):
+                search_dir = os.path.join(search_dir, '')
+                for mtrl_name, mtrl_paths in index.by_file_name.items():
+                    for mtrl_path in mtrl_paths:
+                        if mtrl_path.startswith(search_dir):
+                            self.mtrl_cache[mtrl_name] = mtrl_path
                 
             logger.debug(f"Found {len(self.mtrl_cache)} MTRL files in cache")
 
+    def get_mtrl_index(self, cache_dir):
+        """The index of the Meddle cache folder, built (or refreshed) the first time it's needed in each run"""
+        if self.cache_index is None:
+            self.cache_index = mtrl_index.get_mtrl_index(str(cache_dir), refresh=True)
+        return self.cache_index
+
     # Good, Only used for old meddle exports
     def find_mtrl_file(self, cache_dir, material_name):
         """Find corresponding MTRL file in Meddle cache""" # OLD METHOD
@@ -2445,6 +2577,27 @@ class FFGearMeddleSetup(Operator):
 
         return self.mtrl_cache.get(mtrl_name)
 
+    def prefetch_mtrl_files(self, materials):
+        """
+        Parses the MTRL files of all the given materials in parallel before any of them are created,
+        so create_ffgear_material gets them straight from the mtrl_handler cache instead of reading them one by one.
+        Failures are only logged here, the normal per-material processing reports them properly.
+        """
+        mtrl_paths = []
+        for material in materials:
+            if "MtrlCachePath" in material:
+                mtrl_paths.append(bpy.path.abspath(os.path.join(self.directory, material["MtrlCachePath"])))
+            else:
+                mtrl_path = self.find_mtrl_file(self.directory, material.name)
+                if mtrl_path:
+                    mtrl_paths.append(bpy.path.abspath(mtrl_path))
+
+        results = mtrl_handler.read_mtrl_files(mtrl_paths)
+        failed = [path for path, (mtrl_data, error) in results.items() if mtrl_data is None]
+        logger.debug(f"Prefetched {len(results) - len(failed)} of {len(results)} MTRL files")
+        for path in failed:
+            logger.debug(f"Could not prefetch {path}: {results[path][1]}")
+
     # Much like create_ffgear_material works in the normal material processing, except before it calls create_ffgear_material it automatically sets up other things from meddle
     def process_meddle_material(self, material, local_template_material, hard_reset=False):
         """Process a single material with Meddle setup"""
@@ -2472,14 +2625,15 @@ class FFGearMeddleSetup(Operator):
         # If we couldn't get them using the modern meddle data method, try the old method
         if diffuse_tex_path == None and id_tex_path == None and mask_tex_path == None and norm_tex_path == None and mtrl_path:
             logger.warning(f"Failed to get texture paths from custom material properties on {material.name}, serching disk instead.")
-            # Read MTRL data and find textures using shared function
-            mtrl_data = mtrl_handler.read_mtrl_file(mtrl_path)
+            # Read MTRL data and find textures using shared function (only the texture paths are needed, so just peek at it)
+            mtrl_data = mtrl_handler.peek_mtrl(mtrl_path)
             if not mtrl_data:
                 return False, "Failed to read MTRL file", None
             diffuse_tex_path, mask_tex_path, norm_tex_path, id_tex_path = find_textures_from_mtrl(
                 mtrl_data, 
                 Path(self.directory),
-                recursive=True
+                recursive=True,
+                index=self.get_mtrl_index(self.directory)
             )
 
         if diffuse_tex_path == None and id_tex_path == None and mask_tex_path == None and norm_tex_path == None:
@@ -2527,6 +2681,7 @@ class FFGearMeddleSetup(Operator):
             
             # Clear the cache at the start of execution
             self.mtrl_cache.clear()
+            self.cache_index = None
             
             # First, collect all materials from selected objects that we want to process
             source_materials = set()
@@ -2563,6 +2718,9 @@ class FFGearMeddleSetup(Operator):
                 self.report({'WARNING'}, "No valid materials found to process")
                 return {'CANCELLED'}
             
+            # Parse all the MTRL files up front, in parallel, before any datablocks are touched
+            self.prefetch_mtrl_files(material_mapping.keys())
+
             # Process materials
             processed, skipped = process_shared_materials(
                 material_mapping,
@@ -2736,8 +2894,8 @@ class FFGearUpdateDyedRamps(Operator):
         mtrl_filepath = bpy.path.abspath(material.ffgear.mtrl_filepath)
 
         try:
-            # Read MTRL data
-            mtrl_data = mtrl_handler.read_mtrl_file(mtrl_filepath)
+            # Read MTRL data (cached, this runs on every dye change)
+            mtrl_data = mtrl_handler.get_mtrl_data(mtrl_filepath)
 
             if not mtrl_data:
                 logger.error(f"Failed to read MTRL file for {material.name}")
@@ -2770,13 +2928,16 @@ class FFGearUpdateDyedRamps(Operator):
         
         total_mats = len(mats_to_update)
         successes = 0
+        written_elements = 0
         for mat in mats_to_update:
             try:
-                successes += 1 if self.perform_update_on_material(mat, self.hard_reset) else 0 # Does this syntax work? It seems to
+                if self.perform_update_on_material(mat, self.hard_reset):
+                    successes += 1
+                    written_elements += get_last_ramp_update_stats()['written']
             except Exception as e:
                 logger.exception(f"Exception when updating color ramps for {mat.name}: {e}")
         if successes == total_mats:
-            self.report({'INFO'}, "Color ramps updated successfully")
+            self.report({'INFO'}, f"Color ramps updated successfully ({written_elements} elements changed)")
             return {'FINISHED'}
         else:
             self.report({'ERROR'}, f"Failed to update color ramps for at least one material in {mats_to_update}")
@@ -2990,8 +3151,12 @@ def register():
     bpy.utils.register_class(FFGearGetDyesFromMeddle)
     bpy.utils.register_class(FFGearUseMeddleColorData)
     bpy.utils.register_class(FFGearOffsetAlongNormals)
+    if pack_tex_images_before_save not in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.append(pack_tex_images_before_save)
 
 def unregister():
+    if pack_tex_images_before_save in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.remove(pack_tex_images_before_save)
     bpy.utils.unregister_class(FFGearOffsetAlongNormals)
     bpy.utils.unregister_class(FFGearUseMeddleColorData)
     bpy.utils.unregister_class(FFGearGetDyesFromMeddle)
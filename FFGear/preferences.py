@@ -1,8 +1,11 @@
 import bpy
+import os
 from bpy.types import AddonPreferences
-from bpy.props import StringProperty, EnumProperty, BoolProperty
+from bpy.props import StringProperty, EnumProperty, BoolProperty, IntProperty
 from . import icons
 from . import helpers
+from . import mtrl_handler
+from . import stm_utils
 from . import auto_updating
 import logging
 
@@ -17,6 +20,51 @@ logger.setLevel(logging.INFO)
 repo_release_url = "https://api.github.com/repos/kajupe/FFGear/releases/latest"
 repo_release_download_url = "https://github.com/kajupe/FFGear/releases"
 
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# FUNCTIONS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def get_user_cache_dir(name: str) -> str:
+    """Gets (and creates) a directory for cached data that's kept between sessions"""
+    try:
+        return bpy.utils.extension_path_user(__package__, path=name, create=True)
+    except ValueError: # Not installed as an extension
+        return bpy.utils.user_resource('CONFIG', path=os.path.join("ffgear", name), create=True)
+
+
+def apply_mtrl_disk_cache_settings(prefs) -> None:
+    """Turns the on-disk MTRL cache on or off to match the preferences"""
+    if prefs.use_mtrl_disk_cache:
+        mtrl_handler.configure_mtrl_disk_cache(get_user_cache_dir("mtrl_cache"), prefs.mtrl_disk_cache_size_mb * 1024 * 1024)
+    else:
+        mtrl_handler.configure_mtrl_disk_cache(None)
+
+
+def update_mtrl_disk_cache(self, context):
+    apply_mtrl_disk_cache_settings(self)
+
+
+def start_stm_warm_up():
+    """Timer: starts loading the dye files in the background, then keeps checking on it so they're handed over on the main thread"""
+    stm_utils.start_stm_warm_up()
+    if not bpy.app.timers.is_registered(collect_stm_warm_up):
+        bpy.app.timers.register(collect_stm_warm_up, first_interval=0.1)
+    return None # Don't repeat
+
+
+def collect_stm_warm_up():
+    """Timer: hands the dye files the warm-up loaded over to stm_utils, until it's done"""
+    if stm_utils.collect_stm_warm_up():
+        logger.debug("STM warm-up done")
+        return None
+    return 0.1
+
+
+def update_stm_warm_up(self, context):
+    if self.warm_up_stm_files and not bpy.app.timers.is_registered(start_stm_warm_up):
+        bpy.app.timers.register(start_stm_warm_up, first_interval=0.1)
+
+
 #¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
 # PREFERENCES
 #¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
@@ -48,6 +96,43 @@ class FFGEAR_AddonPreferences(AddonPreferences):
         description="Select the default directory for the \"Auto Meddle Setup\" operator"
     )
 
+    use_mtrl_disk_cache: BoolProperty(
+        name="Keep MTRL Cache on Disk",
+        description="Saves parsed .mtrl files in a cache folder, so they don't need to be read and parsed again after restarting Blender. Useful if your Meddle exports are on a slow or network drive",
+        default=False,
+        update=update_mtrl_disk_cache,
+    )
+
+    mtrl_disk_cache_size_mb: IntProperty(
+        name="Max Cache Size (MB)",
+        description="The oldest cached files are deleted once the MTRL cache folder grows past this size",
+        default=128,
+        min=1,
+        soft_max=2048,
+        update=update_mtrl_disk_cache,
+    )
+
+    prefer_tex_files: BoolProperty(
+        name="Load Game Textures Directly",
+        description="If the Meddle cache has the game's own .tex files next to the PNGs, load those instead. Skips the PNG copies, but the images that are still used get packed into the .blend file when it's saved. The .tex files are always used when a PNG is missing",
+        default=False,
+    )
+
+    tex_mip_level: IntProperty(
+        name="Texture Mip Level",
+        description="Which mip level to load from .tex files. 0 is the full resolution, every level above that halves it, which loads faster and uses less memory. This is the only copy of the image, so renders use the lower resolution too",
+        default=0,
+        min=0,
+        max=6,
+    )
+
+    warm_up_stm_files: BoolProperty(
+        name="Load Dye Data in Background",
+        description="Loads the dye template files on a background thread shortly after the addon starts, so the first dye change doesn't stutter",
+        default=False,
+        update=update_stm_warm_up,
+    )
+
     spheen: BoolProperty(
         name="Sphere",
         description="Queen Spheen",
@@ -65,6 +150,12 @@ class FFGEAR_AddonPreferences(AddonPreferences):
             col.prop(self, "disable_update_notif")
         col.prop(self, "disable_meteor_icon")
         col.prop(self, "default_meddle_import_path")
+        col.prop(self, "use_mtrl_disk_cache")
+        if self.use_mtrl_disk_cache:
+            col.prop(self, "mtrl_disk_cache_size_mb")
+        col.prop(self, "prefer_tex_files")
+        col.prop(self, "tex_mip_level")
+        col.prop(self, "warm_up_stm_files")
 
         # INFO
         # Informational text block
@@ -125,5 +216,13 @@ def register():
     if not prefs.disable_update_checking:
         bpy.app.timers.register(helpers.get_addon_version_and_latest, first_interval=2) # 2 second delay to avoid startup instability and update crashing
 
+    apply_mtrl_disk_cache_settings(prefs)
+    if prefs.warm_up_stm_files:
+        bpy.app.timers.register(start_stm_warm_up, first_interval=2) # Same delay as the update check, stm_utils is registered by then
+
 def unregister():
+    for timer in (start_stm_warm_up, collect_stm_warm_up):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+    mtrl_handler.configure_mtrl_disk_cache(None)
     bpy.utils.unregister_class(FFGEAR_AddonPreferences)
\ No newline at end of file
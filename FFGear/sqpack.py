@@ -0,0 +1,490 @@
+import os
+import re
+import mmap
+import zlib
+import struct
+import threading
+import logging
+import numpy as np
+from . import helpers
+from . import mtrl_handler
+from typing import List, Optional, Dict, Any, Tuple, NamedTuple
+
+logging.basicConfig()
+logger = logging.getLogger('FFGear.sqpack')
+logger.setLevel(logging.INFO)
+
+###¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤###
+### Layouts follow Lumina and the xiv.dev SqPack docs                                          ###
+### https://github.com/NotAdam/Lumina                                                          ###
+###¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤###
+
+##### WHAT THIS IS #####
+# Reads files straight out of the game's own SqPack archives (game/sqpack/ffxiv/040000.win32.index, .dat0 etc),
+# so a game path like "chara/equipment/e0737/material/v0001/mt_c0201e0737_dwn_a.mtrl" can be turned into the file's bytes
+# without Meddle having dumped it to a cache folder first.
+# Every category (chara, bg, ...) has one or more index files, which are sorted hash tables pointing into the dat files.
+# Standard files (mtrl, etc) and textures are supported, models aren't since FFGear never needs them.
+# Nothing in the addon reads from it yet, so __init__.py doesn't import or register it. That goes in together with whatever uses it.
+########################
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DEFINITIONS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+SQPACK_MAGIC = b'SqPack\0\0'
+PLATFORM = 'win32'
+
+# The first folder of a game path decides which index/dat files it's in
+CATEGORY_IDS = {
+    'common': 0x00,
+    'bgcommon': 0x01,
+    'bg': 0x02,
+    'cut': 0x03,
+    'chara': 0x04,
+    'shader': 0x05,
+    'ui': 0x06,
+    'sound': 0x07,
+    'vfx': 0x08,
+    'ui_script': 0x09,
+    'exd': 0x0A,
+    'game_script': 0x0B,
+    'music': 0x0C,
+    'sqpack_test': 0x12,
+    'debug': 0x13,
+}
+
+# What's at the start of every file entry in a dat
+FILE_TYPE_EMPTY = 1
+FILE_TYPE_STANDARD = 2
+FILE_TYPE_MODEL = 3
+FILE_TYPE_TEXTURE = 4
+
+# Precompiled binary layouts
+SQPACK_HEADER_SIZE_STRUCT = struct.Struct('<I')        # at 0x0C, size of the SqPack header (always 0x400 but who knows)
+INDEX_SEGMENT_STRUCT = struct.Struct('<II')            # offset, size. The hash table one is at 0x08 in the index header
+INDEX_DATA_FILE_COUNT_OFFSET = 0x50                    # From the start of the index header
+INDEX_SYNONYM_SEGMENT_OFFSET = 0x54
+FILE_INFO_STRUCT = struct.Struct('<IIIIII')            # header size, type, raw file size, 2x unknown, block count
+STANDARD_BLOCK_INFO_STRUCT = struct.Struct('<IHH')     # offset, compressed size, uncompressed size
+TEXTURE_LOD_BLOCK_STRUCT = struct.Struct('<IIIII')     # compressed offset, compressed size, decompressed size, first block index, block count
+BLOCK_HEADER_STRUCT = struct.Struct('<IIII')           # header size, unknown, compressed size, uncompressed size
+UNCOMPRESSED_BLOCK_MARKER = 32000                      # A compressed size of exactly this means the block is stored as is
+
+# Hash table entries. data is: bit 0 synonym flag, bits 1-3 dat file number, the rest the offset in 128 byte units
+INDEX1_ENTRY_DTYPE = np.dtype([('hash', '<u8'), ('data', '<u4'), ('padding', '<u4')])  # hash is folder hash << 32 | file name hash
+INDEX2_ENTRY_DTYPE = np.dtype([('hash', '<u4'), ('data', '<u4')])                      # hash of the whole path
+SYNONYM_ENTRY_SIZE = 0x100
+SYNONYM_ENTRY_STRUCT = struct.Struct('<QII')           # hash (index2 only uses the low half), data, index. Then the full path, null terminated
+
+
+class SqPackFileLocation(NamedTuple):
+    dat_path: str
+    offset: int
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# HASHES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def _crc(text: str) -> int:
+    """The game's path hash, which is a CRC32 without the final inversion of the lowercased path"""
+    return zlib.crc32(text.lower().encode('utf-8')) ^ 0xFFFFFFFF
+
+
+def normalize_game_path(game_path: str) -> str:
+    return game_path.replace('\\', '/').strip().strip('/').lower()
+
+
+def index1_hash(game_path: str) -> int:
+    """Hash used by .index files: folder hash in the top 32 bits, file name hash in the bottom 32"""
+    folder, _, file_name = normalize_game_path(game_path).rpartition('/')
+    return (_crc(folder) << 32) | _crc(file_name)
+
+
+def index2_hash(game_path: str) -> int:
+    """Hash used by .index2 files: the whole path at once"""
+    return _crc(normalize_game_path(game_path))
+
+
+def _split_entry_data(data: int) -> Tuple[bool, int, int]:
+    """(is synonym, dat file number, offset in the dat file)"""
+    return bool(data & 1), (data >> 1) & 0b111, (data & ~0xF) * 8
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# INDEX FILES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+class SqPackIndex:
+    """
+    One .index or .index2 file. The hash table is kept as numpy arrays and searched with a binary search,
+    so loading one is just reading it and looking things up doesn't create any Python objects per entry.
+    """
+
+    def __init__(self, path: str, data: bytes):
+        self.path = path
+        self.is_index2 = path.lower().endswith('.index2')
+
+        if data[:8] != SQPACK_MAGIC:
+            raise ValueError(f"Not a SqPack file (magic {data[:8]!r})")
+        index_header_start = SQPACK_HEADER_SIZE_STRUCT.unpack_from(data, 0x0C)[0]
+        entries_offset, entries_size = INDEX_SEGMENT_STRUCT.unpack_from(data, index_header_start + 0x08)
+        self.data_file_count = struct.unpack_from('<I', data, index_header_start + INDEX_DATA_FILE_COUNT_OFFSET)[0]
+        synonyms_offset, synonyms_size = INDEX_SEGMENT_STRUCT.unpack_from(data, index_header_start + INDEX_SYNONYM_SEGMENT_OFFSET)
+
+        dtype = INDEX2_ENTRY_DTYPE if self.is_index2 else INDEX1_ENTRY_DTYPE
+        if entries_offset + entries_size > len(data):
+            raise EOFError(f"Hash table ({entries_size} bytes at {entries_offset}) goes past the end of the file ({len(data)} bytes)")
+        entries = np.frombuffer(data, dtype=dtype, count=entries_size // dtype.itemsize, offset=entries_offset)
+        hashes = entries['hash'].copy()
+        entry_data = entries['data'].copy()
+        if len(hashes) > 1 and not (hashes[1:] >= hashes[:-1]).all(): # The game's are sorted, but don't trust it
+            order = np.argsort(hashes, kind='stable')
+            hashes = hashes[order]
+            entry_data = entry_data[order]
+        self._hashes = hashes
+        self._data = entry_data
+
+        # Paths that share a hash with another path. Rare, but the table only says "look it up in the synonyms" for those.
+        self._synonyms: Dict[str, int] = {}
+        synonym_end = min(synonyms_offset + synonyms_size, len(data))
+        for entry_start in range(synonyms_offset, synonym_end - SYNONYM_ENTRY_SIZE + 1, SYNONYM_ENTRY_SIZE):
+            _, synonym_data, _ = SYNONYM_ENTRY_STRUCT.unpack_from(data, entry_start)
+            path_start = entry_start + SYNONYM_ENTRY_STRUCT.size
+            path_bytes = data[path_start:entry_start + SYNONYM_ENTRY_SIZE].split(b'\0', 1)[0]
+            if path_bytes:
+                self._synonyms[normalize_game_path(path_bytes.decode('utf-8', errors='replace'))] = synonym_data
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SqPackIndex']:
+        try:
+            with open(helpers.safe_filepath(path), 'rb') as f:
+                data = f.read()
+            return cls(path, data)
+        except (OSError, ValueError, EOFError, struct.error) as e:
+            logger.error(f"Could not read SqPack index {path}: {e}")
+            return None
+
+    def hash_of(self, game_path: str) -> int:
+        return index2_hash(game_path) if self.is_index2 else index1_hash(game_path)
+
+    def lookup(self, game_path: str) -> Optional[Tuple[int, int]]:
+        """
+        Finds a file in the hash table.
+
+        Returns:
+            tuple (dat file number, offset in that dat file), or None if the path isn't in this index.
+        """
+        path_hash = self.hash_of(game_path)
+        position = int(np.searchsorted(self._hashes, path_hash))
+        if position >= len(self._hashes) or int(self._hashes[position]) != path_hash:
+            return None
+        is_synonym, data_file_id, offset = _split_entry_data(int(self._data[position]))
+        if is_synonym:
+            synonym_data = self._synonyms.get(normalize_game_path(game_path))
+            if synonym_data is None:
+                return None
+            _, data_file_id, offset = _split_entry_data(synonym_data)
+        return data_file_id, offset
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __repr__(self):
+        return f"SqPackIndex({os.path.basename(self.path)!r}, entries={len(self)}, synonyms={len(self._synonyms)}, dat_files={self.data_file_count})"
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DAT FILES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+class _DatFile:
+    """A dat file, memory-mapped if possible (they're up to 2GB, only the few pages that are read get loaded). Safe to read from several threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(helpers.safe_filepath(path), 'rb')
+        self._lock = threading.Lock()
+        self._mapped = None
+        try:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError) as e:
+            logger.debug(f"Could not memory-map {path}, reading it normally instead: {e}")
+
+    def read(self, offset: int, size: int) -> bytes:
+        if self._mapped is not None:
+            data = self._mapped[offset:offset + size]
+        else:
+            with self._lock:
+                self._file.seek(offset)
+                data = self._file.read(size)
+        if len(data) != size:
+            raise EOFError(f"Wanted {size} bytes at {offset} in {self.path}, only got {len(data)}")
+        return data
+
+    def close(self) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self._file.close()
+
+
+def _read_block(dat: _DatFile, position: int, out: bytearray) -> None:
+    """Reads one (possibly deflated) data block and adds it to out"""
+    header_size, _, compressed_size, uncompressed_size = BLOCK_HEADER_STRUCT.unpack(dat.read(position, BLOCK_HEADER_STRUCT.size))
+    if compressed_size == UNCOMPRESSED_BLOCK_MARKER:
+        out += dat.read(position + header_size, uncompressed_size)
+        return
+    block = zlib.decompress(dat.read(position + header_size, compressed_size), wbits=-15, bufsize=uncompressed_size) # Raw deflate, no zlib header
+    if len(block) != uncompressed_size:
+        raise ValueError(f"Block at {position} decompressed to {len(block)} bytes instead of {uncompressed_size}")
+    out += block
+
+
+def _read_standard_file(dat: _DatFile, offset: int, header_size: int, block_count: int) -> bytearray:
+    block_infos = dat.read(offset + FILE_INFO_STRUCT.size, block_count * STANDARD_BLOCK_INFO_STRUCT.size)
+    out = bytearray()
+    for block_offset, _, _ in STANDARD_BLOCK_INFO_STRUCT.iter_unpack(block_infos):
+        _read_block(dat, offset + header_size + block_offset, out)
+    return out
+
+
+def _read_texture_file(dat: _DatFile, offset: int, header_size: int, lod_count: int) -> bytearray:
+    """Textures are stored as the raw .tex header, then every mip level as its own run of blocks"""
+    lod_table_start = offset + FILE_INFO_STRUCT.size
+    lods = list(TEXTURE_LOD_BLOCK_STRUCT.iter_unpack(dat.read(lod_table_start, lod_count * TEXTURE_LOD_BLOCK_STRUCT.size)))
+    total_blocks = max((first_block + block_count for _, _, _, first_block, block_count in lods), default=0)
+    # After the lod table comes the size of every block, so the blocks of a mip can be found one after another
+    block_sizes = struct.unpack(f'<{total_blocks}H', dat.read(lod_table_start + lod_count * TEXTURE_LOD_BLOCK_STRUCT.size, total_blocks * 2))
+
+    out = bytearray()
+    tex_header_size = lods[0][0] if lods else 0
+    if tex_header_size:
+        out += dat.read(offset + header_size, tex_header_size)
+    for compressed_offset, _, _, first_block, block_count in lods:
+        position = offset + header_size + compressed_offset
+        for block_index in range(first_block, first_block + block_count):
+            _read_block(dat, position, out)
+            position += block_sizes[block_index]
+    return out
+
+
+def read_dat_entry(dat: _DatFile, offset: int) -> Optional[bytes]:
+    """
+    Reads a whole file out of a dat file.
+
+    Args:
+        dat (_DatFile): The dat file.
+        offset (int): Where the file starts, from the index.
+
+    Returns:
+        bytes: The file exactly like it would be on disk, or None if it's empty or a type that isn't supported.
+    """
+    header_size, file_type, raw_file_size, _, _, block_count = FILE_INFO_STRUCT.unpack(dat.read(offset, FILE_INFO_STRUCT.size))
+    if file_type == FILE_TYPE_STANDARD:
+        data = _read_standard_file(dat, offset, header_size, block_count)
+    elif file_type == FILE_TYPE_TEXTURE:
+        data = _read_texture_file(dat, offset, header_size, block_count)
+    elif file_type == FILE_TYPE_EMPTY:
+        logger.debug(f"Entry at {offset} in {dat.path} is an empty placeholder")
+        return None
+    elif file_type == FILE_TYPE_MODEL:
+        logger.error(f"Entry at {offset} in {dat.path} is a model, which isn't supported")
+        return None
+    else:
+        logger.error(f"Entry at {offset} in {dat.path} has unknown file type {file_type}")
+        return None
+
+    if len(data) < raw_file_size:
+        logger.warning(f"Entry at {offset} in {dat.path} is {len(data)} bytes, expected {raw_file_size}")
+    del data[raw_file_size:] # Blocks are padded
+    return bytes(data)
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# GAME DATA
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+class SqPack:
+    """
+    All the SqPack archives of a game install. Index files are only loaded the first time something in their category is looked up,
+    and dat files are only opened when something is read from them.
+
+    Use get_sqpack() instead of making these yourself, so the loaded indexes are shared.
+    """
+
+    def __init__(self, game_directory: str):
+        """
+        Args:
+            game_directory (str): The "game" folder of the install (the one containing "sqpack"), or the "sqpack" folder itself.
+        """
+        game_directory = os.path.abspath(game_directory)
+        if os.path.basename(os.path.normpath(game_directory)).lower() != 'sqpack' and os.path.isdir(os.path.join(game_directory, 'sqpack')):
+            game_directory = os.path.join(game_directory, 'sqpack')
+        self.sqpack_directory = game_directory
+        self._indexes: Dict[Tuple[int, int], List[SqPackIndex]] = {} # (category, expansion) -> indexes of every chunk
+        self._dat_files: Dict[str, _DatFile] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _category_and_expansion(game_path: str) -> Optional[Tuple[int, int]]:
+        parts = normalize_game_path(game_path).split('/')
+        category = CATEGORY_IDS.get(parts[0])
+        if category is None:
+            return None
+        expansion = 0
+        if len(parts) > 2 and re.fullmatch(r'ex\d+', parts[1]): # bg/ex1/..., music/ex2/... etc
+            expansion = int(parts[1][2:])
+        return category, expansion
+
+    def _repository_directory(self, expansion: int) -> str:
+        return os.path.join(self.sqpack_directory, 'ffxiv' if expansion == 0 else f'ex{expansion}')
+
+    def _get_indexes(self, category: int, expansion: int) -> List[SqPackIndex]:
+        key = (category, expansion)
+        with self._lock:
+            indexes = self._indexes.get(key)
+            if indexes is not None:
+                return indexes
+            indexes = []
+            repository = self._repository_directory(expansion)
+            prefix = f"{category:02x}{expansion:02x}"
+            try:
+                names = sorted(os.listdir(repository))
+            except OSError as e:
+                logger.debug(f"Could not list {repository}: {e}")
+                names = []
+            # Chunks are numbered 00, 01, ... and every one of them has an .index and/or .index2. The .index one is preferred.
+            index_extensions = (f'.{PLATFORM}.index', f'.{PLATFORM}.index2')
+            chunk_names = sorted({name[:6] for name in names if name.lower().startswith(prefix) and name.lower().endswith(index_extensions)})
+            for chunk_name in chunk_names:
+                for extension in ('index', 'index2'):
+                    index_path = os.path.join(repository, f"{chunk_name}.{PLATFORM}.{extension}")
+                    if os.path.exists(index_path):
+                        index = SqPackIndex.load(index_path)
+                        if index is not None:
+                            indexes.append(index)
+                            break
+            self._indexes[key] = indexes
+            return indexes
+
+    @staticmethod
+    def _dat_path(index: SqPackIndex, data_file_id: int) -> str:
+        stem = index.path[:index.path.lower().rindex('.index')] # Strips .index and .index2
+        return f"{stem}.dat{data_file_id}"
+
+    def _get_dat_file(self, index: SqPackIndex, data_file_id: int) -> Optional[_DatFile]:
+        dat_path = self._dat_path(index, data_file_id)
+        with self._lock:
+            dat = self._dat_files.get(dat_path)
+            if dat is None:
+                try:
+                    dat = _DatFile(dat_path)
+                except OSError as e:
+                    logger.error(f"Could not open SqPack dat file {dat_path}: {e}")
+                    return None
+                self._dat_files[dat_path] = dat
+            return dat
+
+    def _find(self, game_path: str) -> Optional[Tuple[SqPackIndex, int, int]]:
+        category_and_expansion = self._category_and_expansion(game_path)
+        if category_and_expansion is None:
+            return None
+        for index in self._get_indexes(*category_and_expansion):
+            found = index.lookup(game_path)
+            if found is not None:
+                return index, found[0], found[1]
+        return None
+
+    def locate(self, game_path: str) -> Optional[SqPackFileLocation]:
+        """Where a file is stored, or None if the game doesn't have it"""
+        found = self._find(game_path)
+        if found is None:
+            return None
+        index, data_file_id, offset = found
+        return SqPackFileLocation(self._dat_path(index, data_file_id), offset)
+
+    def file_exists(self, game_path: str) -> bool:
+        return self._find(game_path) is not None
+
+    def read_file(self, game_path: str) -> Optional[bytes]:
+        """
+        Reads a file out of the game data.
+
+        Args:
+            game_path (str): Like "chara/equipment/e0737/material/v0001/mt_c0201e0737_dwn_a.mtrl". Case and slashes don't matter.
+
+        Returns:
+            bytes: The file's contents, or None if it doesn't exist or can't be read.
+        """
+        found = self._find(game_path)
+        if found is None:
+            logger.debug(f"{game_path} not found in {self.sqpack_directory}")
+            return None
+        index, data_file_id, offset = found
+        dat = self._get_dat_file(index, data_file_id)
+        if dat is None:
+            return None
+        try:
+            return read_dat_entry(dat, offset)
+        except (EOFError, ValueError, struct.error, zlib.error) as e:
+            logger.error(f"Could not read {game_path} from {dat.path} at {offset}: {e}")
+            return None
+
+    def read_mtrl(self, game_path: str, lazy_colorset: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Reads and parses a material straight out of the game data.
+
+        Returns:
+            mtrl_data (dict): Same as mtrl_handler.read_mtrl_file(), or None if the file doesn't exist or can't be read.
+        """
+        data = self.read_file(game_path)
+        if data is None:
+            return None
+        return mtrl_handler.parse_mtrl(data, game_path, lazy_colorset)
+
+    def close(self) -> None:
+        """Closes every open dat file. The indexes stay loaded."""
+        with self._lock:
+            for dat in self._dat_files.values():
+                dat.close()
+            self._dat_files.clear()
+
+    def __repr__(self):
+        return f"SqPack({self.sqpack_directory!r})"
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# SHARED INSTANCES
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+_sqpack_cache: Dict[str, SqPack] = {}
+_sqpack_cache_lock = threading.Lock()
+
+
+def get_sqpack(game_directory: str) -> SqPack:
+    """Gets the SqPack of a game install, reusing the one from last time so its indexes don't get loaded again"""
+    key = os.path.normcase(os.path.abspath(game_directory))
+    with _sqpack_cache_lock:
+        sqpack = _sqpack_cache.get(key)
+        if sqpack is None:
+            sqpack = SqPack(game_directory)
+            _sqpack_cache[key] = sqpack
+        return sqpack
+
+
+def close_sqpacks() -> None:
+    """Closes every open dat file and forgets every loaded index"""
+    with _sqpack_cache_lock:
+        for sqpack in _sqpack_cache.values():
+            sqpack.close()
+        _sqpack_cache.clear()
+
+
+def register():
+    close_sqpacks()
+
+def unregister():
+    close_sqpacks()
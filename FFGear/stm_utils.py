@@ -1,8 +1,13 @@
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
+from dataclasses import dataclass
 import struct
 import os
 import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from .mtrl_handler import DYE_FLAG_BITS
 
 logging.basicConfig()
 logger = logging.getLogger('FFGear.stm')
@@ -35,63 +40,243 @@ PAINT_FILE_PATHS = {
 }
 
 
-def half_to_float(half: int) -> float:
-    """Convert a 16-bit half-precision float to a 32-bit float"""
-    sign = (half >> 15) & 0x1
-    exp = (half >> 10) & 0x1F
-    mantissa = half & 0x3FF
+# Number of properties in every template entry, and how many halves each of their values has (RGB for the first three)
+PROPERTY_COUNTS = {
+    StainingTemplate.ENDWALKER: 5,
+    StainingTemplate.DAWNTRAIL: 12
+}
+COLOR_PROPERTY_COUNT = 3
+CHANNEL_COUNT = 3
 
-    if exp == 0:
-        if mantissa == 0:
-            return 0.0 if sign == 0 else -0.0
-        else:
-            num = (float(mantissa) / 1024.0) * (2 ** -14)
-            return num if sign == 0 else -num
-    elif exp == 31:
-        if mantissa == 0:
-            return float('inf') if sign == 0 else float('-inf')
-        else:
-            return float('nan')
 
-    result = (1.0 + (float(mantissa) / 1024.0)) * (2 ** (exp - 15))
-    return result if sign == 0 else -result
+def get_element_sizes(property_count: int) -> np.ndarray:
+    return np.array([3 if x < COLOR_PROPERTY_COUNT else 1 for x in range(property_count)], dtype=np.int64)
 
 
+def values_to_dict(values: Optional[Sequence[float]]) -> Optional[Dict[str, float]]:
+    """Convert dye values to dictionary format"""
+    if values is None or len(values) == 0:
+        return None
+    if len(values) == 1:
+        return {"value": float(values[0])}
+    return {
+        "R": float(values[0]),
+        "G": float(values[1]),
+        "B": float(values[2])
+    }
 
-class Half:
-    def __init__(self, raw_value: int = 0):
-        self.value = raw_value
 
-    @staticmethod
-    def from_raw_value(raw_value: int):
-        return Half(raw_value)
+def classify_dye_array(data_length: int, start: int, array_halves: int, element_size: int, num_dyes: int,
+                       property_offset: int) -> Tuple[Optional[StainingTemplateArrayType], int, int, int]:
+    """
+    Works out how one property's dye values are stored, and where. Both decode_template_entries and StainingTemplateEntry go through this,
+    so a template decodes to the same values whichever of them reads it.
 
-    def __str__(self):
-        result = half_to_float(self.value)
-        return f"{result:.4f}"
+    An array is one of three kinds, told apart by its size:
+    SINGLETON (one value for every dye), ONE_TO_ONE (a value per dye) or INDEXED (unique values followed by a byte per dye, see usable_dye_indices).
 
-    def to_float(self) -> float:
-        """Convert Half to float value"""
-        return half_to_float(self.value)
-   
+    Args:
+        data_length: Length of the STM file in bytes.
+        start: Byte offset of the array.
+        array_halves: Size of the array in halves (its end offset minus the previous property's).
+        element_size: Halves per value, 3 for colors and 1 for everything else.
+        num_dyes: How many dyes the file has values for.
+        property_offset: Which property this is, only for the log messages.
+
+    Returns:
+        tuple: (array type, palette start, unique count, index start). The palette is unique count values from palette start on (in bytes),
+        index start is where the byte per dye starts (INDEXED only, 0 otherwise).
+        The type is None for arrays that are empty, broken or go past the end of the data, every dye gets the default then.
+    """
+    empty = (None, start, 0, 0)
+    if array_halves < 0:
+        logger.warning(f"INIT Warning: Invalid array end offset detected for property offset {property_offset}: end < start. Treating as empty.")
+        return empty
+
+    array_size = array_halves // element_size
+    if array_size == 0:
+        return empty
+
+    if array_size == 1:
+        if start + element_size * 2 > data_length:
+            logger.error(f"INIT Error: Attempted to read Singleton data beyond data length for property offset {property_offset}. Offset={start}, DataLen={data_length}")
+            return empty
+        return (StainingTemplateArrayType.SINGLETON, start, 1, 0)
+
+    # INDEXED if there's room for a byte per dye after at least one value, ONE_TO_ONE otherwise
+    remaining_bytes = array_halves * 2 - num_dyes
+    if remaining_bytes >= element_size * 2:
+        unique_count = remaining_bytes // 2 // element_size
+        index_start = start + remaining_bytes
+        if index_start + num_dyes > data_length or start + unique_count * element_size * 2 > data_length:
+            logger.error(f"INIT Error: Attempted to read INDEXED data beyond data length for property offset {property_offset}. IndexStart={index_start}, DataLen={data_length}")
+            return empty
+        return (StainingTemplateArrayType.INDEXED, start, unique_count, index_start)
+
+    if start + array_size * element_size * 2 > data_length:
+        logger.error(f"INIT Error: Attempted to read ONE_TO_ONE data beyond data length for property offset {property_offset}. OffsetStart={start}, DataLen={data_length}")
+        return empty
+    if array_size > num_dyes:
+        logger.warning(f"INIT Warning: Property offset {property_offset} has {array_size} entries, expected {num_dyes}. Truncating.")
+        array_size = num_dyes
+    return (StainingTemplateArrayType.ONE_TO_ONE, start, array_size, 0)
+
+
+def usable_dye_indices(indices: np.ndarray, unique_counts: np.ndarray) -> np.ndarray:
+    """
+    Which bytes of an INDEXED array point at a value. They're 1-based, 0 and 255 both mean no value.
+    Anything else past the unique values is invalid, those are counted in a warning and get the default like the rest.
+    """
+    usable = (indices >= 1) & (indices <= unique_counts) & (indices != 255)
+    invalid_count = np.count_nonzero(~usable & (indices != 0) & (indices != 255))
+    if invalid_count:
+        logger.warning(f"INIT Warning: {invalid_count} invalid dye indices encountered. Using defaults for them.")
+    return usable
 
-def values_to_dict(values: Optional[List[Half]]) -> Optional[Dict[str, float]]:
-    """Convert Half values to dictionary format"""
-    if not values:
-        return None
-    if len(values) == 1:
-        return {"value": values[0].to_float()}
-    return {
-        "R": values[0].to_float(),
-        "G": values[1].to_float(),
-        "B": values[2].to_float()
-    }
+
+def decode_template_entries(data: bytes, entry_offsets: np.ndarray, template_type: StainingTemplate, old_format: bool) -> np.ndarray:
+    """
+    Decodes template entries into one dense array, all of them at once.
+
+    Every entry starts with the end offset of each property's array (in halves), followed by the arrays themselves (see classify_dye_array).
+    Dyes without a value, and arrays that are broken or go past the end of the file, are left at 0.
+
+    Args:
+        data: The raw byte data of the STM file.
+        entry_offsets: Absolute byte offsets of the entries to decode.
+        template_type: The type of template (ENDWALKER or DAWNTRAIL).
+        old_format: Boolean indicating if the file uses the older 128-dye format.
+
+    Returns:
+        np.ndarray: float32 array of shape (entries, properties, dyes, 3). Single value properties only use channel 0.
+    """
+    property_count = PROPERTY_COUNTS[template_type]
+    num_dyes = 128 if old_format else 254
+    entry_offsets = np.asarray(entry_offsets, dtype=np.int64).reshape(-1)
+    values = np.zeros((len(entry_offsets), property_count, num_dyes, CHANNEL_COUNT), dtype=np.float32)
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    half_count = len(raw) // 2
+    if len(entry_offsets) == 0 or half_count == 0:
+        return values
+    halves = raw[:half_count * 2].view('<f2') # Entries always start at an even offset, so everything lines up with this
+    half_words = halves.view('<u2')
+    element_sizes = get_element_sizes(property_count)
+
+    # Where each property's array starts and ends, in halves after the entry's own header
+    end_positions = entry_offsets[:, None] // 2 + np.arange(property_count)
+    ends_in_file = end_positions < half_count
+    if not ends_in_file.all():
+        logger.error(f"INIT Error: {np.count_nonzero(~ends_in_file)} array end offsets are beyond the data length ({len(raw)}). Treating them as 0.")
+    array_ends = np.where(ends_in_file, half_words[np.minimum(end_positions, half_count - 1)], 0).astype(np.int64)
+    array_starts = np.zeros_like(array_ends)
+    array_starts[:, 1:] = array_ends[:, :-1]
+
+    data_starts = entry_offsets[:, None] + property_count * 2 + array_starts * 2 # In bytes
+    classified = [classify_dye_array(len(raw), start, halves, element_size, num_dyes, x)
+                  for row_starts, row_halves in zip(data_starts.tolist(), (array_ends - array_starts).tolist())
+                  for x, (start, halves, element_size) in enumerate(zip(row_starts, row_halves, element_sizes.tolist()))]
+    array_types = np.array([-1 if array_type is None else array_type.value for array_type, _, _, _ in classified], dtype=np.int64).reshape(array_ends.shape)
+    palette_starts, unique_counts, index_starts = (np.array(column, dtype=np.int64).reshape(array_ends.shape) for column in list(zip(*classified))[1:])
+    palette_starts = palette_starts // 2 # In halves
+
+    # Which half every (entry, property, dye) value starts at, -1 for none
+    dyes = np.arange(num_dyes)
+    sizes_per_dye = element_sizes[:, None]
+    singleton = array_types == StainingTemplateArrayType.SINGLETON.value
+    one_to_one = array_types == StainingTemplateArrayType.ONE_TO_ONE.value
+    indexed = array_types == StainingTemplateArrayType.INDEXED.value
+    sources = np.full(values.shape[:3], -1, dtype=np.int64)
+    sources = np.where(singleton[:, :, None], palette_starts[:, :, None], sources)
+    sources = np.where(one_to_one[:, :, None] & (dyes < unique_counts[:, :, None]), palette_starts[:, :, None] + dyes * sizes_per_dye, sources)
+
+    dye_indices = np.where(indexed[:, :, None], raw[np.where(indexed[:, :, None], index_starts[:, :, None] + dyes, 0)], 0)
+    use_index = usable_dye_indices(dye_indices, unique_counts[:, :, None])
+    sources = np.where(use_index, palette_starts[:, :, None] + (dye_indices.astype(np.int64) - 1) * sizes_per_dye, sources)
+
+    for channel in range(CHANNEL_COUNT):
+        has_channel = (sources >= 0) & (channel < sizes_per_dye)
+        values[..., channel] = np.where(has_channel, halves[np.where(has_channel, sources + channel, 0)], 0)
+
+    return values
+
+
+def flatten_template_values(values: np.ndarray) -> np.ndarray:
+    """
+    Turns one template's decoded values into a palette: a row per dye with every property's values next to each other.
+
+    Args:
+        values: float32 array of shape (properties, dyes, 3), like a row of decode_template_entries.
+
+    Returns:
+        np.ndarray: float32 array of shape (dyes, values), laid out like PROPERTY_SLICES (RGB for colors, one value for the rest).
+    """
+    element_sizes = get_element_sizes(values.shape[0]).tolist()
+    return np.concatenate([values[x, :, :element_size] for x, element_size in enumerate(element_sizes)], axis=1)
+
+
+# Returned for dyes without a value. Read-only since the same arrays are handed out every time.
+_DEFAULT_VALUES = {size: np.zeros(size, dtype=np.float32) for size in (1, 3)}
+for _default in _DEFAULT_VALUES.values():
+    _default.flags.writeable = False
+
+
+@dataclass
+class DyeArray:
+    """
+    One property's dye values, stored the way the file stores them instead of expanded to every dye.
+    palette is (values, element size) float32. index is a uint8 view into the file data, only for INDEXED arrays.
+    array_type is None for arrays that are empty or couldn't be read, every dye gets the default then.
+    """
+    array_type: Optional[StainingTemplateArrayType]
+    element_size: int
+    palette: Optional[np.ndarray] = None
+    index: Optional[np.ndarray] = None
+
+    def get(self, dye_id: int) -> np.ndarray:
+        if self.array_type == StainingTemplateArrayType.INDEXED:
+            index = int(self.index[dye_id])
+            if 0 < index <= len(self.palette) and index != 255: # 0 and 255 both mean no value
+                return self.palette[index - 1]
+        elif self.array_type == StainingTemplateArrayType.SINGLETON:
+            return self.palette[0]
+        elif self.array_type == StainingTemplateArrayType.ONE_TO_ONE:
+            if dye_id < len(self.palette):
+                return self.palette[dye_id]
+        return _DEFAULT_VALUES[self.element_size]
+
+
+def _read_palette(data: bytes, start: int, count: int, element_size: int) -> np.ndarray:
+    palette = np.frombuffer(data, dtype='<f2', count=count * element_size, offset=start).astype(np.float32).reshape(count, element_size)
+    palette.flags.writeable = False
+    return palette
+
+
+def decode_dye_array(data: bytes, array_type: Optional[StainingTemplateArrayType], palette_start: int, unique_count: int, index_start: int,
+                     element_size: int, num_dyes: int) -> DyeArray:
+    """
+    Reads one property's array out of a template entry, without expanding it.
+
+    Args:
+        data: The raw byte data of the STM file.
+        array_type, palette_start, unique_count, index_start: What classify_dye_array found for this array.
+        element_size: Halves per value, 3 for colors and 1 for everything else.
+        num_dyes: How many dyes the file has values for.
+
+    Returns:
+        DyeArray: The array. An empty DyeArray if array_type is None.
+    """
+    if array_type is None:
+        return DyeArray(None, element_size)
+    palette = _read_palette(data, palette_start, unique_count, element_size)
+    index = np.frombuffer(data, dtype=np.uint8, count=num_dyes, offset=index_start) if array_type == StainingTemplateArrayType.INDEXED else None
+    return DyeArray(array_type, element_size, palette, index)
 
 
 class StainingTemplateEntry:
     def __init__(self, data: bytes, offset: int, template_type: StainingTemplate, old_format: bool):
         """
-        Initializes a StainingTemplateEntry, parsing dye data based on format version.
+        Initializes a StainingTemplateEntry, reading every property's dye array as is (see DyeArray).
 
         Args:
             data: The raw byte data of the STM file.
@@ -99,231 +284,55 @@ class StainingTemplateEntry:
             template_type: The type of template (ENDWALKER or DAWNTRAIL).
             old_format: Boolean indicating if the file uses the older 128-dye format.
         """
-        self.entries: List[List[List[Half]]] = []
-        array_ends = []
-        start = offset
-
-        item_count = 5 if template_type == StainingTemplate.ENDWALKER else 12
-        num_dyes = 128 if old_format else 254
-
-        for i in range(item_count):
-            # Ensure we don't read past the end of the data when getting array ends
-            if offset + 2 > len(data):
-                 logger.error(f"INIT Error: Attempted to read array end offset beyond data length for item {i}. Offset={offset}, DataLen={len(data)}")
-                 array_ends.append(0)
-                 offset += 2 # Still increment offset conceptually, though value is invalid
-                 continue
-
-            array_ends.append(struct.unpack_from("<H", data, offset)[0])
-            offset += 2
-            self.entries.append([]) # Initialize empty list for this entry offset
-
-        header_size = item_count * 2
+        self.template_type = template_type
+        self.num_dyes = 128 if old_format else 254
+        property_count = PROPERTY_COUNTS[template_type]
+
+        # The entry starts with the end offset of every property's array, in halves
+        readable_count = max(0, min(property_count, (len(data) - offset) // 2))
+        if readable_count < property_count:
+            logger.error(f"INIT Error: Attempted to read array end offsets beyond data length. Offset={offset}, DataLen={len(data)}")
+        array_ends = list(struct.unpack_from(f"<{readable_count}H", data, offset)) if readable_count else []
+        array_ends += [0] * (property_count - readable_count)
+
+        data_start = offset + property_count * 2
+        self.arrays: List[DyeArray] = []
         last_offset = 0
-
-        for x in range(item_count):
-            # Ensure 'x' is within the bounds of the initialized 'entries' and 'array_ends' lists
-            if x >= len(self.entries) or x >= len(array_ends):
-                 logger.error(f"INIT Error: Index 'x' ({x}) is out of bounds for entries/array_ends lists (len={len(self.entries)}/{len(array_ends)}). Skipping property offset.")
-                 continue # Skip processing for this invalid index
-
-            element_size = 3 if x < 3 else 1
-            default_entry = [Half() for _ in range(element_size)]
-
-            current_end = array_ends[x]
-            array_size = 0
-            array_type = None
-
-            if current_end < last_offset:
-                 logger.warning(f"INIT Warning: Invalid array end offset detected for property offset {x}: end ({current_end}) < start ({last_offset}). Treating as empty.")
-                 # Fill half_data with defaults directly
-                 half_data = [default_entry for _ in range(num_dyes)]
-                 array_type = None # Explicitly mark as having no specific type/data
-            else:
-                # Calculate size only if offsets are valid
-                array_size = (current_end - last_offset) // element_size
-                array_type = StainingTemplateArrayType.ONE_TO_ONE # Default assumption
-                index_start = 0
-                half_data = [] # Initialize half_data for this iteration
-
-                if array_size == 0:
-                    logger.debug(f"INIT: No dye data for property offset {x} (array_size is 0). Filling half_data with defaults.")
-                    half_data = [default_entry for _ in range(num_dyes)]
-                    array_type = None # No specific data type, already filled
-                elif array_size == 1:
-                    array_type = StainingTemplateArrayType.SINGLETON
-                    # Read the single data entry
-                    offset_start = start + header_size + (last_offset * 2)
-                    # Add boundary checks for reading data
-                    if offset_start + (element_size * 2) > len(data):
-                         logger.error(f"INIT Error: Attempted to read Singleton data beyond data length for property offset {x}. Offset={offset_start}, DataLen={len(data)}")
-                         half_data = [default_entry] # Use default if read fails
-                    else:
-                         halfs = []
-                         element_start = offset_start
-                         for j in range(element_size):
-                             raw_value = struct.unpack_from("<H", data, element_start + (j * 2))[0]
-                             halfs.append(Half.from_raw_value(raw_value))
-                         half_data.append(halfs)
-                else:
-                    # Potential INDEXED or ONE_TO_ONE
-                    total_bytes = (current_end - last_offset) * 2
-                    rem_bytes = total_bytes - num_dyes
-
-                    # Check for INDEXED pattern (requires space for index table + at least one data element)
-                    # Ensure rem_bytes is positive and results in at least one element
-                    if rem_bytes >= (element_size * 2): # Need at least enough bytes for one element after index table
-                         actual_data_size = rem_bytes // 2 // element_size
-                         if actual_data_size > 0: # Check if calculated size is valid
-                              array_type = StainingTemplateArrayType.INDEXED
-                              index_start = start + header_size + (last_offset * 2) + rem_bytes
-                              array_start = last_offset
-                              offset_start = start + header_size + (array_start * 2)
-
-                              # Add boundary checks before reading index table and data
-                              if index_start + num_dyes > len(data):
-                                   logger.error(f"INIT Error: Attempted to read INDEXED index table beyond data length for property offset {x}. IndexStart={index_start}, DataLen={len(data)}")
-                                   # Handle error: Fill half_data with defaults.
-                                   half_data = [default_entry for _ in range(num_dyes)]
-                                   array_type = None # Mark as failed/defaulted
-                              elif offset_start + (actual_data_size * element_size * 2) > len(data):
-                                   logger.error(f"INIT Error: Attempted to read INDEXED data values beyond data length for property offset {x}. OffsetStart={offset_start}, DataLen={len(data)}")
-                                   half_data = [default_entry for _ in range(num_dyes)]
-                                   array_type = None # Mark as failed/defaulted
-                              else:
-                                   # Read the unique Half float values
-                                   for i in range(actual_data_size):
-                                       halfs = []
-                                       element_start = offset_start + ((i * 2) * element_size)
-                                       for j in range(element_size):
-                                           raw_value = struct.unpack_from("<H", data, element_start + (j * 2))[0]
-                                           halfs.append(Half.from_raw_value(raw_value))
-                                       half_data.append(halfs)
-                         else:
-                              # Not enough remaining bytes for even one element, treat as ONE_TO_ONE
-                              array_type = StainingTemplateArrayType.ONE_TO_ONE
-                              logger.debug(f"INIT: Calculated 0 actual data size for potential INDEXED at offset {x}. Treating as ONE_TO_ONE.")
-                    else:
-                         # Not enough bytes for index table + data, assume ONE_TO_ONE
-                         array_type = StainingTemplateArrayType.ONE_TO_ONE
-
-                    # Handle ONE_TO_ONE reading (if not successfully processed as INDEXED)
-                    if array_type == StainingTemplateArrayType.ONE_TO_ONE:
-                         array_start = last_offset
-                         offset_start = start + header_size + (array_start * 2)
-                         # Add boundary check before reading data
-                         if offset_start + (array_size * element_size * 2) > len(data):
-                              logger.error(f"INIT Error: Attempted to read ONE_TO_ONE data beyond data length for property offset {x}. OffsetStart={offset_start}, DataLen={len(data)}")
-                              half_data = [default_entry for _ in range(num_dyes)] # Fill with defaults on error
-                              array_type = None # Mark as failed/defaulted
-                         else:
-                              # Read all entries directly
-                              for i in range(array_size):
-                                   halfs = []
-                                   element_start = offset_start + ((i * 2) * element_size)
-                                   for j in range(element_size):
-                                       raw_value = struct.unpack_from("<H", data, element_start + (j * 2))[0]
-                                       halfs.append(Half.from_raw_value(raw_value))
-                                   half_data.append(halfs)
-
-
-                # ============================ #
-                # Process based on Array Type (only if array_type is set)
-                # ============================ #
-                if array_type == StainingTemplateArrayType.INDEXED:
-                    n_array = []
-                    unique_value_count = len(half_data)
-                    # Boundary check for reading index data
-                    if index_start + num_dyes > len(data):
-                         logger.error(f"INIT Error: Attempting to read index data out of bounds in INDEXED processing for offset {x}. IndexStart={index_start}, DataLen={len(data)}")
-                         # Fill n_array with defaults as recovery
-                         n_array = [default_entry for _ in range(num_dyes)]
-                    else:
-                         for i in range(num_dyes):
-                             try:
-                                 index = data[index_start + i]
-                                 if index == 255 or index == 0:
-                                     n_array.append(default_entry)
-                                     continue
-                                 if 0 < index <= unique_value_count:
-                                     n_array.append(half_data[index - 1])
-                                 else:
-                                     logger.warning(f"INIT Warning: Invalid dye index {index} encountered for property offset {x} at dye {i}. Max unique value index: {unique_value_count}. Using default.")
-                                     n_array.append(default_entry)
-                             except IndexError: # Should be less likely with boundary check above, but keep for safety
-                                 logger.error(f"INIT IndexError accessing index data at {index_start + i} or half_data with index {index-1} for property offset {x}", exc_info=True)
-                                 n_array.append(default_entry)
-                             except Exception as ex:
-                                 logger.error(f"INIT Unexpected error processing indexed dye data for property offset {x}: {ex}", exc_info=True)
-                                 raise ex # Re-raise unexpected
-                    half_data = n_array
-
-                elif array_type == StainingTemplateArrayType.SINGLETON:
-                    if len(half_data) == 1:
-                         first_entry = half_data[0] # Store the single entry
-                         # Create a new list with the required number of copies
-                         half_data = [first_entry for _ in range(num_dyes)]
-                    else:
-                         logger.warning(f"INIT Warning: Expected 1 entry for Singleton property offset {x}, found {len(half_data)}. Padding with defaults.")
-                         half_data = [default_entry for _ in range(num_dyes)]
-
-                # ============================ #
-                # Final Padding/Truncating (only if array_type was set)
-                # ============================ #
-                if array_type is not None:
-                    if len(half_data) < num_dyes:
-                        logger.debug(f"INIT: Property offset {x} has {len(half_data)} entries after processing, expected {num_dyes}. Padding with defaults.")
-                        half_data.extend([default_entry for _ in range(num_dyes - len(half_data))])
-                    elif len(half_data) > num_dyes:
-                        logger.warning(f"INIT Warning: Property offset {x} has {len(half_data)} entries after processing, expected {num_dyes}. Truncating.")
-                        half_data = half_data[:num_dyes]
-
-            # ============================ #
-            # Debug logging
-            # ============================ #
-
-            logger.debug(f"INIT: Before extend for offset {x}: array_size={array_size}, array_type={array_type}, len(half_data)={len(half_data)}")
-
-            # Store the final data for this property offset
-            # Ensure self.entries[x] exists and is empty before extending
-            if x < len(self.entries):
-                 if not self.entries[x]: # Check if it's empty
-                      self.entries[x].extend(half_data)
-                 else:
-                      # This case should not happen if logic is correct (list should be empty)
-                      logger.error(f"INIT Error: Target list self.entries[{x}] was not empty before extend. Overwriting. Length was {len(self.entries[x])}")
-                      self.entries[x] = half_data # Overwrite if not empty (potential data loss)
-                 logger.debug(f"INIT: After extend for offset {x}: len(self.entries[{x}])={len(self.entries[x])}")
-            else:
-                 # This case should not happen due to earlier check 'if x >= len(self.entries)'
-                 logger.error(f"INIT Error: Index 'x' ({x}) became invalid before extend operation.")
-
-            # Update last_offset for the next iteration
+        for x, current_end in enumerate(array_ends):
+            element_size = 3 if x < COLOR_PROPERTY_COUNT else 1
+            classified = classify_dye_array(len(data), data_start + last_offset * 2, current_end - last_offset, element_size, self.num_dyes, x)
+            self.arrays.append(decode_dye_array(data, *classified, element_size, self.num_dyes))
             last_offset = current_end
 
+        # Only for the warning, DyeArray.get checks the same thing per dye
+        indexed = [array for array in self.arrays if array.array_type == StainingTemplateArrayType.INDEXED]
+        if indexed:
+            usable_dye_indices(np.stack([array.index for array in indexed]), np.array([[len(array.palette)] for array in indexed]))
+
 
-    def get_data(self, offset: int, dye_id: int = 0) -> Optional[List[Half]]:
+
+    def get_data(self, offset: int, dye_id: int = 0) -> Optional[np.ndarray]:
         """Get data for specific offset and dye ID"""
         # Check offset validity first
-        if offset >= len(self.entries):
-            logger.warning(f"GET_DATA Warning: Attempted to access invalid property offset: {offset}. Max offset: {len(self.entries)-1}")
+        if offset >= len(self.arrays):
+            logger.warning(f"GET_DATA Warning: Attempted to access invalid property offset: {offset}. Max offset: {len(self.arrays)-1}")
             return None
         if dye_id < 0:
              logger.warning(f"GET_DATA Warning: Attempted to access negative dye_id: {dye_id}. Using dye_id 0 instead.")
              dye_id = 0 # Treat negative dye ID as 0
 
-        current_len = len(self.entries[offset])
-        logger.debug(f"GET_DATA: Checking bounds for offset {offset}, dye_id {dye_id}. Current len(self.entries[{offset}]) = {current_len}")
+        current_len = self.num_dyes
+        if logger.isEnabledFor(logging.DEBUG): # Called for every property of every lookup, so don't build the message for nothing
+            logger.debug(f"GET_DATA: Checking bounds for offset {offset}, dye_id {dye_id}. Current dye count = {current_len}")
 
         # Check if the requested dye_id is within the bounds of the specific list for this offset
+        array = self.arrays[offset]
         if dye_id < current_len:
-            return self.entries[offset][dye_id]
+            return array.get(dye_id)
         else:
             # This means the list for this offset doesn't have an entry for the requested dye_id
             logger.warning(f"GET_DATA Warning: Dye ID {dye_id} out of bounds for property offset {offset} (max index: {current_len - 1}). Returning default.")
-            # Determine element size to return correct default structure
-            element_size = 3 if offset < 3 else 1
-            return [Half() for _ in range(element_size)]
+            return _DEFAULT_VALUES[array.element_size]
 
 
 # The TEMPLATE_MAPPINGS for endwalker in particular may be incorrect, but so far they haven't broken anything so I'm keeping it like this
@@ -354,14 +363,19 @@ class StainingTemplateFile:
 
     def __init__(self, data: bytes, template_type: StainingTemplate):
         """
-        Initializes the StainingTemplateFile, parsing the header and template entries.
+        Initializes the StainingTemplateFile, parsing the header and the template ID/offset tables.
+        The template entries themselves are only decoded when get_template asks for them (or all at once with decode_all),
+        since a session usually only touches a handful of them.
 
         Args:
             data: The raw byte data of the STM file.
             template_type: The type of template (ENDWALKER or DAWNTRAIL).
         """
         self.template_type = template_type
-        self.templates: Dict[int, StainingTemplateEntry] = {} # Store templates by ID
+        self.entry_offsets: Dict[int, int] = {} # Template ID -> where its entry starts in the data, for every template in the file
+        self.templates: Dict[int, StainingTemplateEntry] = {} # Decoded templates by ID, filled in as they're asked for
+        self.palettes: Dict[int, np.ndarray] = {} # Every dye's values of a template by ID (see get_palette), filled in as they're asked for
+        self._data = data
 
         # --- Format Detection Logic ---
         header = struct.unpack_from("<H", data, 0)[0] # Offset 0: Unknown header value
@@ -390,81 +404,125 @@ class StainingTemplateFile:
 
 
         # --- Read Template IDs and Offsets ---
-        entry_offsets = {} # Dictionary to store {template_id: data_offset}
-        keys = []          # List to maintain the order of template IDs
-        offset = 8         # Start reading after the initial 8-byte header
-
-        # Determine format strings and sizes based on detected format
-        key_fmt = "<H" if old_format else "<I"
+        # Determine sizes based on detected format
+        key_dtype = "<u2" if old_format else "<u4"
         key_size = 2 if old_format else 4
-        offset_fmt = "<H" if old_format else "<I"
-        offset_size = 2 if old_format else 4
-        header_entry_size = key_size + offset_size # Size of ID + Offset pair in header
+        header_entry_size = key_size * 2 # Size of ID + Offset pair in header
 
         logger.debug(f"Reading {entry_count} templates using {'old (2-byte)' if old_format else 'new (4-byte)'} format.")
 
-        # Read template IDs
-        for i in range(entry_count):
-            if offset + key_size > len(data):
-                logger.error(f"Error reading template keys: Reached end of file unexpectedly at index {i}/{entry_count}, offset {offset}.")
-                break
-            key = struct.unpack_from(key_fmt, data, offset)[0]
-            entry_offsets[key] = 0 # Initialize offset value
-            keys.append(key)
-            offset += key_size
+        # Template IDs, then their data offsets
+        key_count = min(entry_count, max(0, (len(data) - 8) // key_size))
+        if key_count < entry_count:
+            logger.error(f"Error reading template keys: Reached end of file unexpectedly at index {key_count}/{entry_count}.")
+        keys = np.frombuffer(data, dtype=key_dtype, count=key_count, offset=8)
+
+        offsets_start = 8 + key_count * key_size
+        offset_count = min(key_count, max(0, (len(data) - offsets_start) // key_size))
+        if offset_count < key_count:
+            logger.error(f"Error reading template offsets: Reached end of file unexpectedly at index {offset_count}/{entry_count}.")
+        raw_offsets = np.frombuffer(data, dtype=key_dtype, count=offset_count, offset=offsets_start)
 
         # Calculate the end of the header section (where actual template data begins)
-        # The header contains IDs and their corresponding offsets.
         end_of_header = 8 + (entry_count * header_entry_size) # Start offset + size of all ID/Offset pairs
+        # Offset is relative to the end of the header and scaled by 2 (since offsets are in Half units)
+        entry_offsets = raw_offsets.astype(np.int64) * 2 + end_of_header
 
-        # Read template data offsets
-        for i in range(entry_count):
-            if i >= len(keys): # Check if we broke early during key reading
-                break
-            if offset + offset_size > len(data):
-                 logger.error(f"Error reading template offsets: Reached end of file unexpectedly at index {i}/{entry_count}, offset {offset}.")
-                 break
-            raw_offset = struct.unpack_from(offset_fmt, data, offset)[0]
-            # Calculate the absolute offset in the file data
-            # Offset is relative to the end of the header and scaled by 2 (since offsets seem to be in Half units)
-            absolute_offset = (raw_offset * 2) + end_of_header
-            entry_offsets[keys[i]] = absolute_offset
-            offset += offset_size
-
-        # --- Create StainingTemplateEntry Objects ---
-        logger.debug(f"Loading {len(entry_offsets)} template entries...")
-        loaded_count = 0
-        for key, value in entry_offsets.items():
-            try:
-                # MODIFIED: Pass the old_format flag to the entry constructor
-                entry = StainingTemplateEntry(data, value, template_type, old_format)
-                # Key should always be treated as an integer
-                self.templates[int(key)] = entry
-                loaded_count += 1
-            except Exception as e:
-                logger.error(f"Failed to parse template entry for key {key} at offset {value}: {e}", exc_info=True)
-
-        logger.debug(f"Successfully loaded {loaded_count} templates for {template_type.name} ({'old' if old_format else 'new'} format).")
+        for key, entry_offset in zip(keys[:offset_count].tolist(), entry_offsets.tolist()):
+            self.entry_offsets[int(key)] = entry_offset # If a key shows up twice, the last one wins
+        self.old_format = old_format
+
+        logger.debug(f"Successfully read {len(self.entry_offsets)} template offsets for {template_type.name} ({'old' if old_format else 'new'} format).")
 
 
     def get_template(self, key: int) -> Optional[StainingTemplateEntry]:
-        """Get template by ID"""
+        """Get template by ID, decoding it the first time it's asked for"""
         # Ensure key is int
         key_int = int(key)
-        if key_int in self.templates:
-            # logger.debug(f"Found template {key_int} in {self.template_type.name} file")
-            return self.templates[key_int]
-        logger.warning(f"Template {key_int} not found in {self.template_type.name} file")
-        return None
+        entry = self.templates.get(key_int)
+        if entry is not None:
+            return entry
+
+        entry_offset = self.entry_offsets.get(key_int)
+        if entry_offset is None:
+            logger.warning(f"Template {key_int} not found in {self.template_type.name} file")
+            return None
+        try:
+            entry = StainingTemplateEntry(self._data, entry_offset, self.template_type, self.old_format)
+        except Exception as e:
+            logger.error(f"Failed to parse template entry for key {key_int} at offset {entry_offset}: {e}", exc_info=True)
+            return None
+        self.templates[key_int] = entry
+        return entry
+
+    def get_palette(self, key: int) -> Optional[np.ndarray]:
+        """
+        Get every dye's values of a template at once, decoding them the first time it's asked for.
+
+        Returns:
+            np.ndarray or None: Read-only float32 array of shape (dyes, values), see flatten_template_values.
+            Row N is the same as the values of dye N from get_template.
+        """
+        key_int = int(key)
+        palette = self.palettes.get(key_int)
+        if palette is not None:
+            return palette
+
+        entry_offset = self.entry_offsets.get(key_int)
+        if entry_offset is None:
+            logger.warning(f"Template {key_int} not found in {self.template_type.name} file")
+            return None
+        try:
+            values = decode_template_entries(self._data, [entry_offset], self.template_type, self.old_format)[0]
+        except Exception as e:
+            logger.error(f"Failed to decode palette for template {key_int} at offset {entry_offset}: {e}", exc_info=True)
+            return None
+        palette = flatten_template_values(values)
+        palette.flags.writeable = False
+        self.palettes[key_int] = palette
+        return palette
+
+    def decode_all(self) -> np.ndarray:
+        """
+        Decodes every template that wasn't decoded yet, and also expands all of them into one dense array for batch lookups.
+
+        Returns:
+            np.ndarray: float32 array of shape (templates, properties, dyes, 3), in the order of self.entry_offsets.
+        """
+        for key in self.entry_offsets:
+            self.get_template(key)
+        return decode_template_entries(self._data, list(self.entry_offsets.values()), self.template_type, self.old_format)
 
     def get_entry_names(self) -> List[str]:
         """Get list of entry names based on template type"""
         return list(self.TEMPLATE_MAPPINGS[self.template_type].values())
 
 
+# Where each property's values are in the flat tuples of the template value cache: name -> (start, element size)
+PROPERTY_SLICES: Dict[StainingTemplate, Dict[str, Tuple[int, int]]] = {}
+for _template_type, _mappings in StainingTemplateFile.TEMPLATE_MAPPINGS.items():
+    _start = 0
+    PROPERTY_SLICES[_template_type] = {}
+    for _offset, _name in _mappings.items():
+        _element_size = 3 if _offset < COLOR_PROPERTY_COUNT else 1
+        PROPERTY_SLICES[_template_type][_name] = (_start, _element_size)
+        _start += _element_size
+
+
 # Global cache for STM data
 _stm_cache = None
-_template_cache = {}
+_stm_load_lock = threading.RLock() # Held while an STM file is being loaded, and while the warm-up results are handed over
+_stm_cache_generation = 0 # Goes up whenever the cache is cleared, so a warm-up that started before that throws its results away
+_warm_up_thread: Optional[threading.Thread] = None
+_warm_up_results: Dict[StainingTemplate, Optional[StainingTemplateFile]] = {}
+
+# Looked up template values, so scrolling through dyes doesn't go through the template again for every property.
+# Key is (template type value, template ID, dye index), value is every property's values in one flat tuple (see PROPERTY_SLICES).
+# Ordered from least to most recently used, and bounded so going through every dye of every template doesn't grow it forever.
+_template_cache: 'OrderedDict[Tuple[int, int, int], Tuple[float, ...]]' = OrderedDict()
+_template_cache_lock = threading.RLock()
+_template_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_template_cache_max_entries = 8192 # Change it with configure_template_cache()
 
 
 
@@ -472,10 +530,10 @@ _template_cache = {}
 # FUNCTIONS
 #¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
 
-def get_template_values(template_id: int, dye_index: int, template_type: StainingTemplate, is_legacy: bool = False) -> Optional[Dict]:
+def get_template_value_tuple(template_id: int, dye_index: int, template_type: StainingTemplate, is_legacy: bool = False) -> Optional[Tuple[float, ...]]:
     """
-    Get cached template values or compute them
-    
+    Get cached template values as one flat tuple, or compute them. PROPERTY_SLICES says where each property is.
+
     Args:
         template_id: Template ID to process
         dye_index: Dye index to use
@@ -484,79 +542,166 @@ def get_template_values(template_id: int, dye_index: int, template_type: Stainin
     """
     # Force Endwalker template type for legacy shaders
     effective_type = StainingTemplate.ENDWALKER if is_legacy else template_type
-    
-    cache_key = f"{effective_type.value}_{template_id}_{dye_index}"
-    if cache_key in _template_cache:
-        return _template_cache[cache_key]
-        
+
+    cache_key = (effective_type.value, int(template_id), int(dye_index))
+    with _template_cache_lock:
+        values = _template_cache.get(cache_key)
+        if values is not None:
+            _template_cache.move_to_end(cache_key)
+            _template_cache_stats['hits'] += 1
+            return values
+        _template_cache_stats['misses'] += 1
+
     stm_file = get_stm_cache(effective_type)
     if not stm_file:
         return None
-        
+
     template = stm_file.get_template(template_id)
     if not template:
         return None
 
-    result = {}
-    entry_names = stm_file.get_entry_names()
-    
-    for i, entry_name in enumerate(entry_names):
-        data = template.get_data(i, dye_index)
-        result[entry_name] = values_to_dict(data)
+    flat_values = []
+    for i in range(len(stm_file.get_entry_names())):
+        flat_values.extend(template.get_data(i, dye_index).tolist())
+    values = tuple(flat_values)
+
+    with _template_cache_lock:
+        _template_cache[cache_key] = values
+        while len(_template_cache) > _template_cache_max_entries:
+            _template_cache.popitem(last=False)
+            _template_cache_stats['evictions'] += 1
+    return values
+
+
+def get_template_values(template_id: int, dye_index: int, template_type: StainingTemplate, is_legacy: bool = False) -> Optional[Dict]:
+    """
+    Get template values as a dictionary of property name -> {"R", "G", "B"} or {"value"}
+
+    Args:
+        template_id: Template ID to process
+        dye_index: Dye index to use
+        template_type: Which template format to use
+        is_legacy: Whether to force Endwalker STM for legacy shaders
+    """
+    values = get_template_value_tuple(template_id, dye_index, template_type, is_legacy)
+    if values is None:
+        return None
+    effective_type = StainingTemplate.ENDWALKER if is_legacy else template_type
+    return {name: values_to_dict(values[start:start + element_size]) for name, (start, element_size) in PROPERTY_SLICES[effective_type].items()}
+
+
+def get_palette(template_id: int, template_type: StainingTemplate, is_legacy: bool = False) -> Optional[np.ndarray]:
+    """
+    Get every dye's values of a template as one array, so switching dyes (or going through all of them for a preview) is just indexing it.
+    Built the first time a template is asked for and kept for as long as the STM file is.
+
+    Args:
+        template_id: Template ID to get
+        template_type: Which template format to use
+        is_legacy: Whether to force Endwalker STM for legacy shaders
+
+    Returns:
+        np.ndarray or None: Read-only float32 array of shape (dyes, values), laid out like PROPERTY_SLICES.
+        Row N holds the same values as get_template_value_tuple(template_id, N, ...).
+    """
+    effective_type = StainingTemplate.ENDWALKER if is_legacy else template_type
+    stm_file = get_stm_cache(effective_type)
+    if not stm_file:
+        return None
+    return stm_file.get_palette(template_id)
+
+
+def configure_template_cache(max_entries: Optional[int] = None) -> None:
+    """
+    Changes how many looked up template values are kept. Anything left as None keeps its current value.
+
+    Args:
+        max_entries (int, optional): Maximum number of (template, dye) combinations to keep. 0 turns the cache off.
+    """
+    global _template_cache_max_entries
+    with _template_cache_lock:
+        if max_entries is not None:
+            _template_cache_max_entries = max(0, int(max_entries))
+        while len(_template_cache) > _template_cache_max_entries:
+            _template_cache.popitem(last=False)
+            _template_cache_stats['evictions'] += 1
+
+
+def get_template_cache_stats() -> Dict[str, int]:
+    """Hit/miss/eviction counters and current size of the template value cache, for debugging"""
+    with _template_cache_lock:
+        return dict(_template_cache_stats, entries=len(_template_cache), max_entries=_template_cache_max_entries)
+
+
+def clear_template_cache(reset_stats: bool = False) -> None:
+    """Forgets every looked up template value (the parsed STM files are kept)"""
+    with _template_cache_lock:
+        _template_cache.clear()
+        if reset_stats:
+            for stat in _template_cache_stats:
+                _template_cache_stats[stat] = 0
+
+
+def _load_stm_file(intended_template_type: StainingTemplate) -> Optional[StainingTemplateFile]:
+    """
+    Reads and parses the STM file for a template type, without touching the cache. Gives back None if it couldn't be loaded.
+    Uses the intended_template_type to find the file path, but the actual
+    type is determined by the file header during loading.
+    """
+    stm_path = None
+    try:
+        # Construct path relative to this script's parent's parent directory
+        # Adjust this path logic if necessary for your project structure
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        # Example: If script is in 'Project/FFGear/utils/stm_utils.py',
+        # addon_dir might be 'Project/FFGear'
+        addon_dir = os.path.dirname(script_dir) # Adjust if needed
+        assets_dir = os.path.join(addon_dir, "FFGear", "assets") # Assuming assets is sibling to utils
         
-    _template_cache[cache_key] = result
-    return result
+        # Get the expected filename based on the *intended* type
+        stm_filename = PAINT_FILE_PATHS.get(intended_template_type)
+        if not stm_filename:
+             logger.error(f"No file path defined for template type {intended_template_type.name}")
+             return None
+
+        stm_path = os.path.join(assets_dir, stm_filename)
+
+        if os.path.exists(stm_path):
+            logger.debug(f"Loading STM file: {stm_path} for intended type {intended_template_type.name}")
+            with open(stm_path, 'rb') as f:
+                file_data = f.read()
+            # Parse the file - constructor determines actual type
+            loaded_file = StainingTemplateFile(file_data, intended_template_type)
+            logger.debug(f"Successfully loaded and parsed. Actual type: {loaded_file.template_type.name}")
+            return loaded_file
+        else:
+            logger.error(f"STM file not found at expected path: {stm_path}")
+
+    except ValueError as e:
+        logger.error(f"Failed to parse STM file {stm_path}: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred loading STM file {stm_path}: {e}", exc_info=True)
+
+    return None
 
 
 def get_stm_cache(intended_template_type: StainingTemplate) -> Optional[StainingTemplateFile]:
     """
     Gets the StainingTemplateFile from cache or loads it.
-    Uses the intended_template_type to find the file path, but the actual
-    type is determined by the file header during loading.
+    If the warm-up thread (see start_stm_warm_up) already loaded it, that copy is taken instead of loading it again.
     """
-    global _stm_cache
+    loaded_file = _stm_cache.get(intended_template_type)
+    if loaded_file is not None:
+        return loaded_file
 
-    if intended_template_type not in _stm_cache or _stm_cache[intended_template_type] == None: # If we've never loaded it before, or if we did try before but failed
-        # File not in cache, attempt to load
-        _stm_cache[intended_template_type] = None # Mark as attempted
-        try:
-            # Construct path relative to this script's parent's parent directory
-            # Adjust this path logic if necessary for your project structure
-            script_dir = os.path.dirname(os.path.realpath(__file__))
-            # Example: If script is in 'Project/FFGear/utils/stm_utils.py',
-            # addon_dir might be 'Project/FFGear'
-            addon_dir = os.path.dirname(script_dir) # Adjust if needed
-            assets_dir = os.path.join(addon_dir, "FFGear", "assets") # Assuming assets is sibling to utils
-            
-            # Get the expected filename based on the *intended* type
-            stm_filename = PAINT_FILE_PATHS.get(intended_template_type)
-            if not stm_filename:
-                 logger.error(f"No file path defined for template type {intended_template_type.name}")
-                 return None
-
-            stm_path = os.path.join(assets_dir, stm_filename)
-
-            if os.path.exists(stm_path):
-                logger.debug(f"Loading STM file: {stm_path} for intended type {intended_template_type.name}")
-                with open(stm_path, 'rb') as f:
-                    file_data = f.read()
-                # Parse the file - constructor determines actual type
-                loaded_file = StainingTemplateFile(file_data, intended_template_type)
-                # Store the loaded file in the cache under the intended key
-                _stm_cache[intended_template_type] = loaded_file
-                logger.debug(f"Successfully loaded and parsed. Actual type: {loaded_file.template_type.name}")
-            else:
-                logger.error(f"STM file not found at expected path: {stm_path}")
-
-        except ValueError as e:
-            logger.error(f"Failed to parse STM file {stm_path}: {e}")
-            _stm_cache[intended_template_type] = None # Ensure cache reflects load failure
-        except Exception as e:
-            logger.error(f"An unexpected error occurred loading STM file {stm_path}: {e}", exc_info=True)
-            _stm_cache[intended_template_type] = None
+    with _stm_load_lock:
+        if _stm_cache.get(intended_template_type) is None: # If we've never loaded it before, or if we did try before but failed
+            # Take it from the warm-up if that already loaded it (just didn't hand it over yet), load it now otherwise
+            loaded_file = _warm_up_results.pop(intended_template_type, None)
+            _stm_cache[intended_template_type] = loaded_file if loaded_file is not None else _load_stm_file(intended_template_type)
 
-    # Return the cached object (which might be None if loading failed)
-    return _stm_cache.get(intended_template_type)
+        # Return the cached object (which might be None if loading failed)
+        return _stm_cache.get(intended_template_type)
 
 
 def get_modified_value(dye_info: Optional[Dict], property_name: str, dye_id: str) -> Optional[List[float]]:
@@ -575,54 +720,199 @@ def get_modified_value(dye_info: Optional[Dict], property_name: str, dye_id: str
     template_type = dye_info.get('template_type', StainingTemplate.DAWNTRAIL)
     # logger.debug(f"get_modified_value - Using template type: {template_type.name}")
 
-    template_values = get_template_values(template_id, dye_index, template_type)
+    template_values = get_template_value_tuple(template_id, dye_index, template_type)
     if not template_values:
         logger.warning(f"No template values found for template {template_id} ({template_type.name})")
         return None
 
-    if property_name not in template_values:
+    property_slice = PROPERTY_SLICES[template_type].get(property_name)
+    if property_slice is None:
         logger.warning(f"Property {property_name} not found in template {template_id}")
         return None
 
-    value_dict = template_values[property_name]
-    if not value_dict:
-        return None
-        
-    result = None
-    if "value" in value_dict:
-        result = value_dict["value"]
+    start, element_size = property_slice
+    if element_size == 1:
+        result = template_values[start]
     else:
-        result = [value_dict["R"], value_dict["G"], value_dict["B"]]
-    
+        result = list(template_values[start:start + element_size])
+
     # logger.debug(f"Modified value for {property_name}: {result}")
     return result
 
 
+# Which dye flag bit allows dyeing each property
+DYE_PROPERTY_FLAG_BITS = {
+    'diffuse': DYE_FLAG_BITS['dye_diffuse'],
+    'specular': DYE_FLAG_BITS['dye_specular'],
+    'emissive': DYE_FLAG_BITS['dye_emissive'],
+    'roughness': DYE_FLAG_BITS['dye_roughness'],
+    'metalness': DYE_FLAG_BITS['dye_metallic']
+}
+
 def should_apply_dye(dye_flags: Dict, property_name: str, channel: int) -> bool:
     """Determine if dye should be applied based on flags and channel"""
-    flag_map = {
-        'diffuse': 'dye_diffuse',
-        'specular': 'dye_specular', 
-        'emissive': 'dye_emissive',
-        'roughness': 'dye_roughness',
-        'metalness': 'dye_metallic'
-    }
-    
-    flag_name = flag_map.get(property_name)
-    if not flag_name:
-        return False
+    return bool(dye_flags.get('flags', 0) & DYE_PROPERTY_FLAG_BITS.get(property_name, 0)) and dye_flags.get('channel') == channel
 
-    flags = dye_flags.get('flags', {})
-    dye_channel = dye_flags.get('channel')
-    
-    return flags.get(flag_name, False) and dye_channel == channel
+
+@dataclass
+class ResolvedDyes:
+    """
+    Dyed values for every row of a material, from resolve_dyes.
+    values is (rows, flat values) laid out like PROPERTY_SLICES[template_type], applied is (rows, properties) and
+    says which of those values the dye actually replaces (property_names gives the order of the properties).
+    """
+    template_type: StainingTemplate
+    property_names: Tuple[str, ...]
+    values: np.ndarray
+    applied: np.ndarray
+
+    def get_row(self, row: int) -> Dict[str, object]:
+        """The dyed properties of one row, as property name -> float or [R, G, B] (the same as get_modified_value returns)"""
+        slices = PROPERTY_SLICES[self.template_type]
+        row_values = self.values[row].tolist()
+        result = {}
+        for name, is_applied in zip(self.property_names, self.applied[row].tolist()):
+            if is_applied:
+                start, element_size = slices[name]
+                result[name] = row_values[start] if element_size == 1 else row_values[start:start + element_size]
+        return result
+
+
+def resolve_dyes(template_ids: Sequence[int], channels: Sequence[int], dye_ids: Dict[int, object],
+                 template_type: StainingTemplate, flags: Optional[Sequence[int]] = None) -> Optional[ResolvedDyes]:
+    """
+    Looks up the dyed values of every row of a material in one go, instead of one get_modified_value call per row and property.
+    Each distinct (template, dye) pair is only looked up once (in the template's palette, see get_palette), then copied to every row that uses it.
+
+    Args:
+        template_ids: Dye template ID of every row, 0 for rows that can't be dyed.
+        channels: Dye channel of every row (1 or 2).
+        dye_ids: Dye channel -> selected dye ID (str or int, '0' or 0 meaning no dye).
+        template_type: Which template format to use.
+        flags: Dye flag bitmask of every row. Rows only get the properties their flags allow (like should_apply_dye), None allows every property.
+
+    Returns:
+        ResolvedDyes or None: The values, or None if the STM file couldn't be loaded.
+    """
+    slices = PROPERTY_SLICES.get(template_type)
+    if slices is None or get_stm_cache(template_type) is None:
+        return None
+
+    property_names = tuple(slices)
+    row_count = len(template_ids)
+    flat_size = sum(element_size for _, element_size in slices.values())
+
+    # Number every distinct (template, dye) pair, rows without a dye point at the extra zero row at the end
+    pair_numbers: Dict[Tuple[int, int], int] = {}
+    row_pairs = []
+    for template_id, channel in zip(template_ids, channels):
+        dye_id = dye_ids.get(channel)
+        if not template_id or dye_id is None or int(dye_id) == 0:
+            row_pairs.append(-1)
+        else:
+            row_pairs.append(pair_numbers.setdefault((int(template_id), int(dye_id)), len(pair_numbers)))
+
+    # Look every pair up once, straight out of the template's palette
+    pair_values = np.zeros((len(pair_numbers) + 1, flat_size), dtype=np.float64)
+    pair_found = np.zeros(len(pair_numbers) + 1, dtype=bool)
+    for (template_id, dye_index), number in pair_numbers.items():
+        palette = get_palette(template_id, template_type)
+        if palette is None:
+            logger.warning(f"No template values found for template {template_id} ({template_type.name})")
+            continue
+        dye_index = max(dye_index, 0) # Same as get_data, negative dyes are dye 0
+        if dye_index < len(palette):
+            pair_values[number] = palette[dye_index]
+        pair_found[number] = True # Dyes past the end of the palette are all 0, like get_data gives back
+
+    row_pairs = np.array(row_pairs, dtype=np.intp).reshape(row_count)
+    values = pair_values[row_pairs]
+    applied = np.repeat(pair_found[row_pairs].reshape(row_count, 1), len(property_names), axis=1)
+
+    # Only the properties every row's flags allow
+    if flags is not None:
+        property_bits = np.array([DYE_PROPERTY_FLAG_BITS.get(name, 0) for name in property_names], dtype=np.int64)
+        applied &= (np.asarray(flags, dtype=np.int64).reshape(row_count, 1) & property_bits) != 0
+
+    return ResolvedDyes(template_type, property_names, values, applied)
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BACKGROUND WARM-UP
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Opt-in (see the preferences): loads the STM files on a worker thread after the addon is registered, so the first dye change doesn't have to.
+# The worker never writes to _stm_cache, it leaves what it loaded in _warm_up_results and collect_stm_warm_up moves it over on the main thread
+# (called from a bpy.app.timers timer). The file itself is read outside of _stm_load_lock, the lock is only held to check and hand over,
+# so a dye change on the main thread never waits for the worker. Worst case both load the same file once, which is cheap now that the rows decode lazily.
+
+def _warm_up_worker(template_types: List[StainingTemplate], generation: int) -> None:
+    for template_type in template_types:
+        with _stm_load_lock:
+            if generation != _stm_cache_generation:
+                logger.debug("Caches were cleared during the STM warm-up, stopping it")
+                return
+            if _stm_cache.get(template_type) is not None or template_type in _warm_up_results:
+                continue # Something asked for it first
+        loaded_file = _load_stm_file(template_type)
+        with _stm_load_lock:
+            if generation != _stm_cache_generation:
+                logger.debug("Caches were cleared during the STM warm-up, stopping it")
+                return
+            if _stm_cache.get(template_type) is None:
+                _warm_up_results[template_type] = loaded_file
+    logger.debug("STM warm-up finished")
+
+
+def start_stm_warm_up(template_types: Optional[Sequence[StainingTemplate]] = None) -> bool:
+    """
+    Starts loading the STM files on a background thread. Call collect_stm_warm_up from the main thread until it gives back True.
+
+    Args:
+        template_types: Which files to load, defaults to all of them.
+
+    Returns:
+        bool: True if a thread was started, False if one is still running.
+    """
+    global _warm_up_thread
+    with _stm_load_lock:
+        if _warm_up_thread is not None and _warm_up_thread.is_alive():
+            return False
+        template_types = list(template_types) if template_types is not None else list(StainingTemplate)
+        _warm_up_thread = threading.Thread(target=_warm_up_worker, args=(template_types, _stm_cache_generation),
+                                           name="FFGear STM warm-up", daemon=True)
+        _warm_up_thread.start()
+    return True
+
+
+def collect_stm_warm_up() -> bool:
+    """
+    Moves whatever the warm-up thread has loaded so far into the STM cache. Meant to be called on the main thread.
+
+    Returns:
+        bool: True once the thread is done (or was never started), False while it's still loading.
+    """
+    # The worker holds the lock for a whole file load, don't make the UI wait for that, just try again on the next call
+    if not _stm_load_lock.acquire(blocking=False):
+        return False
+    try:
+        for template_type, loaded_file in list(_warm_up_results.items()):
+            if _stm_cache.get(template_type) is None:
+                _stm_cache[template_type] = loaded_file
+        _warm_up_results.clear()
+        return _warm_up_thread is None or not _warm_up_thread.is_alive()
+    finally:
+        _stm_load_lock.release()
 
 
 def clear_caches():
-    """Clear all caches"""
-    global _stm_cache, _template_cache
-    _stm_cache = {}  # Changed from None to empty dict
-    _template_cache.clear()
+    """Clear all caches, including STM files a warm-up loaded but didn't hand over yet"""
+    global _stm_cache, _stm_cache_generation
+    with _stm_load_lock:
+        _stm_cache_generation += 1 # A running warm-up stops after the file it's on
+        _warm_up_results.clear()
+        _stm_cache = {}  # Changed from None to empty dict
+    clear_template_cache()
 
 
 def register():
@@ -0,0 +1,636 @@
+import os
+import struct
+import logging
+import numpy as np
+from . import helpers
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+logging.basicConfig()
+logger = logging.getLogger('FFGear.tex')
+logger.setLevel(logging.INFO)
+
+##### WHAT THIS IS #####
+# Reads the game's own .tex files and decodes them with numpy, so textures can go straight into Blender images
+# instead of through the PNG copies Meddle writes next to them (which doubles the disk use and adds a PNG decode on top).
+# Supports A8R8G8B8 (and X8R8G8B8), BC1, BC3, BC4, BC5 and BC7, which is what gear, hair and skin textures use.
+# Every mip level is stored in the file, so a smaller one can be loaded instead of the full resolution one.
+########################
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DEFINITIONS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Values of the format field in the header
+TEX_FORMAT_A8R8G8B8 = 0x1450
+TEX_FORMAT_X8R8G8B8 = 0x1451
+TEX_FORMAT_BC1 = 0x3420
+TEX_FORMAT_BC3 = 0x3431
+TEX_FORMAT_BC4 = 0x6120
+TEX_FORMAT_BC5 = 0x6230
+TEX_FORMAT_BC7 = 0x6432
+
+TEX_FORMAT_NAMES = {
+    TEX_FORMAT_A8R8G8B8: 'A8R8G8B8',
+    TEX_FORMAT_X8R8G8B8: 'X8R8G8B8',
+    TEX_FORMAT_BC1: 'BC1',
+    TEX_FORMAT_BC3: 'BC3',
+    TEX_FORMAT_BC4: 'BC4',
+    TEX_FORMAT_BC5: 'BC5',
+    TEX_FORMAT_BC7: 'BC7',
+}
+
+# Bytes per 4x4 block for the compressed formats, bytes per pixel for the others
+BLOCK_SIZES = {TEX_FORMAT_BC1: 8, TEX_FORMAT_BC3: 16, TEX_FORMAT_BC4: 8, TEX_FORMAT_BC5: 16, TEX_FORMAT_BC7: 16}
+PIXEL_SIZES = {TEX_FORMAT_A8R8G8B8: 4, TEX_FORMAT_X8R8G8B8: 4}
+
+# attribute, format, width, height, depth, mip levels, array size, lod offsets[3], mip offsets[13]
+TEX_HEADER_STRUCT = struct.Struct('<IIHHHBB3I13I')
+TEX_MAX_MIPS = 13
+
+# Big BC7 textures are decoded this many blocks at a time, to keep the temporary arrays from getting huge
+DECODE_CHUNK_BLOCKS = 1 << 16
+
+
+@dataclass
+class TexHeader:
+    texture_format: int
+    width: int
+    height: int
+    depth: int
+    mip_count: int
+    array_size: int
+    mip_offsets: Tuple[int, ...]
+
+    @property
+    def format_name(self) -> str:
+        return TEX_FORMAT_NAMES.get(self.texture_format, f"0x{self.texture_format:04X}")
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# HEADER AND MIPS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def read_tex_header(buffer) -> TexHeader:
+    """Reads the 80 byte header at the start of a .tex file. Raises ValueError/struct.error if it can't."""
+    (_, texture_format, width, height, depth, mip_levels, array_size, *offsets) = TEX_HEADER_STRUCT.unpack_from(buffer, 0)
+    if width == 0 or height == 0:
+        raise ValueError(f"Invalid texture size {width}x{height}")
+    mip_count = max(1, min(mip_levels & 0x7F, TEX_MAX_MIPS)) # The top bit is a flag in newer files
+    return TexHeader(texture_format, width, height, max(depth, 1), mip_count, max(array_size, 1), tuple(offsets[3:]))
+
+
+def mip_dimensions(header: TexHeader, mip_level: int) -> Tuple[int, int]:
+    return max(1, header.width >> mip_level), max(1, header.height >> mip_level)
+
+
+def mip_byte_size(texture_format: int, width: int, height: int) -> int:
+    """Bytes one 2D surface of this size takes"""
+    if texture_format in BLOCK_SIZES:
+        return ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_SIZES[texture_format]
+    if texture_format in PIXEL_SIZES:
+        return width * height * PIXEL_SIZES[texture_format]
+    raise ValueError(f"Unsupported texture format 0x{texture_format:04X}")
+
+
+def mip_offset(header: TexHeader, mip_level: int) -> int:
+    """Where a mip level starts in the file. Uses the offset table, and works it out from the sizes if an entry is missing."""
+    offset = TEX_HEADER_STRUCT.size
+    for level in range(mip_level + 1):
+        if header.mip_offsets[level]:
+            offset = header.mip_offsets[level]
+        if level < mip_level:
+            width, height = mip_dimensions(header, level)
+            offset_after = offset + mip_byte_size(header.texture_format, width, height) * header.depth * header.array_size
+            if level + 1 >= len(header.mip_offsets) or not header.mip_offsets[level + 1]:
+                offset = offset_after
+    return offset
+
+
+def pick_mip_level(header: TexHeader, max_size: int) -> int:
+    """The biggest mip level whose width and height both fit in max_size. 0 (or less) means always the full size."""
+    if max_size <= 0:
+        return 0
+    level = 0
+    while level < header.mip_count - 1 and max(mip_dimensions(header, level)) > max_size:
+        level += 1
+    return level
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BLOCK DECODERS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# Every decoder takes an (N, block size) uint8 array of blocks and gives back an (N, 16, 4) uint8 array of RGBA pixels,
+# 16 pixels per block in row order.
+
+_PIXEL_SHIFTS_2 = np.arange(16, dtype=np.uint32) * 2
+_PIXEL_SHIFTS_3 = np.arange(16, dtype=np.int64) * 3
+
+
+def _lookup(palette: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    palette[index, block] for every pixel, with a (K, N) palette and (N, 16) indices.
+    The palette is kept one row per entry so building it works on long rows of blocks, and the lookup is a single flat gather.
+    """
+    entry_count, block_count = palette.shape
+    # Each block's entries next to each other again first, so the lookups of a block stay in the same cache line
+    return palette.T.ravel()[indices + np.arange(0, entry_count * block_count, entry_count)[:, None]]
+
+
+def _expand_565(colors: np.ndarray) -> np.ndarray:
+    """(N,) RGB565 shorts to (3, N) 8 bit values"""
+    colors = colors.astype(np.int32)
+    r = (colors >> 11) & 0x1F
+    g = (colors >> 5) & 0x3F
+    b = colors & 0x1F
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)))
+
+
+def _pack_rgba(rgb: np.ndarray, alpha) -> np.ndarray:
+    """(3, N) colors and their alpha as one little endian 32 bit value each, so the bytes come out as RGBA"""
+    rgb = rgb.astype(np.dtype('<u4'))
+    return rgb[0] | (rgb[1] << 8) | (rgb[2] << 16) | (np.asarray(alpha, dtype=np.dtype('<u4')) << 24)
+
+
+def _decode_bc1_color(blocks: np.ndarray, punch_through: bool) -> np.ndarray:
+    """The color half of BC1/BC3. BC3 always uses the 4 color mode, BC1 switches to 3 colors + transparent when color0 <= color1."""
+    count = len(blocks)
+    endpoints = np.ascontiguousarray(blocks[:, 0:4]).view('<u2')
+    color0 = _expand_565(endpoints[:, 0])
+    color1 = _expand_565(endpoints[:, 1])
+
+    # Every palette color as one 32 bit value, so each pixel is a single lookup instead of four
+    palette = np.empty((4, count), dtype=np.dtype('<u4'))
+    palette[0] = _pack_rgba(color0, 255)
+    palette[1] = _pack_rgba(color1, 255)
+    palette[2] = _pack_rgba((2 * color0 + color1) // 3, 255)
+    palette[3] = _pack_rgba((color0 + 2 * color1) // 3, 255)
+    if punch_through:
+        three_color = endpoints[:, 0] <= endpoints[:, 1]
+        palette[2] = np.where(three_color, _pack_rgba((color0 + color1) // 2, 255), palette[2])
+        palette[3] = np.where(three_color, 0, palette[3]) # Transparent black
+
+    indices = np.ascontiguousarray(blocks[:, 4:8]).view('<u4')
+    indices = (indices >> _PIXEL_SHIFTS_2) & 0b11 # (N, 16)
+    return _lookup(palette, indices.astype(np.intp)).view(np.uint8).reshape(count, 16, 4)
+
+
+def _decode_bc4_channel(blocks: np.ndarray) -> np.ndarray:
+    """One BC4 style channel (also the alpha of BC3 and both channels of BC5), (N, 8) blocks to (N, 16) values"""
+    value0 = blocks[:, 0].astype(np.int32)
+    value1 = blocks[:, 1].astype(np.int32)
+    eight_values = value0 > value1
+
+    palette = np.empty((8, len(blocks)), dtype=np.uint8)
+    palette[0] = value0
+    palette[1] = value1
+    for step in range(1, 7):
+        interpolated = ((7 - step) * value0 + step * value1) // 7
+        if step <= 4:
+            palette[step + 1] = np.where(eight_values, interpolated, ((5 - step) * value0 + step * value1) // 5)
+        else:
+            palette[step + 1] = np.where(eight_values, interpolated, 0 if step == 5 else 255)
+
+    # The 16 3 bit indices are the top 48 bits of the block
+    index_bits = (np.ascontiguousarray(blocks).view('<u8')[:, 0] >> np.uint64(16)).view(np.int64) # Top bits are 0 now, so it fits
+    indices = (index_bits[:, None] >> _PIXEL_SHIFTS_3) & 0b111
+    return _lookup(palette, indices)
+
+
+def decode_bc1(blocks: np.ndarray) -> np.ndarray:
+    return _decode_bc1_color(blocks, punch_through=True)
+
+
+def decode_bc3(blocks: np.ndarray) -> np.ndarray:
+    pixels = _decode_bc1_color(blocks[:, 8:16], punch_through=False)
+    pixels[:, :, 3] = _decode_bc4_channel(blocks[:, 0:8])
+    return pixels
+
+
+def decode_bc4(blocks: np.ndarray) -> np.ndarray:
+    pixels = np.empty((len(blocks), 16, 4), dtype=np.uint8)
+    pixels[:, :, 0:3] = _decode_bc4_channel(blocks)[:, :, None]
+    pixels[:, :, 3] = 255
+    return pixels
+
+
+def decode_bc5(blocks: np.ndarray) -> np.ndarray:
+    pixels = np.zeros((len(blocks), 16, 4), dtype=np.uint8)
+    pixels[:, :, 0] = _decode_bc4_channel(blocks[:, 0:8])
+    pixels[:, :, 1] = _decode_bc4_channel(blocks[:, 8:16])
+    pixels[:, :, 3] = 255
+    return pixels
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BC7
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# Tables straight from the BC7 format spec. Blocks are grouped by mode and every group is decoded at once.
+
+# subsets, partition bits, rotation bits, index selection bits, color bits, alpha bits, endpoint p-bits, shared p-bits, index bits, second index bits
+BC7_MODES = (
+    (3, 4, 0, 0, 4, 0, 1, 0, 3, 0),
+    (2, 6, 0, 0, 6, 0, 0, 1, 3, 0),
+    (3, 6, 0, 0, 5, 0, 0, 0, 2, 0),
+    (2, 6, 0, 0, 7, 0, 1, 0, 2, 0),
+    (1, 0, 2, 1, 5, 6, 0, 0, 2, 3),
+    (1, 0, 2, 0, 7, 8, 0, 0, 2, 2),
+    (1, 0, 0, 0, 7, 7, 1, 0, 4, 0),
+    (2, 6, 0, 0, 5, 5, 1, 0, 2, 0),
+)
+
+# Which pixels belong to the second subset, one bit per pixel
+_BC7_PARTITIONS_2_MASKS = (
+    0xCCCC, 0x8888, 0xEEEE, 0xECC8, 0xC880, 0xFEEC, 0xFEC8, 0xEC80, 0xC800, 0xFFEC, 0xFE80, 0xE800, 0xFFE8, 0xFF00, 0xFFF0, 0xF000,
+    0xF710, 0x008E, 0x7100, 0x08CE, 0x008C, 0x7310, 0x3100, 0x8CCE, 0x088C, 0x3110, 0x6666, 0x366C, 0x17E8, 0x0FF0, 0x718E, 0x399C,
+    0xAAAA, 0xF0F0, 0x5A5A, 0x33CC, 0x3C3C, 0x55AA, 0x9696, 0xA55A, 0x73CE, 0x13C8, 0x324C, 0x3BDC, 0x6996, 0xC33C, 0x9966, 0x0660,
+    0x0272, 0x04E4, 0x4E40, 0x2720, 0xC936, 0x936C, 0x39C6, 0x639C, 0x9336, 0x9CC6, 0x817E, 0xE718, 0xCCF0, 0x0FCC, 0x7744, 0xEE22,
+)
+BC7_PARTITIONS_2 = ((np.array(_BC7_PARTITIONS_2_MASKS, dtype=np.int32)[:, None] >> np.arange(16)) & 1).astype(np.uint8)
+
+BC7_PARTITIONS_3 = np.array([[int(subset) for subset in row] for row in (
+    "0011001102212222", "0001001122112221", "0000200122112211", "0222002200110111",
+    "0000000011221122", "0011001100220022", "0022002211111111", "0011001122112211",
+    "0000000011112222", "0000111111112222", "0000111122222222", "0012001200120012",
+    "0112011201120112", "0122012201220122", "0011011211221222", "0011200122002220",
+    "0001001101121122", "0111001120012200", "0000112211221122", "0022002200221111",
+    "0111011102220222", "0001000122212221", "0000001101220122", "0000110022102210",
+    "0122012200110000", "0012001211222222", "0110122112210110", "0000011012211221",
+    "0022110211020022", "0110011020022222", "0011012201220011", "0000200022112221",
+    "0000000211221222", "0222002200120011", "0011001200220222", "0120012001200120",
+    "0000111122220000", "0120120120120120", "0120201212010120", "0011220011220011",
+    "0011112222000011", "0101010122222222", "0000000021212121", "0022112200221122",
+    "0022001100220011", "0220122102201221", "0101222222220101", "0000212121212121",
+    "0101010101012222", "0222011102220111", "0002111200021112", "0000211221122112",
+    "0222011101110222", "0002111211120002", "0110011001102222", "0000000021122112",
+    "0110011022222222", "0022001100110022", "0022112211220022", "0000000000002112",
+    "0002000100020001", "0222122202221222", "0101222222222222", "0111201122012220",
+)], dtype=np.uint8)
+
+# Pixel whose index has its top bit left out, for the second (and third) subset
+BC7_ANCHORS_2 = np.array((
+    15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15,
+    15, 2, 8, 2, 2, 8, 8, 15, 2, 8, 2, 2, 8, 8, 2, 2,
+    15, 15, 6, 8, 2, 8, 15, 15, 2, 8, 2, 2, 2, 15, 15, 6,
+    6, 2, 6, 8, 15, 15, 2, 2, 15, 15, 15, 15, 15, 2, 2, 15,
+))
+BC7_ANCHORS_3_SECOND = np.array((
+    3, 3, 15, 15, 8, 3, 15, 15, 8, 8, 6, 6, 6, 5, 3, 3,
+    3, 3, 8, 15, 3, 3, 6, 10, 5, 8, 8, 6, 8, 5, 15, 15,
+    8, 15, 3, 5, 6, 10, 8, 15, 15, 3, 15, 5, 15, 15, 15, 15,
+    3, 15, 5, 5, 5, 8, 5, 10, 5, 10, 8, 13, 15, 12, 3, 3,
+))
+BC7_ANCHORS_3_THIRD = np.array((
+    15, 8, 8, 3, 15, 15, 3, 8, 15, 15, 15, 15, 15, 15, 15, 8,
+    15, 8, 15, 3, 15, 8, 15, 8, 3, 15, 6, 10, 15, 15, 10, 8,
+    15, 3, 15, 10, 10, 8, 9, 10, 6, 15, 8, 15, 3, 6, 6, 8,
+    15, 3, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 3, 15, 15, 8,
+))
+
+_BC7_INDEX_LAYOUTS: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {} # Filled by _bc7_index_layout
+
+BC7_WEIGHTS = {
+    2: np.array((0, 21, 43, 64), dtype=np.int32),
+    3: np.array((0, 9, 18, 27, 37, 46, 55, 64), dtype=np.int32),
+    4: np.array((0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64), dtype=np.int32),
+}
+
+
+def _read_field(words: Tuple[np.ndarray, np.ndarray], start: int, count: int) -> np.ndarray:
+    """
+    A field of up to 63 bits at a fixed bit position of every block, as uint64.
+    words is the (low, high) pair of 64 bit halves of every block, see _block_words.
+    """
+    low, high = words
+    mask = np.uint64((1 << count) - 1)
+    if start >= 64:
+        return (high >> np.uint64(start - 64)) & mask
+    if start + count <= 64:
+        return (low >> np.uint64(start)) & mask
+    return ((low >> np.uint64(start)) | (high << np.uint64(64 - start))) & mask # Crosses into the high half
+
+
+def _read_bits(words: Tuple[np.ndarray, np.ndarray], start: int, count: int) -> np.ndarray:
+    """A small field (like an endpoint or the partition) at a fixed bit position of every block, as int32"""
+    if count == 0:
+        return np.zeros(len(words[0]), dtype=np.int32)
+    return _read_field(words, start, count).astype(np.int32)
+
+
+def _bc7_index_layout(subsets: int, index_bits: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Where every pixel's index starts within the index bits, and the mask for its width, for every partition (both (partitions, 16) uint64).
+    Anchor pixels have one bit less, so this depends on which pixels the partition's anchors are.
+    """
+    layout = _BC7_INDEX_LAYOUTS.get((subsets, index_bits))
+    if layout is None:
+        anchors = np.zeros((64, 16), dtype=np.int32)
+        anchors[:, 0] = 1
+        if subsets == 2:
+            anchors[np.arange(64), BC7_ANCHORS_2] = 1
+        elif subsets == 3:
+            anchors[np.arange(64), BC7_ANCHORS_3_SECOND] = 1
+            anchors[np.arange(64), BC7_ANCHORS_3_THIRD] = 1
+        widths = index_bits - anchors
+        layout = ((np.cumsum(widths, axis=1) - widths).astype(np.uint64), ((1 << widths) - 1).astype(np.uint64))
+        _BC7_INDEX_LAYOUTS[(subsets, index_bits)] = layout
+    return layout
+
+
+def _read_indices(words: Tuple[np.ndarray, np.ndarray], start: int, index_bits: int, subsets: int, partition: np.ndarray) -> np.ndarray:
+    """
+    The 16 pixel indices of every block, (N, 16) int32.
+    All the indices of a block fit in 63 bits in every mode, so they're read as one word and shifted apart.
+    """
+    offsets, masks = _bc7_index_layout(subsets, index_bits)
+    index_word = _read_field(words, start, 16 * index_bits - subsets)
+    return ((index_word[:, None] >> offsets[partition]) & masks[partition]).astype(np.int32)
+
+
+def _block_words(blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(N, 16) uint8 blocks as their (low, high) 64 bit halves"""
+    words = np.ascontiguousarray(blocks).view('<u8')
+    return words[:, 0], words[:, 1]
+
+
+def _unquantize(values: np.ndarray, bit_count: int) -> np.ndarray:
+    """Expands n bit endpoint values to 8 bits by repeating the top bits"""
+    values = values << (8 - bit_count)
+    return values | (values >> bit_count)
+
+
+def _interpolate(endpoint0: np.ndarray, endpoint1: np.ndarray, indices: np.ndarray, index_bits: int) -> np.ndarray:
+    weights = BC7_WEIGHTS[index_bits][indices]
+    if endpoint0.ndim == weights.ndim + 1:
+        weights = weights[..., None]
+    return ((64 - weights) * endpoint0 + weights * endpoint1 + 32) >> 6
+
+
+def _decode_bc7_mode(blocks: np.ndarray, mode: int) -> np.ndarray:
+    subsets, partition_bits, rotation_bits, index_selection_bits, color_bits, alpha_bits, endpoint_pbits, shared_pbits, index_bits, index_bits_2 = BC7_MODES[mode]
+    count = len(blocks)
+    words = _block_words(blocks)
+
+    position = mode + 1
+    partition = _read_bits(words, position, partition_bits); position += partition_bits
+    rotation = _read_bits(words, position, rotation_bits); position += rotation_bits
+    index_selection = _read_bits(words, position, index_selection_bits); position += index_selection_bits
+
+    # Endpoints, all reds first, then all greens etc. Kept as (channel, endpoint, block) so every operation works on long rows of blocks.
+    endpoint_count = subsets * 2
+    endpoints = np.empty((4, endpoint_count, count), dtype=np.int32)
+    for channel in range(3):
+        for endpoint in range(endpoint_count):
+            endpoints[channel, endpoint] = _read_bits(words, position, color_bits)
+            position += color_bits
+    if alpha_bits:
+        for endpoint in range(endpoint_count):
+            endpoints[3, endpoint] = _read_bits(words, position, alpha_bits)
+            position += alpha_bits
+
+    # P-bits add one more low bit to each endpoint (or to both endpoints of a subset)
+    color_precision, alpha_precision = color_bits, alpha_bits
+    if endpoint_pbits or shared_pbits:
+        pbits = np.empty((endpoint_count, count), dtype=np.int32)
+        if endpoint_pbits:
+            for endpoint in range(endpoint_count):
+                pbits[endpoint] = _read_bits(words, position, 1)
+                position += 1
+        else:
+            for subset in range(subsets):
+                pbits[subset * 2] = pbits[subset * 2 + 1] = _read_bits(words, position, 1)
+                position += 1
+        endpoints = (endpoints << 1) | pbits
+        color_precision += 1
+        if alpha_bits:
+            alpha_precision += 1
+
+    endpoints[:3] = _unquantize(endpoints[:3], color_precision)
+    if alpha_bits:
+        endpoints[3] = _unquantize(endpoints[3], alpha_precision)
+    else:
+        endpoints[3] = 255
+
+    # Which subset every pixel is in
+    if subsets == 1:
+        pixel_subsets = np.zeros((count, 16), dtype=np.intp)
+    elif subsets == 2:
+        pixel_subsets = BC7_PARTITIONS_2[partition].astype(np.intp)
+    else:
+        pixel_subsets = BC7_PARTITIONS_3[partition].astype(np.intp)
+
+    indices = _read_indices(words, position, index_bits, subsets, partition)
+    position += 16 * index_bits - subsets
+
+    if index_bits_2:
+        # Modes 4 and 5 have a second set of indices, one set is used for the colors and the other for alpha. They only have one subset.
+        endpoint0 = endpoints[:, 0].T[:, None, :] # (N, 1, 4)
+        endpoint1 = endpoints[:, 1].T[:, None, :]
+        indices_2 = _read_indices(words, position, index_bits_2, subsets, partition)
+        pixels = np.empty((count, 16, 4), dtype=np.int32)
+        pixels[:, :, :3] = _interpolate(endpoint0[:, :, :3], endpoint1[:, :, :3], indices, index_bits)
+        pixels[:, :, 3] = _interpolate(endpoint0[:, :, 3], endpoint1[:, :, 3], indices_2, index_bits_2)
+        swapped = index_selection == 1 # Only mode 4 has the bit
+        if swapped.any():
+            pixels[swapped, :, :3] = _interpolate(endpoint0[swapped, :, :3], endpoint1[swapped, :, :3], indices_2[swapped], index_bits_2)
+            pixels[swapped, :, 3] = _interpolate(endpoint0[swapped, :, 3], endpoint1[swapped, :, 3], indices[swapped], index_bits)
+    else:
+        # Every color each subset can have, packed into 32 bits, then a single lookup per pixel.
+        # Same as _interpolate, rearranged to ((64 - w) * e0 + w * e1 + 32) >> 6 == e0 + ((w * (e1 - e0) + 32) >> 6), which fits in 16 bits.
+        weights = BC7_WEIGHTS[index_bits].astype(np.int16)[:, None, None, None]
+        endpoint0 = endpoints[:, 0::2].astype(np.int16) # (channel, subset, block)
+        difference = endpoints[:, 1::2].astype(np.int16) - endpoint0
+        channels = (endpoint0 + ((weights * difference + 32) >> 6)).astype(np.dtype('<u4')) # (level, channel, subset, block)
+        palette = (channels[:, 0] | (channels[:, 1] << 8) | (channels[:, 2] << 16) | (channels[:, 3] << 24)).ravel()
+        palette_indices = indices * (subsets * count) + pixel_subsets * count + np.arange(count)[:, None]
+        pixels = palette[palette_indices].view(np.uint8).reshape(count, 16, 4)
+
+    # Rotation swaps alpha with one of the color channels
+    for rotated_channel in range(3):
+        rotated = rotation == rotated_channel + 1
+        if rotated.any():
+            channel_values = pixels[rotated, :, rotated_channel].copy()
+            pixels[rotated, :, rotated_channel] = pixels[rotated, :, 3]
+            pixels[rotated, :, 3] = channel_values
+
+    return pixels.astype(np.uint8, copy=False)
+
+
+def decode_bc7(blocks: np.ndarray) -> np.ndarray:
+    pixels = np.zeros((len(blocks), 16, 4), dtype=np.uint8) # Blocks with an invalid mode stay transparent black
+    first_bytes = blocks[:, 0]
+    for mode in range(8):
+        # The mode is the position of the lowest set bit in the first byte
+        in_mode = (first_bytes & ((2 << mode) - 1)) == (1 << mode)
+        if not in_mode.any():
+            continue
+        mode_indices = np.flatnonzero(in_mode)
+        for chunk_start in range(0, len(mode_indices), DECODE_CHUNK_BLOCKS):
+            chunk = mode_indices[chunk_start:chunk_start + DECODE_CHUNK_BLOCKS]
+            pixels[chunk] = _decode_bc7_mode(blocks[chunk], mode)
+    return pixels
+
+
+BLOCK_DECODERS = {
+    TEX_FORMAT_BC1: decode_bc1,
+    TEX_FORMAT_BC3: decode_bc3,
+    TEX_FORMAT_BC4: decode_bc4,
+    TEX_FORMAT_BC5: decode_bc5,
+    TEX_FORMAT_BC7: decode_bc7,
+}
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# DECODING
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def decode_surface(data, texture_format: int, width: int, height: int) -> np.ndarray:
+    """
+    Decodes one 2D surface (a single mip level of a single slice).
+
+    Args:
+        data: The surface's bytes (bytes, memoryview, ...).
+        texture_format (int): One of the TEX_FORMAT_ values.
+        width (int), height (int): Size of the surface in pixels.
+
+    Returns:
+        np.ndarray: (height, width, 4) uint8 RGBA, first row is the top of the image.
+    """
+    byte_size = mip_byte_size(texture_format, width, height)
+    if len(data) < byte_size:
+        raise EOFError(f"Surface needs {byte_size} bytes, only {len(data)} available")
+
+    if texture_format in PIXEL_SIZES:
+        bgra = np.frombuffer(data, dtype=np.uint8, count=byte_size).reshape(height, width, 4)
+        rgba = bgra[:, :, [2, 1, 0, 3]]
+        if texture_format == TEX_FORMAT_X8R8G8B8:
+            rgba[:, :, 3] = 255
+        return rgba
+
+    blocks_x, blocks_y = (width + 3) // 4, (height + 3) // 4
+    block_size = BLOCK_SIZES[texture_format]
+    blocks = np.frombuffer(data, dtype=np.uint8, count=byte_size).reshape(-1, block_size)
+    pixels = np.empty((len(blocks), 16, 4), dtype=np.uint8)
+    decoder = BLOCK_DECODERS[texture_format]
+    for chunk_start in range(0, len(blocks), DECODE_CHUNK_BLOCKS):
+        pixels[chunk_start:chunk_start + DECODE_CHUNK_BLOCKS] = decoder(blocks[chunk_start:chunk_start + DECODE_CHUNK_BLOCKS])
+
+    # (block row, block column, pixel row, pixel column) -> image rows and columns, then crop the padding of partial blocks
+    image = pixels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(blocks_y * 4, blocks_x * 4, 4)
+    return image[:height, :width]
+
+
+def decode_tex(buffer, mip_level: int = 0) -> Optional[np.ndarray]:
+    """
+    Decodes a .tex file that's already in memory.
+
+    Args:
+        buffer: The whole file (bytes, memoryview, mmap, ...).
+        mip_level (int): Which mip level to decode, 0 is the full size. Clamped to the levels the file has.
+
+    Returns:
+        np.ndarray: (height, width, 4) uint8 RGBA with the top row first, or None if it couldn't be decoded.
+    """
+    try:
+        header = read_tex_header(buffer)
+        mip_level = max(0, min(mip_level, header.mip_count - 1))
+        width, height = mip_dimensions(header, mip_level)
+        start = mip_offset(header, mip_level)
+        return decode_surface(memoryview(buffer)[start:], header.texture_format, width, height)
+    except (ValueError, EOFError, struct.error) as e:
+        logger.error(f"Could not decode texture: {e}")
+        return None
+
+
+def read_tex_file(filepath: str, mip_level: int = 0, max_size: int = 0) -> Optional[Tuple[np.ndarray, TexHeader]]:
+    """
+    Reads and decodes a .tex file. Only the header and the wanted mip level are read from disk.
+
+    Args:
+        filepath (str): Path to the .tex file.
+        mip_level (int): Which mip level to decode, 0 is the full size.
+        max_size (int): If above 0, the first mip level that fits in this many pixels is used instead (when it's smaller than mip_level's).
+
+    Returns:
+        tuple (np.ndarray, TexHeader): The pixels ((height, width, 4) uint8 RGBA, top row first) and the file's header, or None if it couldn't be read.
+    """
+    try:
+        with open(helpers.safe_filepath(filepath), 'rb') as f:
+            header_bytes = f.read(TEX_HEADER_STRUCT.size)
+            header = read_tex_header(header_bytes)
+            mip_level = max(mip_level, pick_mip_level(header, max_size))
+            mip_level = max(0, min(mip_level, header.mip_count - 1))
+            width, height = mip_dimensions(header, mip_level)
+            f.seek(mip_offset(header, mip_level))
+            data = f.read(mip_byte_size(header.texture_format, width, height))
+        return decode_surface(data, header.texture_format, width, height), header
+    except FileNotFoundError:
+        logger.error(f"Texture file not found at: {filepath}")
+    except (OSError, ValueError, EOFError, struct.error) as e:
+        logger.error(f"Could not read texture {filepath}: {e}")
+    return None
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BLENDER
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+# Custom property on images made by load_tex_image, the path of the .tex file they came from
+TEX_SOURCE_PROPERTY = "ffgear_tex_path"
+
+
+def load_tex_image(filepath: str, name: Optional[str] = None, mip_level: int = 0, max_size: int = 0, colorspace: str = 'Non-Color'):
+    """
+    Makes a Blender image out of a .tex file, without any intermediate image file.
+    The image isn't packed here, there's no file on disk Blender could load it from again though, so see pack_tex_images.
+
+    Args:
+        filepath (str): Path to the .tex file.
+        name (str, optional): Name of the image datablock. Defaults to the file name.
+        mip_level (int): Which mip level to load, 0 is the full size. Higher levels are half the size each.
+        max_size (int): If above 0, use the first mip level that fits in this many pixels.
+        colorspace (str): Colorspace of the image.
+
+    Returns:
+        bpy.types.Image or None: The new image, or None if the file couldn't be read.
+    """
+    import bpy # Here so the decoding above can be used (and benchmarked) outside of Blender
+
+    result = read_tex_file(filepath, mip_level, max_size)
+    if result is None:
+        return None
+    pixels, header = result
+    height, width = pixels.shape[:2]
+
+    image = bpy.data.images.new(name or os.path.basename(filepath), width=width, height=height, alpha=True)
+    image.colorspace_settings.name = colorspace
+    # Blender wants float RGBA with the bottom row first
+    float_pixels = np.flipud(pixels).astype(np.float32).ravel()
+    float_pixels *= 1.0 / 255.0
+    image.pixels.foreach_set(float_pixels)
+    image.update()
+    image[TEX_SOURCE_PROPERTY] = filepath
+    logger.debug(f"Loaded {filepath} ({header.format_name}, {header.width}x{header.height}) as {width}x{height}")
+    return image
+
+
+def pack_tex_images() -> int:
+    """
+    Packs the images load_tex_image made that are still used by something, so their pixels are saved with the .blend file.
+    Meant for right before saving, that way images that were replaced or deleted again never get encoded.
+
+    Returns:
+        int: How many images were packed.
+    """
+    import bpy
+
+    packed_count = 0
+    for image in bpy.data.images:
+        if image.packed_file is None and image.users and image.get(TEX_SOURCE_PROPERTY):
+            try:
+                image.pack()
+                packed_count += 1
+            except RuntimeError as e:
+                logger.error(f"Could not pack {image.name}, it will be empty after reopening the file: {e}")
+    return packed_count
@@ -0,0 +1,25 @@
+import os
+import sys
+import types
+import importlib
+
+##### WHAT THIS IS #####
+# Lets the benchmarks import FFGear's modules without Blender.
+# FFGear/__init__.py imports bpy and all the operators and panels, so instead of importing the package normally
+# an empty "FFGear" package pointing at the folder is registered, and only the modules that are asked for get imported.
+# Those have to be the ones that don't need bpy (mtrl_handler, stm_utils, helpers, ...).
+########################
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_DIR = os.path.join(REPO_DIR, "FFGear")
+ASSETS_DIR = os.path.join(ADDON_DIR, "assets")
+
+
+def load(module_name: str) -> types.ModuleType:
+    """Imports FFGear.<module_name> without running FFGear/__init__.py"""
+    package = sys.modules.get("FFGear")
+    if package is None:
+        package = types.ModuleType("FFGear")
+        package.__path__ = [ADDON_DIR]
+        sys.modules["FFGear"] = package
+    return importlib.import_module(f"FFGear.{module_name}")
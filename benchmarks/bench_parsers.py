@@ -0,0 +1,357 @@
+import io
+import os
+import sys
+import gc
+import json
+import time
+import logging
+import warnings
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _ffgear import load, ASSETS_DIR
+import synthetic_mtrl
+import synthetic_sqpack
+
+mtrl_handler = load('mtrl_handler')
+stm_utils = load('stm_utils')
+sqpack = load('sqpack')
+tex_reader = load('tex_reader')
+
+try:
+    from PIL import Image # Only for comparing the .tex decoding against loading the PNG Meddle writes instead
+except ImportError:
+    Image = None
+
+##### WHAT THIS IS #####
+# Timing and peak memory benchmarks for the MTRL, texture and STM parsers, runnable with any Python that has numpy (no Blender needed).
+# Results are written as JSON so two runs (before and after a parser change) can be compared with --compare.
+#
+#   python benchmarks/bench_parsers.py --json before.json
+#   ...change things...
+#   python benchmarks/bench_parsers.py --json after.json --compare before.json
+########################
+
+SCHEMA_VERSION = 1
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# MEASURING
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def measure(name: str, func: Callable[[], object], repeat: int, number: int = 1,
+            setup: Optional[Callable[[], None]] = None, items: int = 1) -> Dict:
+    """
+    Times func and records its peak traced memory.
+
+    Args:
+        name (str): Benchmark name, used as the key when comparing runs.
+        func: The thing to measure. Called number times per repeat.
+        repeat (int): How many timed rounds to do. Stats are over the rounds.
+        number (int): Calls per round. The reported times are per call.
+        setup: Called before every round (and before the memory run), outside the timing.
+        items (int): How many things (files, lookups, ...) a single call handles, so per-item times can be reported too.
+
+    Returns:
+        dict: The result entry for the JSON output.
+    """
+    # One untimed warm-up call, so imports, first-touch page faults etc. don't end up in the first round
+    if setup:
+        setup()
+    func()
+
+    times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable() # Same as timeit, collections in the middle of a round are just noise
+    try:
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Memory is measured in its own call because tracemalloc slows everything down a lot
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'name': name,
+        'repeat': repeat,
+        'number': number,
+        'items': items,
+        'mean_s': statistics.fmean(times),
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'max_s': max(times),
+        'stdev_s': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'per_item_median_s': statistics.median(times) / items,
+        'peak_bytes': peak_bytes,
+    }
+    print(f"  {name:<52} median {_format_seconds(result['median_s']):>10}  min {_format_seconds(result['min_s']):>10}  peak {_format_bytes(peak_bytes):>9}")
+    return result
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def _format_bytes(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    if size >= 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size} B"
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BENCHMARKS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def bench_mtrl(work_dir: str, repeat: int, corpus_size: int) -> List[Dict]:
+    print("MTRL")
+    results = []
+
+    # Single files, one of every kind
+    single_dir = os.path.join(work_dir, 'single')
+    os.makedirs(single_dir, exist_ok=True)
+    for variant in synthetic_mtrl.VARIANTS:
+        for dye in (False, True):
+            path = os.path.join(single_dir, f"{variant}{'_dye' if dye else ''}.mtrl")
+            with open(path, 'wb') as f:
+                f.write(synthetic_mtrl.make_mtrl(variant, dye=dye, seed=1))
+            if mtrl_handler.read_mtrl_file(path) is None:
+                raise RuntimeError(f"The parser couldn't read the synthetic file {path}")
+            results.append(measure(f"read_mtrl_file[{variant}{',dye' if dye else ''}]",
+                                   lambda path=path: mtrl_handler.read_mtrl_file(path), repeat, number=200))
+
+    # A whole Meddle-like folder
+    corpus = synthetic_mtrl.write_corpus(os.path.join(work_dir, 'corpus'), corpus_size)
+    results.append(measure(f"read_mtrl_file[corpus x{len(corpus)}]",
+                           lambda: [mtrl_handler.read_mtrl_file(path) for path in corpus], repeat, items=len(corpus)))
+    results.append(measure(f"read_mtrl_file[corpus x{len(corpus)},no mmap]",
+                           lambda: [mtrl_handler.read_mtrl_file(path, use_mmap=False) for path in corpus], repeat, items=len(corpus)))
+    results.append(measure(f"peek_mtrl[corpus x{len(corpus)}]",
+                           lambda: [mtrl_handler.peek_mtrl(path) for path in corpus], repeat, items=len(corpus)))
+
+    # Cached reads, which is what dyeing the same material over and over ends up doing
+    mtrl_handler.invalidate_mtrl_cache()
+    results.append(measure(f"get_mtrl_data[corpus x{len(corpus)},warm]",
+                           lambda: [mtrl_handler.get_mtrl_data(path) for path in corpus], repeat, items=len(corpus)))
+    mtrl_handler.invalidate_mtrl_cache()
+    return results
+
+
+def bench_sqpack(work_dir: str, repeat: int, corpus_size: int) -> List[Dict]:
+    print("SqPack")
+    results = []
+    files = {}
+    for item in synthetic_mtrl.corpus_plan(corpus_size):
+        kwargs = dict(item)
+        game_path = kwargs.pop('relative_path').replace(os.sep, '/')
+        files[game_path] = synthetic_mtrl.make_mtrl(**kwargs)
+    game_dir = os.path.join(work_dir, 'game')
+    synthetic_sqpack.write_sqpack(game_dir, files)
+    game_paths = list(files)
+
+    def load_indexes():
+        sqpack.close_sqpacks()
+        sqpack.get_sqpack(game_dir).file_exists(game_paths[0])
+
+    results.append(measure("SqPack index load", load_indexes, repeat))
+    game_data = sqpack.get_sqpack(game_dir)
+    results.append(measure(f"SqPack.read_file[corpus x{len(game_paths)}]",
+                           lambda: [game_data.read_file(game_path) for game_path in game_paths], repeat, items=len(game_paths)))
+    results.append(measure(f"SqPack.read_mtrl[corpus x{len(game_paths)}]",
+                           lambda: [game_data.read_mtrl(game_path) for game_path in game_paths], repeat, items=len(game_paths)))
+    sqpack.close_sqpacks()
+    return results
+
+
+def bench_tile_matrices(repeat: int) -> List[Dict]:
+    print("Tile matrices")
+    results = []
+    results.append(measure("decompose_tile_matrix[identity]",
+                           lambda: mtrl_handler.decompose_tile_matrix(16.0, 0.0, 0.0, 16.0), repeat, number=10000))
+    results.append(measure("decompose_tile_matrix[rotated,sheared]",
+                           lambda: mtrl_handler.decompose_tile_matrix(12.5, 4.25, -3.0, 9.75), repeat, number=10000))
+
+    rng = np.random.default_rng(0)
+    for row_count in (32, 32 * 400):
+        matrices = rng.uniform(-20.0, 20.0, size=(row_count, 4))
+        matrices[::2] = (16.0, 0.0, 0.0, 16.0) # Half of them the default, like real files
+        results.append(measure(f"decompose_tile_matrices[{row_count} rows]",
+                               lambda matrices=matrices: mtrl_handler.decompose_tile_matrices(matrices),
+                               repeat, number=max(1, 3200 // row_count), items=row_count))
+    return results
+
+
+def bench_tex(repeat: int) -> List[Dict]:
+    print("Textures")
+    results = []
+    for texture_format in (tex_reader.TEX_FORMAT_A8R8G8B8, tex_reader.TEX_FORMAT_BC1, tex_reader.TEX_FORMAT_BC3,
+                           tex_reader.TEX_FORMAT_BC5, tex_reader.TEX_FORMAT_BC7):
+        format_name = tex_reader.TEX_FORMAT_NAMES[texture_format]
+        tex = synthetic_sqpack.make_tex(1024, 1024, 3, texture_format, seed=texture_format)
+        for mip_level in (0, 2):
+            size = 1024 >> mip_level
+            results.append(measure(f"decode_tex[{format_name},{size}x{size}]",
+                                   lambda tex=tex, mip_level=mip_level: tex_reader.decode_tex(tex, mip_level),
+                                   repeat, items=size * size))
+            if Image is not None:
+                # The same pixels as the PNG Meddle would have written, which is what gets loaded when the .tex isn't used
+                png_file = io.BytesIO()
+                Image.fromarray(tex_reader.decode_tex(tex, mip_level)).save(png_file, format='PNG')
+                results.append(measure(f"load_png[{format_name},{size}x{size}]",
+                                       lambda png=png_file.getvalue(): np.asarray(Image.open(io.BytesIO(png)).convert('RGBA')),
+                                       repeat, items=size * size))
+    return results
+
+
+def bench_stm(repeat: int) -> List[Dict]:
+    print("STM")
+    results = []
+    stm_utils.clear_caches() # Same as what register() does in Blender, the caches don't exist before that
+    for template_type in stm_utils.StainingTemplate:
+        path = os.path.join(ASSETS_DIR, stm_utils.PAINT_FILE_PATHS[template_type])
+        with open(path, 'rb') as f:
+            data = f.read()
+        results.append(measure(f"StainingTemplateFile[{template_type.name.lower()}]",
+                               lambda data=data, template_type=template_type: stm_utils.StainingTemplateFile(data, template_type), repeat))
+
+        stm_file = stm_utils.get_stm_cache(template_type)
+        template_ids = sorted(stm_file.entry_offsets)
+        results.append(measure(f"StainingTemplateFile.get_template[{template_type.name.lower()},first call]",
+                               lambda stm_file=stm_file, template_id=template_ids[0]: stm_file.get_template(template_id),
+                               repeat, setup=stm_file.templates.clear))
+        results.append(measure(f"StainingTemplateFile.decode_all[{template_type.name.lower()}]",
+                               stm_file.decode_all, repeat, setup=stm_file.templates.clear, items=len(template_ids)))
+        dye_ids = range(1, 128) # Every dye of the old format, which both files have
+        lookups = len(template_ids) * len(dye_ids)
+
+        def sweep(template_ids=template_ids, template_type=template_type):
+            for template_id in template_ids:
+                for dye_id in dye_ids:
+                    stm_utils.get_template_value_tuple(template_id, dye_id, template_type)
+
+        def forget_templates(template_type=template_type):
+            # Keep the parsed file, only drop the looked up values
+            stm_utils.clear_caches()
+            stm_utils.get_stm_cache(template_type)
+
+        results.append(measure(f"get_template_value_tuple[{template_type.name.lower()},cold]",
+                               sweep, repeat, setup=forget_templates, items=lookups))
+        results.append(measure(f"get_template_value_tuple[{template_type.name.lower()},warm]",
+                               sweep, repeat, items=lookups))
+
+        def palette_sweep(template_ids=template_ids, template_type=template_type):
+            for template_id in template_ids:
+                palette = stm_utils.get_palette(template_id, template_type)
+                for dye_id in dye_ids:
+                    palette[dye_id]
+
+        results.append(measure(f"get_palette[{template_type.name.lower()},cold]",
+                               palette_sweep, repeat, setup=forget_templates, items=lookups))
+        results.append(measure(f"get_palette[{template_type.name.lower()},warm]",
+                               palette_sweep, repeat, items=lookups))
+    stm_utils.clear_caches()
+    return results
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# OUTPUT
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def compare(results: List[Dict], baseline_path: str) -> None:
+    """Prints how every benchmark changed against an older JSON file. Below 1.00x is faster."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+    print(f"\nCompared to {baseline_path} (median time, peak memory)")
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            print(f"  {result['name']:<52} new")
+            continue
+        time_ratio = result['median_s'] / old['median_s'] if old['median_s'] else float('inf')
+        memory_ratio = result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else float('inf')
+        print(f"  {result['name']:<52} {time_ratio:>6.2f}x  {memory_ratio:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FFGear's MTRL and STM parsers")
+    parser.add_argument('--json', metavar='PATH', help="Write the results to this file")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against the results of an earlier run")
+    parser.add_argument('--quick', action='store_true', help="Fewer rounds and a smaller corpus, for a quick sanity check")
+    parser.add_argument('--repeat', type=int, help="Timed rounds per benchmark")
+    parser.add_argument('--corpus-size', type=int, help="Number of .mtrl files in the synthetic corpus")
+    parser.add_argument('--verbose', action='store_true', help="Show the add-on's warnings (the synthetic files trigger a lot of harmless ones)")
+    parser.add_argument('--only', choices=('mtrl', 'sqpack', 'tile', 'tex', 'stm'), action='append', help="Only run these groups (can be given more than once)")
+    args = parser.parse_args()
+
+    repeat = args.repeat or (3 if args.quick else 15)
+    corpus_size = args.corpus_size or (50 if args.quick else 400)
+    groups = args.only or ['mtrl', 'sqpack', 'tile', 'tex', 'stm']
+    if not args.verbose:
+        logging.disable(logging.WARNING) # Errors still show up
+        warnings.simplefilter('ignore', RuntimeWarning) # numpy complaining about NaNs in the random colorset values
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ffgear_bench_') as work_dir:
+        if 'mtrl' in groups:
+            results += bench_mtrl(work_dir, repeat, corpus_size)
+        if 'sqpack' in groups:
+            results += bench_sqpack(work_dir, repeat, corpus_size)
+        if 'tile' in groups:
+            results += bench_tile_matrices(repeat)
+        if 'tex' in groups:
+            results += bench_tex(repeat)
+        if 'stm' in groups:
+            results += bench_stm(repeat)
+
+    output = {
+        'schema': SCHEMA_VERSION,
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'corpus_size': corpus_size,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import os
+import sys
+import gc
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _ffgear import ASSETS_DIR
+from bench_parsers import measure, compare, stm_utils, _format_bytes, SCHEMA_VERSION
+
+##### WHAT THIS IS #####
+# Closer look at stm_utils than the stm group of bench_parsers.py: timings of the individual lookups dyeing goes through,
+# and how much memory (traced bytes and Python objects) a loaded STM file keeps alive.
+# The object counts are what catches a parser going back to an object per value, the timings catch per-call overhead
+# like building debug messages nobody sees.
+#
+#   python benchmarks/bench_stm.py --json before.json
+#   ...change things...
+#   python benchmarks/bench_stm.py --json after.json --compare before.json
+########################
+
+ROW_COUNT = 32 # Rows in a Dawntrail colorset
+DYE_CHANNELS = {1: '12', 2: '40'} # What a material's two dye channels are set to
+DYEABLE_PROPERTIES = list(stm_utils.DYE_PROPERTY_FLAG_BITS)
+ALL_DYE_FLAGS = sum(stm_utils.DYE_PROPERTY_FLAG_BITS.values())
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# MEMORY ACCOUNTING
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def count_objects(root: object) -> Tuple[int, Counter]:
+    """
+    Counts every Python object reachable from root (the object itself included), like a parsed STM file.
+    Modules, classes and functions are skipped so the count stays about the data.
+
+    Returns:
+        tuple: (number of objects, Counter of type name -> count)
+    """
+    skip_types = (type, type(os), type(count_objects))
+    seen = set()
+    by_type = Counter()
+    pending = [root]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, skip_types):
+            continue
+        seen.add(id(obj))
+        by_type[type(obj).__name__] += 1
+        pending.extend(gc.get_referents(obj))
+    return len(seen), by_type
+
+
+def measure_retained(name: str, load) -> Dict:
+    """
+    Calls load and records how many traced bytes and objects its result keeps alive afterwards
+    (unlike measure, which records the peak while it runs).
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        loaded = load()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    object_count, by_type = count_objects(loaded)
+    result = {
+        'name': name,
+        'retained_bytes': after - before,
+        'objects': object_count,
+        'objects_by_type': dict(by_type.most_common(5)),
+    }
+    top_types = ", ".join(f"{type_name} {count}" for type_name, count in by_type.most_common(3))
+    print(f"  {name:<52} retained {_format_bytes(result['retained_bytes']):>9}  objects {object_count:>7}  ({top_types})")
+    return result
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# BENCHMARKS
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def make_material_rows(template_ids: List[int]) -> List[Dict]:
+    """dye_info of every row of a fully dyeable 32 row material, like mtrl_handler gives back (cycling through template_ids)"""
+    return [{'template': template_ids[row % len(template_ids)], 'channel': 1 + row % 2, 'flags': ALL_DYE_FLAGS}
+            for row in range(ROW_COUNT)]
+
+
+def bench_lookups(repeat: int) -> List[Dict]:
+    print("Lookups")
+    results = []
+    stm_utils.clear_caches() # Same as what register() does in Blender, the caches don't exist before that
+    for template_type in stm_utils.StainingTemplate:
+        type_name = template_type.name.lower()
+        path = os.path.join(ASSETS_DIR, stm_utils.PAINT_FILE_PATHS[template_type])
+        with open(path, 'rb') as f:
+            data = f.read()
+        results.append(measure(f"StainingTemplateFile[{type_name}]",
+                               lambda data=data, template_type=template_type: stm_utils.StainingTemplateFile(data, template_type), repeat, number=20))
+
+        stm_file = stm_utils.get_stm_cache(template_type)
+        template_ids = sorted(stm_file.entry_offsets)
+        template_id = template_ids[len(template_ids) // 2]
+        results.append(measure(f"get_template[{type_name},miss]",
+                               lambda stm_file=stm_file, template_id=template_id: stm_file.get_template(template_id),
+                               repeat, setup=stm_file.templates.clear))
+        results.append(measure(f"get_template[{type_name},hit]",
+                               lambda stm_file=stm_file, template_id=template_id: stm_file.get_template(template_id), repeat, number=10000))
+
+        template = stm_file.get_template(template_id)
+        property_count = len(stm_file.get_entry_names())
+        results.append(measure(f"StainingTemplateEntry.get_data[{type_name}]",
+                               lambda template=template: [template.get_data(offset, 12) for offset in range(property_count)],
+                               repeat, number=1000, items=property_count))
+
+        # Every dye of a handful of templates through the dict API, first with nothing looked up yet and then again
+        sweep_ids = template_ids[:8]
+        dye_ids = range(1, 128)
+
+        def sweep(template_type=template_type, sweep_ids=sweep_ids):
+            for sweep_id in sweep_ids:
+                for dye_id in dye_ids:
+                    stm_utils.get_template_values(sweep_id, dye_id, template_type)
+
+        def forget_values(template_type=template_type):
+            stm_utils.clear_template_cache()
+            stm_utils.get_stm_cache(template_type).templates.clear()
+
+        lookups = len(sweep_ids) * len(dye_ids)
+        results.append(measure(f"get_template_values[{type_name},cold]", sweep, repeat, setup=forget_values, items=lookups))
+        results.append(measure(f"get_template_values[{type_name},warm]", sweep, repeat, items=lookups))
+
+        # What dyeing a whole material costs: every row, property and dye channel through get_modified_value
+        # (how ramp updates looked dyes up before resolve_dyes), then the same material in one resolve_dyes call
+        rows = make_material_rows(template_ids[:ROW_COUNT])
+        for row in rows:
+            row['template_type'] = template_type
+
+        def dye_material(rows=rows):
+            for row in rows:
+                for property_name in DYEABLE_PROPERTIES:
+                    for channel_num, dye_id in DYE_CHANNELS.items():
+                        if stm_utils.should_apply_dye(row, property_name, channel_num):
+                            stm_utils.get_modified_value(row, property_name, dye_id)
+
+        def resolve_material(rows=rows, template_type=template_type):
+            resolved = stm_utils.resolve_dyes([row['template'] for row in rows], [row['channel'] for row in rows],
+                                              DYE_CHANNELS, template_type, [row['flags'] for row in rows])
+            return [resolved.get_row(row) for row in range(len(rows))]
+
+        results.append(measure(f"get_modified_value[{type_name},{ROW_COUNT} rows]", dye_material, repeat, number=20, items=ROW_COUNT))
+        results.append(measure(f"resolve_dyes[{type_name},{ROW_COUNT} rows]", resolve_material, repeat, number=20, items=ROW_COUNT))
+    stm_utils.clear_caches()
+    return results
+
+
+def bench_memory() -> List[Dict]:
+    print("Memory held by a loaded STM file")
+    results = []
+    for template_type in stm_utils.StainingTemplate:
+        type_name = template_type.name.lower()
+
+        def load(template_type=template_type):
+            stm_utils.clear_caches()
+            return stm_utils.get_stm_cache(template_type)
+
+        def load_decoded(template_type=template_type):
+            stm_file = load(template_type)
+            stm_file.decode_all()
+            return stm_file
+
+        def load_palettes(template_type=template_type):
+            stm_file = load(template_type)
+            for template_id in stm_file.entry_offsets:
+                stm_file.get_palette(template_id)
+            return stm_file
+
+        results.append(measure_retained(f"get_stm_cache[{type_name}]", load))
+        results.append(measure_retained(f"get_stm_cache[{type_name},every template]", load_decoded))
+        results.append(measure_retained(f"get_stm_cache[{type_name},every palette]", load_palettes))
+    stm_utils.clear_caches()
+    return results
+
+
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+# OUTPUT
+#¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤¤#
+
+def compare_memory(memory: List[Dict], baseline_path: str) -> None:
+    """Prints how the retained bytes and object counts changed against an older JSON file. Below 1.00x is smaller."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result['name']: result for result in json.load(f).get('memory', [])}
+    print(f"\nCompared to {baseline_path} (retained memory, objects)")
+    for result in memory:
+        old = baseline.get(result['name'])
+        if old is None:
+            print(f"  {result['name']:<52} new")
+            continue
+        bytes_ratio = result['retained_bytes'] / old['retained_bytes'] if old['retained_bytes'] else float('inf')
+        objects_ratio = result['objects'] / old['objects'] if old['objects'] else float('inf')
+        print(f"  {result['name']:<52} {bytes_ratio:>6.2f}x  {objects_ratio:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FFGear's STM (dye template) lookups and memory use")
+    parser.add_argument('--json', metavar='PATH', help="Write the results to this file")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against the results of an earlier run")
+    parser.add_argument('--quick', action='store_true', help="Fewer rounds, for a quick sanity check")
+    parser.add_argument('--repeat', type=int, help="Timed rounds per benchmark")
+    parser.add_argument('--verbose', action='store_true', help="Show the add-on's warnings")
+    args = parser.parse_args()
+
+    repeat = args.repeat or (3 if args.quick else 15)
+    if not args.verbose:
+        logging.disable(logging.WARNING) # Errors still show up
+
+    results = bench_lookups(repeat)
+    memory = bench_memory()
+
+    output = {
+        'schema': SCHEMA_VERSION,
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+        },
+        'results': results,
+        'memory': memory,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.compare:
+        compare(results, args.compare)
+        compare_memory(memory, args.compare)
+
+
+if __name__ == '__main__':
+    main()
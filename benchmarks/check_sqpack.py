@@ -0,0 +1,80 @@
+import os
+import sys
+import logging
+import argparse
+import tempfile
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _ffgear import load
+import synthetic_mtrl
+import synthetic_sqpack
+
+sqpack = load('sqpack')
+
+##### WHAT THIS IS #####
+# Checks that files come back out of FFGear/sqpack.py byte for byte the way synthetic_sqpack.py put them in.
+# Covers standard files (one block and several), textures, an expansion folder, uncompressed blocks and paths stored through the synonym tables.
+# Not a benchmark, bench_parsers.py times the reads. Exits with 1 if anything doesn't match.
+########################
+
+
+def make_files() -> Dict[str, bytes]:
+    """Game path -> contents, a bit of everything the reader has to handle"""
+    big_mtrl = synthetic_mtrl.make_mtrl('dawntrail', seed=1)
+    return {
+        "chara/equipment/e0737/material/v0001/mt_c0201e0737_dwn_a.mtrl": synthetic_mtrl.make_mtrl('dawntrail'),
+        "chara/equipment/e0737/material/v0001/mt_c0201e0737_top_a.mtrl": synthetic_mtrl.make_mtrl('endwalker', seed=2),
+        "chara/equipment/e0737/material/v0001/mt_c0201e0737_top_b.mtrl": synthetic_mtrl.make_mtrl('legacy', dye=False, seed=3),
+        "chara/common/texture/big_standard_file.bin": big_mtrl * (50000 // len(big_mtrl) + 1), # More than one 16000 byte block
+        "chara/equipment/e0737/texture/v01_c0201e0737_dwn_id.tex": synthetic_sqpack.make_tex(),
+        "chara/equipment/e0737/texture/v01_c0201e0737_dwn_n.tex": synthetic_sqpack.make_tex(512, 512, 5, texture_format=0x6432, seed=4),
+        "bg/ex1/01_roc_r2/twn/r2t1/texture/r2t1_b0_wall1_d.tex": synthetic_sqpack.make_tex(128, 64, 3, texture_format=0x3420, seed=5),
+    }
+
+
+def check(game_dir: str, files: Dict[str, bytes], compress: bool, synonym_paths: List[str]) -> List[str]:
+    """Writes files into a fake game install and reads every one of them back. Returns what went wrong"""
+    synthetic_sqpack.write_sqpack(game_dir, files, compress=compress, synonym_paths=synonym_paths)
+    problems = []
+    game_data = sqpack.get_sqpack(game_dir)
+    try:
+        for game_path, data in files.items():
+            read = game_data.read_file(game_path)
+            if read is None:
+                problems.append(f"{game_path}: not found")
+            elif read != data:
+                problems.append(f"{game_path}: came back different ({len(read)} bytes, expected {len(data)})")
+            elif game_path.endswith('.mtrl') and game_data.read_mtrl(game_path) is None:
+                problems.append(f"{game_path}: read_mtrl failed")
+        missing_path = "chara/equipment/e0737/material/v0001/mt_c0201e0737_missing.mtrl"
+        if game_data.file_exists(missing_path) or game_data.read_file(missing_path) is not None:
+            problems.append(f"{missing_path}: found a file that was never written")
+    finally:
+        sqpack.close_sqpacks()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that FFGear/sqpack.py reads back what synthetic_sqpack.py writes")
+    parser.add_argument('--verbose', action='store_true', help="Show the add-on's warnings")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.WARNING) # Errors still show up
+
+    files = make_files()
+    synonym_paths = [path for path in files if path.endswith(('_top_a.mtrl', '_dwn_n.tex'))]
+    failed = False
+    with tempfile.TemporaryDirectory(prefix='ffgear_check_sqpack_') as work_dir:
+        for name, compress, synonyms in (("compressed", True, []), ("uncompressed", False, []),
+                                         ("synonyms", True, synonym_paths), ("uncompressed synonyms", False, synonym_paths)):
+            problems = check(os.path.join(work_dir, name.replace(' ', '_')), files, compress, synonyms)
+            print(f"{name:<24} {len(files)} files, {'ok' if not problems else f'{len(problems)} problems'}")
+            for problem in problems:
+                print(f"  {problem}")
+            failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import os
+import struct
+import random
+import argparse
+import numpy as np
+from typing import List, Optional, Sequence
+
+##### WHAT THIS IS #####
+# Generates fake but structurally valid .mtrl files for the benchmarks, so they don't need game files or a Meddle export.
+# Four kinds of materials can be made:
+#   endwalker  - character.shpk with a 16 row colorset (16 half-floats per row, 2 dye bytes per row)
+#   dawntrail  - character.shpk with a 32 row colorset (32 half-floats per row, 4 dye bytes per row)
+#   legacy     - characterlegacy.shpk, which always comes with an Endwalker style colorset
+#   any of them with or without the dye block after the colorset
+# Everything is seeded, so the same seed always gives byte-identical files.
+########################
+
+MTRL_SIGNATURE = 16973824
+VARIANTS = ('endwalker', 'dawntrail', 'legacy')
+
+# Real template IDs from the bundled .dyes files, so the dye benchmarks actually hit templates
+ENDWALKER_TEMPLATE_IDS = (100, 101, 200, 201, 202, 210, 211, 212, 220, 221)
+DAWNTRAIL_TEMPLATE_IDS = (1100, 1101, 1200, 1201, 1202, 1210, 1211, 1212, 1220, 1221)
+
+# Which bits of the Dawntrail dye flags short can be set (see DYE_FLAGS in mtrl_handler)
+DAWNTRAIL_DYE_FLAG_MASK = 0x0FFF
+
+SLOTS = ('top', 'dwn', 'glv', 'sho', 'met')
+
+
+def _texture_paths(variant: str, model_id: int, slot: str) -> List[str]:
+    """Game paths like the ones Meddle materials reference. Legacy materials still have a specular map."""
+    folder = f"chara/equipment/e{model_id:04d}/texture"
+    base = f"v01_c0101e{model_id:04d}_{slot}"
+    if variant == 'legacy':
+        return [f"{folder}/{base}_n.tex", f"{folder}/{base}_s.tex", f"{folder}/{base}_m.tex"]
+    return [f"{folder}/{base}_id.tex", f"{folder}/{base}_n.tex", f"{folder}/{base}_m.tex"]
+
+
+def _colorset_halves(rng: random.Random, row_count: int, row_halves: int, identity_fraction: float) -> bytes:
+    values = np.array([[rng.uniform(-2.0, 30.0) for _ in range(row_halves)] for _ in range(row_count)], dtype='<f2')
+    if row_halves == 32:
+        for row in range(row_count):
+            # Most real rows have the default tile matrix, which the parser has a fast path for
+            if rng.random() < identity_fraction:
+                values[row, 28:32] = (16.0, 0.0, 0.0, 16.0)
+            values[row, 25] = rng.randint(0, 63) / 64 # Tile index
+    return values.tobytes()
+
+
+def _dye_block(rng: random.Random, variant: str, row_count: int, template_ids: Sequence[int]) -> bytes:
+    dye = bytearray()
+    for _ in range(row_count):
+        template_id = rng.choice(template_ids) if rng.random() < 0.75 else 0
+        if variant == 'dawntrail':
+            # Flag bits, then the template ID with the channel in bits 11-12
+            flags = rng.randint(0, DAWNTRAIL_DYE_FLAG_MASK) if template_id else 0
+            channel = rng.randint(0, 1)
+            dye += struct.pack('<HH', flags, template_id | (channel << 11))
+        else:
+            # Template ID in the top 11 bits, flags in the bottom 5
+            flags = rng.randint(0, 0x1F) if template_id else 0
+            dye += struct.pack('<H', (template_id << 5) | flags)
+    return bytes(dye)
+
+
+def make_mtrl(variant: str = 'dawntrail', dye: bool = True, seed: int = 0, model_id: Optional[int] = None,
+              slot: Optional[str] = None, material_flags: int = 0x11, additional_data_size: int = 4,
+              identity_fraction: float = 0.5, template_ids: Optional[Sequence[int]] = None) -> bytes:
+    """
+    Builds the bytes of one synthetic .mtrl file.
+
+    Args:
+        variant (str): 'endwalker', 'dawntrail' or 'legacy'.
+        dye (bool): Whether to add the dye block after the colorset.
+        seed (int): Seed for every random value in the file.
+        model_id (int, optional): Equipment ID used in the texture paths. Random if not given.
+        slot (str, optional): Equipment slot used in the texture paths. Random if not given.
+        material_flags (int): The material flags value (0x10 is translucency, 0x1 hides backfaces).
+        additional_data_size (int): Size of the additional data block between the strings and the colorset.
+        identity_fraction (float): How many colorset rows get the default tile matrix (Dawntrail only).
+        template_ids (list of int, optional): Template IDs to pick from for the dye block.
+
+    Returns:
+        bytes: The whole file.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+    rng = random.Random(seed)
+    model_id = model_id if model_id is not None else rng.randint(1, 9999)
+    slot = slot or rng.choice(SLOTS)
+    dawntrail = variant == 'dawntrail'
+    if template_ids is None:
+        template_ids = DAWNTRAIL_TEMPLATE_IDS if dawntrail else ENDWALKER_TEMPLATE_IDS
+
+    # STRINGS (texture paths, then the shader name, padded to 4 bytes)
+    textures = _texture_paths(variant, model_id, slot)
+    shader_name = 'characterlegacy.shpk' if variant == 'legacy' else 'character.shpk'
+    strings = bytearray()
+    texture_offsets = []
+    for path in textures:
+        texture_offsets.append(len(strings))
+        strings += path.encode('utf-8') + b'\0'
+    shader_name_offset = len(strings)
+    strings += shader_name.encode('utf-8') + b'\0'
+    while len(strings) % 4:
+        strings += b'\0'
+
+    # COLORSET
+    row_count, row_halves = (32, 32) if dawntrail else (16, 16)
+    colorset = _colorset_halves(rng, row_count, row_halves, identity_fraction)
+    if dye:
+        colorset += _dye_block(rng, variant, row_count, template_ids)
+
+    # SHADER DATA (counts, material flags, then keys, constants, samplers and values)
+    # Never parsed by FFGear, but real files always have it, so every read the parser does past the colorset stays inside the file like it would with a real one
+    key_count, constant_count, sampler_count = 6, 14, 5
+    value_list = np.array([rng.uniform(0.0, 1.0) for _ in range(96)], dtype='<f4').tobytes()
+    shader_data = struct.pack('<HHH', len(value_list), key_count, constant_count)
+    shader_data += struct.pack('<I', material_flags)
+    shader_data += struct.pack('<H', sampler_count) + b'\0' * 2
+    shader_data += b'\0' * (key_count * 8 + constant_count * 8 + sampler_count * 12)
+    shader_data += value_list
+
+    body = bytearray()
+    for offset in texture_offsets:
+        body += struct.pack('<HH', offset, 0x8000)
+    body += b'\0' * 4 # One colorset info entry
+    body += strings
+    body += b'\xAB' * additional_data_size
+    body += colorset
+    body += shader_data
+
+    header = struct.pack('<IHHHHBBBB', MTRL_SIGNATURE, 0, len(colorset), len(strings), shader_name_offset,
+                         len(textures), 0, 1, additional_data_size)
+    data = header + bytes(body)
+    return data[:4] + struct.pack('<H', len(data) & 0xFFFF) + data[6:] # Fill in the file size
+
+
+def corpus_plan(count: int, seed: int = 0) -> List[dict]:
+    """
+    The list of materials write_corpus() makes, as keyword arguments for make_mtrl() plus a relative path.
+    Mix is roughly what a Dawntrail era Meddle export looks like: mostly Dawntrail materials, some Endwalker and legacy ones, about half of them dyeable.
+    """
+    rng = random.Random(seed)
+    plan = []
+    for i in range(count):
+        roll = rng.random()
+        variant = 'dawntrail' if roll < 0.6 else 'endwalker' if roll < 0.8 else 'legacy'
+        model_id = rng.randint(1, 9999)
+        slot = rng.choice(SLOTS)
+        relative_path = os.path.join('chara', 'equipment', f"e{model_id:04d}", 'material', f"v{i + 1:04d}", f"mt_c0101e{model_id:04d}_{slot}_a.mtrl")
+        plan.append({
+            'relative_path': relative_path,
+            'variant': variant,
+            'dye': rng.random() < 0.5,
+            'seed': seed * 1000003 + i,
+            'model_id': model_id,
+            'slot': slot,
+            'material_flags': rng.choice((0x0, 0x1, 0x10, 0x11)),
+        })
+    return plan
+
+
+def write_corpus(directory: str, count: int = 200, seed: int = 0) -> List[str]:
+    """
+    Writes a folder of synthetic .mtrl files laid out like a Meddle cache (chara/equipment/eXXXX/material/vXXXX/*.mtrl).
+
+    Returns:
+        list of str: Paths of the written files, in the same order as corpus_plan().
+    """
+    paths = []
+    for item in corpus_plan(count, seed):
+        kwargs = dict(item)
+        path = os.path.join(directory, kwargs.pop('relative_path'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(make_mtrl(**kwargs))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a folder of synthetic .mtrl files")
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = write_corpus(args.directory, args.count, args.seed)
+    print(f"Wrote {len(paths)} files to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+import re
+import zlib
+import struct
+from typing import Dict, Iterable, List, Tuple
+
+##### WHAT THIS IS #####
+# Writes small but structurally valid SqPack archives (.index, .index2 and .dat0) out of a dict of {game path: bytes},
+# so FFGear/sqpack.py can be checked and benchmarked without the game installed.
+# Same layout the game uses: sorted hash tables, 128 byte aligned entries, files cut into raw deflate blocks of at most 16000 bytes,
+# and .tex files stored as textures (header as is, then every mip level as its own run of blocks).
+########################
+
+SQPACK_MAGIC = b'SqPack\0\0'
+HEADER_SIZE = 0x400
+ALIGNMENT = 0x80
+BLOCK_SIZE = 16000
+UNCOMPRESSED_BLOCK_MARKER = 32000
+TEX_HEADER_SIZE = 80
+TEX_BLOCK_SIZES = {0x3420: 8, 0x3431: 16, 0x6120: 8, 0x6230: 16, 0x6432: 16} # BC1, BC3, BC4, BC5, BC7
+
+CATEGORY_IDS = {'common': 0x00, 'bgcommon': 0x01, 'bg': 0x02, 'cut': 0x03, 'chara': 0x04, 'shader': 0x05, 'ui': 0x06,
+                'sound': 0x07, 'vfx': 0x08, 'ui_script': 0x09, 'exd': 0x0A, 'game_script': 0x0B, 'music': 0x0C}
+
+
+def _crc(text: str) -> int:
+    return zlib.crc32(text.lower().encode('utf-8')) ^ 0xFFFFFFFF
+
+
+def _index1_hash(path: str) -> int:
+    folder, _, file_name = path.lower().rpartition('/')
+    return (_crc(folder) << 32) | _crc(file_name)
+
+
+def _index2_hash(path: str) -> int:
+    return _crc(path.lower())
+
+
+def _pad(data: bytearray, alignment: int = ALIGNMENT) -> bytearray:
+    data += b'\0' * (-len(data) % alignment)
+    return data
+
+
+def _sqpack_header(file_type: int) -> bytearray:
+    header = bytearray(HEADER_SIZE)
+    header[0:8] = SQPACK_MAGIC
+    struct.pack_into('<III', header, 0x0C, HEADER_SIZE, 1, file_type)
+    return header
+
+
+def _block(data: bytes, compress: bool) -> bytes:
+    """One data block: 16 byte header, then the (maybe) deflated data, padded to 128 bytes"""
+    payload = data
+    compressed_size = UNCOMPRESSED_BLOCK_MARKER
+    if compress:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15) # Raw deflate
+        deflated = compressor.compress(data) + compressor.flush()
+        if len(deflated) < len(data):
+            payload = deflated
+            compressed_size = len(deflated)
+    block = bytearray(struct.pack('<IIII', 16, 0, compressed_size, len(data)))
+    block += payload
+    return bytes(_pad(block))
+
+
+def _split(data: bytes) -> List[bytes]:
+    return [data[i:i + BLOCK_SIZE] for i in range(0, len(data), BLOCK_SIZE)] or [b'']
+
+
+def _standard_entry(data: bytes, compress: bool) -> bytes:
+    blocks = [_block(chunk, compress) for chunk in _split(data)]
+    header = bytearray(struct.pack('<IIIIII', 0, 2, len(data), 0, 0, len(blocks)))
+    offset = 0
+    for chunk, block in zip(_split(data), blocks):
+        header += struct.pack('<IHH', offset, len(block), len(chunk))
+        offset += len(block)
+    _pad(header)
+    struct.pack_into('<I', header, 0, len(header))
+    return bytes(header) + b''.join(blocks)
+
+
+def _mip_ranges(tex: bytes) -> List[Tuple[int, int]]:
+    """Byte ranges of every mip level, from the offsets in the .tex header"""
+    offsets = [offset for offset in struct.unpack_from('<13I', tex, 0x1C) if TEX_HEADER_SIZE <= offset < len(tex)]
+    offsets = sorted(set(offsets)) or [TEX_HEADER_SIZE]
+    return [(start, end) for start, end in zip(offsets, offsets[1:] + [len(tex)])]
+
+
+def _texture_entry(tex: bytes, compress: bool) -> bytes:
+    lods = []
+    block_sizes = []
+    body = bytearray(tex[:TEX_HEADER_SIZE])
+    for start, end in _mip_ranges(tex):
+        chunks = _split(tex[start:end])
+        blocks = [_block(chunk, compress) for chunk in chunks]
+        lods.append((len(body), sum(len(block) for block in blocks), end - start, len(block_sizes), len(blocks)))
+        block_sizes += [len(block) for block in blocks]
+        for block in blocks:
+            body += block
+
+    header = bytearray(struct.pack('<IIIIII', 0, 4, len(tex), 0, 0, len(lods)))
+    for lod in lods:
+        header += struct.pack('<IIIII', *lod)
+    header += struct.pack(f'<{len(block_sizes)}H', *block_sizes)
+    _pad(header)
+    struct.pack_into('<I', header, 0, len(header))
+    return bytes(header) + bytes(body)
+
+
+def _index_file(entries: List[Tuple[int, int]], entry_format: str, synonyms: List[Tuple[int, int, str]]) -> bytes:
+    """entries are (hash, data) pairs, synonyms are (hash, data, path)"""
+    data = _sqpack_header(2)
+    index_header = bytearray(HEADER_SIZE)
+    table = b''.join(struct.pack(entry_format, *entry) for entry in sorted(entries))
+    synonym_table = bytearray()
+    for number, (path_hash, entry_data, path) in enumerate(sorted(synonyms)):
+        entry = bytearray(struct.pack('<QII', path_hash, entry_data, number)) + path.encode('utf-8')
+        entry += b'\0' * (0x100 - len(entry))
+        synonym_table += entry
+    table_offset = len(data) + HEADER_SIZE
+    struct.pack_into('<IIII', index_header, 0, HEADER_SIZE, 1, table_offset, len(table))
+    struct.pack_into('<III', index_header, 0x50, 1, table_offset + len(table), len(synonym_table))
+    return bytes(data + index_header) + table + bytes(synonym_table)
+
+
+def write_sqpack(directory: str, files: Dict[str, bytes], compress: bool = True, synonym_paths: Iterable[str] = ()) -> List[str]:
+    """
+    Writes a fake game install: directory/sqpack/ffxiv/CC0000.win32.index, .index2 and .dat0 for every category used
+    (sqpack/exN/CC0N00.win32.* for paths like "bg/ex1/...").
+
+    Args:
+        directory (str): The "game" folder to write into.
+        files (dict): Game path -> file contents. Paths ending in .tex are stored as textures, everything else as standard files.
+        compress (bool): Deflate the blocks. Without it every block is stored with the "uncompressed" marker.
+        synonym_paths (Iterable[str]): Paths to store through the synonym table instead of directly, to check that it's read.
+
+    Returns:
+        list of str: Paths of the written files.
+    """
+    synonym_paths = {path.lower() for path in synonym_paths}
+    by_category: Dict[Tuple[int, int], Dict[str, bytes]] = {}
+    for game_path, data in files.items():
+        game_path = game_path.replace('\\', '/').strip('/').lower()
+        parts = game_path.split('/')
+        expansion = int(parts[1][2:]) if len(parts) > 2 and re.fullmatch(r'ex\d+', parts[1]) else 0
+        by_category.setdefault((CATEGORY_IDS[parts[0]], expansion), {})[game_path] = data
+
+    written = []
+    for (category, expansion), category_files in sorted(by_category.items()):
+        repository = os.path.join(directory, 'sqpack', 'ffxiv' if expansion == 0 else f'ex{expansion}')
+        os.makedirs(repository, exist_ok=True)
+        dat = _sqpack_header(1) + bytearray(HEADER_SIZE) # SqPack header, then the data header
+        index1_entries, index2_entries = [], []
+        index1_synonyms, index2_synonyms = [], []
+        for game_path, data in category_files.items():
+            entry_offset = len(dat)
+            dat += _texture_entry(data, compress) if game_path.endswith('.tex') else _standard_entry(data, compress)
+            _pad(dat)
+            entry_data = (entry_offset // 8) & ~0xF # Dat file 0
+            if game_path in synonym_paths:
+                index1_entries.append((_index1_hash(game_path), entry_data | 1, 0))
+                index2_entries.append((_index2_hash(game_path), entry_data | 1))
+                index1_synonyms.append((_index1_hash(game_path), entry_data, game_path))
+                index2_synonyms.append((_index2_hash(game_path), entry_data, game_path))
+            else:
+                index1_entries.append((_index1_hash(game_path), entry_data, 0))
+                index2_entries.append((_index2_hash(game_path), entry_data))
+
+        stem = os.path.join(repository, f"{category:02x}{expansion:02x}00.win32")
+        outputs = {
+            f"{stem}.dat0": bytes(dat),
+            f"{stem}.index": _index_file(index1_entries, '<QII', index1_synonyms),
+            f"{stem}.index2": _index_file(index2_entries, '<II', index2_synonyms),
+        }
+        for path, data in outputs.items():
+            with open(path, 'wb') as f:
+                f.write(data)
+            written.append(path)
+    return written
+
+
+def make_tex(width: int = 256, height: int = 256, mip_count: int = 4, texture_format: int = 0x1450, seed: int = 0) -> bytes:
+    """
+    A .tex file full of random bytes, with a valid header and mip offsets. The pixels are noise.
+    The default format is A8R8G8B8 (4 bytes per pixel), the BCn formats in TEX_BLOCK_SIZES get the right amount of 4x4 blocks instead.
+    """
+    import random
+    rng = random.Random(seed)
+    header = bytearray(TEX_HEADER_SIZE)
+    struct.pack_into('<IIHHHBB', header, 0, 0x00800000, texture_format, width, height, 1, mip_count, 0)
+    offsets = []
+    offset = TEX_HEADER_SIZE
+    mips = bytearray()
+    for level in range(mip_count):
+        offsets.append(offset)
+        mip_width, mip_height = max(1, width >> level), max(1, height >> level)
+        if texture_format in TEX_BLOCK_SIZES:
+            size = ((mip_width + 3) // 4) * ((mip_height + 3) // 4) * TEX_BLOCK_SIZES[texture_format]
+        else:
+            size = mip_width * mip_height * 4
+        mips += rng.randbytes(size)
+        offset += size
+    struct.pack_into(f'<{len(offsets)}I', header, 0x1C, *offsets)
+    return bytes(header) + bytes(mips)